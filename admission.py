@@ -0,0 +1,152 @@
+"""Admission control for answer pipelines: max in-flight, bounded wait queue, per-session fairness."""
+import asyncio
+import contextlib
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Optional
+
+from config import settings
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be queued (status 503: queue full, 429: session over its share)."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+_anon_ids = itertools.count(1)
+
+
+class Ticket:
+    __slots__ = ("key", "enqueued_at", "admitted_at", "released", "_event")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._event = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    def queued_s(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class AdmissionController:
+    """Caps concurrent pipelines. Waiters are queued per session and admitted round-robin across
+    sessions, so one chatty session_id cannot starve the others."""
+
+    def __init__(self, max_in_flight: int, max_queue: int, max_queue_per_session: int):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.max_queue_per_session = max_queue_per_session
+        self._in_flight = 0
+        self._queued = 0
+        # session key → waiting tickets; dict order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_session": 0, "queue_timeouts": 0}
+
+    def enqueue(self, session_id: Optional[str]) -> Ticket:
+        """Admit now if capacity allows, else queue. Raises AdmissionRejected when queueing is not possible."""
+        ticket = Ticket(session_id or f"anon:{next(_anon_ids)}")
+        if self._in_flight < self.max_in_flight and not self._queued:
+            self._admit(ticket)
+            return ticket
+        if self._queued >= self.max_queue:
+            self._stats["rejected_full"] += 1
+            raise AdmissionRejected(503, "Server busy: request queue is full")
+        queue = self._queues.get(ticket.key)
+        if queue is not None and len(queue) >= self.max_queue_per_session:
+            self._stats["rejected_session"] += 1
+            raise AdmissionRejected(429, "Too many concurrent requests for this session")
+        if queue is None:
+            queue = self._queues[ticket.key] = deque()
+        queue.append(ticket)
+        self._queued += 1
+        self._stats["queued"] += 1
+        return ticket
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted_at = time.monotonic()
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        ticket._event.set()
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self.max_in_flight and self._queues:
+            key, queue = self._queues.popitem(last=False)
+            ticket = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues[key] = queue  # back of the round-robin
+            self._admit(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot (admitted) or leave the queue (still waiting). Idempotent."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self._in_flight -= 1
+        else:
+            queue = self._queues.get(ticket.key)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.key]
+        self._dispatch()
+
+    def position(self, ticket: Ticket) -> int:
+        """Approximate 1-based queue position (waiters enqueued earlier, plus one)."""
+        return 1 + sum(1 for q in self._queues.values() for t in q if t.enqueued_at < ticket.enqueued_at)
+
+    async def wait(self, ticket: Ticket, timeout: Optional[float]) -> bool:
+        """Wait up to timeout for admission; True once admitted."""
+        if ticket.admitted:
+            return True
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(ticket._event.wait(), timeout=timeout)
+        return ticket.admitted
+
+    async def wait_events(self, ticket: Ticket) -> AsyncIterator[dict]:
+        """Wait for admission, yielding queued state events every ADMISSION_QUEUE_EVENT_S.
+        Raises AdmissionRejected(503) after ADMISSION_QUEUE_TIMEOUT_S."""
+        while not await self.wait(ticket, settings.admission_queue_event_s):
+            if ticket.queued_s() >= settings.admission_queue_timeout_s:
+                self._stats["queue_timeouts"] += 1
+                self.release(ticket)
+                raise AdmissionRejected(503, "Server busy: timed out waiting in queue")
+            yield {
+                "type": "state",
+                "phase": "queued",
+                "message": "Waiting for capacity...",
+                "position": self.position(ticket),
+                "queued_s": round(ticket.queued_s(), 3),
+            }
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued_now": self._queued,
+            "max_queue": self.max_queue,
+            "sessions_waiting": len(self._queues),
+        })
+        return stats
+
+
+admission = AdmissionController(
+    settings.admission_max_in_flight,
+    settings.admission_max_queue,
+    settings.admission_max_queue_per_session,
+)
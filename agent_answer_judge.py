@@ -1,7 +1,12 @@
 """Judge agent: evaluate answer quality; if not good, provide feedback for retry."""
+import asyncio
 from typing import Optional, Tuple
 
-from config import get_langsmith_tags, get_llm
+from config import get_langsmith_tags, settings
+from deadline import Deadline
+from hedge import hedged, tag_hedge
+from llm_pool import llm_pool
+from microbatch import MicroBatcher
 
 JUDGE_PROMPT = """You are a strict judge.
 
@@ -21,6 +26,16 @@ Return ONLY one line:
 - NOT_GOOD: <brief reason>
 """
 
+_batcher = MicroBatcher(
+    "judge", JUDGE_PROMPT.strip(), validate=lambda reply: reply.strip().upper().startswith(("GOOD", "NOT_GOOD"))
+)
+
+
+def get_judge_stats() -> dict:
+    """Micro-batch stats for judge calls."""
+    return {"microbatch": _batcher.stats()}
+
+
 async def evaluate_answer(
     question: str,
     answer: str,
@@ -28,19 +43,41 @@ async def evaluate_answer(
     evidence: Optional[str] = None,
     request_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
 ) -> Tuple[bool, Optional[str]]:
     """Evaluate answer quality. Returns (passed, feedback). If passed, feedback is None.
-    evidence: optional tool outputs, e.g. '[E1] ... [E2] ...' for citation checking."""
+    evidence: optional tool outputs, e.g. '[E1] ... [E2] ...' for citation checking.
+    With a deadline, judging is skipped (pass) when too little budget is left for a retry."""
     if not answer or not answer.strip():
         return False, "Answer is empty."
-    llm = get_llm()
+    if deadline is not None and not deadline.allows(settings.budget_min_judge_s):
+        deadline.degrade("judge")
+        return True, None
     tags = get_langsmith_tags(request_id=request_id, session_id=session_id)
     evidence_block = f"\n\nEvidence (tool outputs), numbered as [E1], [E2], ...:\n{evidence}" if evidence else "\n\nEvidence: (none)"
-    resp = await llm.ainvoke(
-        JUDGE_PROMPT + f"\nQuestion: {question}\n\nAnswer: {answer}" + evidence_block,
-        config={"run_name": "Answer Judge", "tags": tags},
-    )
-    text = (resp.content or "").strip().upper()
+    item = f"Question: {question}\n\nAnswer: {answer}" + evidence_block
+
+    config = {"run_name": "Answer Judge", "tags": tags}
+
+    async def single() -> str:
+        resp = await hedged(
+            "judge",
+            lambda is_hedge: llm_pool.ainvoke("judge", JUDGE_PROMPT + "\n" + item, config=tag_hedge(config, is_hedge)),
+        )
+        return resp.content or ""
+
+    async def unbatched() -> Tuple[str, bool]:
+        return await single(), False
+
+    call = _batcher.submit(item, single) if settings.microbatch_enabled else unbatched()
+    try:
+        text, _batched = await asyncio.wait_for(call, timeout=deadline.timeout() if deadline else None)
+    except asyncio.TimeoutError:
+        if deadline is None:
+            raise
+        deadline.degrade("judge")
+        return True, None
+    text = text.strip().upper()
     if text.startswith("GOOD"):
         return True, None
     if text.startswith("NOT_GOOD"):
@@ -1,21 +1,37 @@
 """Build LangGraph agents from MCP server configs (with caching)."""
 import asyncio
-from typing import Any, Dict, List, Literal, Tuple
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
 
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
 from langgraph.graph import StateGraph, START
 from langgraph.graph.message import MessagesState
 from langgraph.prebuilt import ToolNode
+from mcp.types import Tool as MCPTool
 from typing_extensions import TypedDict
 
+import metrics
 from agent_answer_judge import evaluate_answer
+from circuit_breaker import CircuitOpen, breakers
 from config import settings
+from context_manager import build_evidence, compact_messages
+from hedge import hedged
+from llm_pool import llm_pool
+from mcp_pool import mcp_pool
+from rag_fanout import merge_shard_tools
+from tool_cache import result_size, tool_cache, tool_cache_key
 from utils import extract_message_content
 
 MAX_RETRIES = 1
-_agent_cache: Dict[Tuple[str, float], Any] = {}
+
+logger = logging.getLogger(__name__)
 
 
 class AgentState(MessagesState, total=False):
@@ -34,13 +50,37 @@ def _judge_continue(state: AgentState) -> Literal["__end__", "llm_call"]:
 
 
 async def _inject_request_context(request, execute):
-    """Inject request_id and session_id from config into MCP tool arguments (tools/call pattern)."""
+    """Inject request_id and session_id from config into MCP tool arguments (tools/call pattern).
+    Results are served from the per-request memo (judge retries) or the shared tool cache when possible."""
     config = getattr(getattr(request, "runtime", None), "config", None) or {}
     configurable = config.get("configurable") or {}
     request_id = configurable.get("request_id")
     session_id = configurable.get("session_id")
     tool_call = request.tool_call
     args = dict(tool_call.get("args", {}) if isinstance(tool_call, dict) else getattr(tool_call, "args", {}))
+    name = tool_call.get("name", "") if isinstance(tool_call, dict) else getattr(tool_call, "name", "")
+    call_id = tool_call.get("id", "") if isinstance(tool_call, dict) else getattr(tool_call, "id", "")
+    key = tool_cache_key(name, args)
+    shards = configurable.get("rag_shards")
+    if shards and (getattr(request.tool, "metadata", None) or {}).get("rag_shards"):
+        key += "@" + ",".join(sorted(shards))  # fan-out results depend on the routed shards
+    memo = configurable.get("tool_memo")
+    cached = memo.get(key) if memo is not None else None
+    if cached is not None:
+        tool_cache.record_request_hit()
+    elif settings.tool_cache_enabled:
+        cached = tool_cache.get(key)
+    if cached is not None:
+        return cached.model_copy(update={"tool_call_id": call_id, "id": None})
+    deadline = configurable.get("deadline")
+    if deadline is not None and not deadline.allows(settings.budget_min_tool_s):
+        deadline.degrade("tools")
+        return ToolMessage(
+            content="Tool call skipped: request time budget exhausted. Answer from the evidence already gathered.",
+            tool_call_id=call_id,
+            name=name,
+            status="error",
+        )
     if request_id is not None:
         args["request_id"] = request_id
     if session_id is not None:
@@ -49,32 +89,192 @@ async def _inject_request_context(request, execute):
         modified_call = {**tool_call, "args": args}
     else:
         modified_call = {
-            "name": getattr(tool_call, "name", ""),
+            "name": name,
             "args": args,
-            "id": getattr(tool_call, "id", ""),
+            "id": call_id,
             "type": getattr(tool_call, "type", "tool_call"),
         }
-    return await execute(request.override(tool_call=modified_call))
+    try:
+        if deadline is None:
+            result = await execute(request.override(tool_call=modified_call))
+        else:
+            with deadline.stage("tools"):
+                result = await asyncio.wait_for(
+                    execute(request.override(tool_call=modified_call)),
+                    timeout=deadline.timeout(settings.tools_timeout_s),
+                )
+    except asyncio.TimeoutError:
+        if deadline is None:
+            raise
+        deadline.degrade("tools")
+        return ToolMessage(
+            content="Tool call timed out within the request time budget.",
+            tool_call_id=call_id,
+            name=name,
+            status="error",
+        )
+    except CircuitOpen as e:
+        if deadline is not None:
+            deadline.degrade("tools")
+        return ToolMessage(
+            content=f"Retrieval unavailable ({e}). Answer without this evidence and say it could not be checked.",
+            tool_call_id=call_id,
+            name=name,
+            status="error",
+        )
+    if isinstance(result, ToolMessage) and result.status != "error":
+        if memo is not None:
+            memo[key] = result
+        partial = isinstance(result.artifact, dict) and result.artifact.get("missing_shards")
+        if settings.tool_cache_enabled and not partial:
+            tool_cache.put(key, name, result, result_size(result.content))
+    return result
 
 
-async def build_graph_agent(servers: dict, tools_timeout_s: float = 60.0):
-    """Build (or return cached) compiled LangGraph agent for the given MCP server config."""
-    if not servers:
-        raise ValueError("servers must be non-empty")
-    url = next(iter(servers.values()))["url"].rstrip("/")
-    cache_key = (url, tools_timeout_s)
-    if cache_key in _agent_cache:
-        return _agent_cache[cache_key]
-    client = MultiServerMCPClient(servers, tool_name_prefix=False)
-    tools = await asyncio.wait_for(client.get_tools(), timeout=tools_timeout_s)
+def _interceptors(servers: dict) -> list:
+    """Tool-call interceptors: the server's circuit breaker (outermost), then pooled sessions when enabled."""
+    if not settings.mcp_pool_enabled:
+        return [breakers.intercept]
+    mcp_pool.register(servers)
+    return [breakers.intercept, mcp_pool.intercept]
+
+
+async def _discover(client: MultiServerMCPClient, name: str, tools_timeout_s: float) -> list:
+    """tools/list for one server through its circuit breaker (a timeout counts as a failure)."""
+    async with breakers.get(name).guard():
+        return await asyncio.wait_for(client.get_tools(server_name=name), timeout=tools_timeout_s)
+
+
+async def _fetch_tools(servers: dict, tools_timeout_s: float) -> Tuple[list, List[dict], List[str]]:
+    """Discover MCP tools for the given server config.
+    Returns (tools, tool_defs, missing); tool_defs are the plain MCP definitions, kept for warm-state
+    snapshots, and missing names the servers that failed (open breaker, error, timeout: RAG_SHARD_TIMEOUT_S
+    per server when there are several) and were left out.
+    Raises the first error only when every server failed. Tools served by several RAG shards are merged
+    into one fan-out tool."""
+    client = MultiServerMCPClient(servers, tool_name_prefix=False, tool_interceptors=_interceptors(servers))
+    names = list(servers)
+    # Sharded: one slow shard must not hold up the build; it is left out like a failed one
+    timeout = min(tools_timeout_s, settings.rag_shard_timeout_s) if len(names) > 1 else tools_timeout_s
+    tasks = [asyncio.ensure_future(_discover(client, name, timeout)) for name in names]
+    try:
+        per_server = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+    errors = [r for r in per_server if isinstance(r, BaseException)]
+    if len(errors) == len(names):
+        raise errors[0]
+    tools: list = []
+    tool_defs: List[dict] = []
+    missing: List[str] = []
+    for name, server_tools in zip(names, per_server):
+        if isinstance(server_tools, BaseException):
+            logger.warning("tool discovery: leaving out server %s: %s", name, server_tools)
+            missing.append(name)
+            continue
+        for t in server_tools:
+            tools.append(t)
+            tool_defs.append({
+                "server": name,
+                "name": t.name,
+                "description": t.description,
+                "inputSchema": t.args_schema if isinstance(t.args_schema, dict) else {},
+                "metadata": t.metadata or {},
+            })
+    return merge_shard_tools(tools, [d["server"] for d in tool_defs]), tool_defs, missing
+
+
+def _tools_from_defs(servers: dict, tool_defs: List[dict]) -> list:
+    """Rebuild LangChain tools from snapshotted MCP definitions without contacting the servers."""
+    interceptors = _interceptors(servers)
+    tools = []
+    tool_servers = []
+    for d in tool_defs:
+        if d["server"] not in servers:
+            continue
+        metadata = dict(d.get("metadata") or {})
+        meta = metadata.pop("_meta", None)
+        mcp_tool = MCPTool.model_validate({
+            "name": d["name"],
+            "description": d.get("description"),
+            "inputSchema": d.get("inputSchema") or {"type": "object"},
+            "annotations": metadata or None,
+            "_meta": meta,
+        })
+        tools.append(convert_mcp_tool_to_langchain_tool(
+            None, mcp_tool, connection=servers[d["server"]], server_name=d["server"], tool_interceptors=interceptors,
+        ))
+        tool_servers.append(d["server"])
+    return merge_shard_tools(tools, tool_servers)
+
+
+def _server_key(servers: dict, tools_timeout_s: float) -> str:
+    """Registry key covering the full server config (all servers, transports, urls) and timeout."""
+    return json.dumps({"servers": servers, "tools_timeout_s": tools_timeout_s}, sort_keys=True, default=str)
+
+
+def _tools_hash(tools: list) -> str:
+    """Stable hash of tool names, descriptions and argument schemas."""
+    schema = []
+    for t in tools:
+        args = getattr(t, "args_schema", None)
+        if args is not None and not isinstance(args, dict):
+            args = args.model_json_schema() if hasattr(args, "model_json_schema") else str(args)
+        schema.append({"name": t.name, "description": getattr(t, "description", ""), "args": args})
+    schema.sort(key=lambda x: x["name"])
+    return hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class _FirstToken(AsyncCallbackHandler):
+    """Sets event on the first streamed token: a streaming llm_call is answering and is not hedged."""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.event.set()
+
+
+def _with_handler(callbacks: Any, handler: AsyncCallbackHandler) -> Any:
+    """Callbacks (None, list or manager) plus handler, without modifying the original."""
+    if callbacks is None:
+        return [handler]
+    if isinstance(callbacks, list):
+        return [*callbacks, handler]
+    manager = callbacks.copy()
+    manager.add_handler(handler, inherit=False)
+    return manager
+
+
+def _compile_agent(tools: list):
+    """Compile the llm_call → tool_node → judge graph for the given tools."""
     tool_node = ToolNode(tools, awrap_tool_call=_inject_request_context)
-    llm = ChatOpenAI(model=settings.openai_model, temperature=0).bind_tools(tools)
+    llm = llm_pool.get("llm_call").bind_tools(tools)
 
-    async def llm_call(state: AgentState):
-        result = await llm.ainvoke(state["messages"])
+    async def llm_call(state: AgentState, config: RunnableConfig):
+        deadline = (config.get("configurable") or {}).get("deadline")
+        messages = compact_messages(state["messages"]) if settings.context_manager_enabled else state["messages"]
+        first_token = _FirstToken()
+
+        def call(is_hedge: bool):
+            if is_hedge:
+                # No callbacks: the duplicate's tokens must not interleave with the primary's answer_delta
+                # stream (if it wins, the final answer event carries its text)
+                return llm_pool.ainvoke("llm_call", messages, config={"callbacks": [], "tags": ["hedge"]}, llm=llm)
+            return llm_pool.ainvoke(
+                "llm_call", messages, config={"callbacks": _with_handler(config.get("callbacks"), first_token)}, llm=llm
+            )
+
+        if deadline is None:
+            result = await hedged("llm_call", call, first_token.event)
+        else:
+            with deadline.stage("llm_call"):
+                result = await asyncio.wait_for(hedged("llm_call", call, first_token.event), timeout=deadline.timeout())
         return {"messages": [result]}
 
-    async def judge_node(state: AgentState):
+    async def judge_node(state: AgentState, config: RunnableConfig):
+        deadline = (config.get("configurable") or {}).get("deadline")
         messages = state["messages"]
         retry_count = state.get("retry_count", 0)
         if retry_count >= MAX_RETRIES:
@@ -90,10 +290,18 @@ async def build_graph_agent(servers: dict, tools_timeout_s: float = 60.0):
                 answer = extract_message_content(m)
             elif role == "tool":
                 tool_contents.append(extract_message_content(m))
-        evidence = "\n".join(f"[E{i+1}] {c}" for i, c in enumerate(tool_contents) if c) or None
-        passed, feedback = await evaluate_answer(question, answer, evidence=evidence)
+        if settings.context_manager_enabled:
+            evidence = build_evidence(tool_contents, question)
+        else:
+            evidence = "\n".join(f"[E{i+1}] {c}" for i, c in enumerate(tool_contents) if c) or None
+        if deadline is None:
+            passed, feedback = await evaluate_answer(question, answer, evidence=evidence)
+        else:
+            with deadline.stage("judge"):
+                passed, feedback = await evaluate_answer(question, answer, evidence=evidence, deadline=deadline)
         if passed or retry_count >= MAX_RETRIES:
             return {"judge_passed": True}
+        metrics.judge_retries.inc()
         return {
             "judge_passed": False,
             "messages": [HumanMessage(content=f"The previous answer was not good enough. Reason: {feedback} Please improve your answer.")],
@@ -108,6 +316,168 @@ async def build_graph_agent(servers: dict, tools_timeout_s: float = 60.0):
     g.add_conditional_edges("llm_call", _should_continue, ["tool_node", "judge"])
     g.add_edge("tool_node", "llm_call")
     g.add_conditional_edges("judge", _judge_continue, ["__end__", "llm_call"])
-    compiled = g.compile()
-    _agent_cache[cache_key] = compiled
-    return compiled
\ No newline at end of file
+    return g.compile()
+
+
+class _AgentEntry:
+    __slots__ = ("agent", "tools_hash", "refreshed_at", "servers", "tools_timeout_s", "tool_defs", "missing")
+
+    def __init__(self, agent: Any, tools_hash: str, servers: dict, tools_timeout_s: float, tool_defs: List[dict],
+                 missing: Optional[List[str]] = None):
+        self.agent = agent
+        self.tools_hash = tools_hash
+        self.refreshed_at = time.monotonic()
+        self.servers = servers
+        self.tools_timeout_s = tools_timeout_s
+        self.tool_defs = tool_defs
+        self.missing = missing or []  # servers whose tools discovery could not get
+
+
+class AgentRegistry:
+    """Compiled agents per server config: single-flight builds, background TTL refresh of tool lists.
+
+    A stale entry is still served while a refresh runs; the graph is recompiled only when the
+    tool schema hash changes."""
+
+    def __init__(self, ttl_s: float):
+        self.ttl_s = ttl_s
+        self._entries: Dict[str, _AgentEntry] = {}
+        self._building: Dict[str, asyncio.Task] = {}
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"hits": 0, "builds": 0, "joined": 0, "refreshes": 0, "recompiles": 0, "refresh_errors": 0,
+                       "restored": 0, "partial_builds": 0}
+
+    async def get(self, servers: dict, tools_timeout_s: float, wait_s: Optional[float] = None):
+        """Compiled agent for servers. wait_s caps how long this caller waits for a cold build
+        (the build itself keeps running for later callers)."""
+        key = _server_key(servers, tools_timeout_s)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._stats["hits"] += 1
+            if entry.missing or (self.ttl_s > 0 and time.monotonic() - entry.refreshed_at > self.ttl_s):
+                self._schedule_refresh(key, servers, tools_timeout_s)
+            return entry.agent
+        task = self._building.get(key)
+        if task is None:
+            # Build in its own task so a cancelled first caller does not fail the joiners
+            task = asyncio.create_task(self._build(key, servers, tools_timeout_s))
+            self._building[key] = task
+            task.add_done_callback(lambda t: self._build_done(key, t))
+        else:
+            self._stats["joined"] += 1
+        if wait_s is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), timeout=wait_s)
+
+    async def _build(self, key: str, servers: dict, tools_timeout_s: float):
+        tools, tool_defs, missing = await _fetch_tools(servers, tools_timeout_s)
+        entry = _AgentEntry(_compile_agent(tools), _tools_hash(tools), servers, tools_timeout_s, tool_defs, missing)
+        if missing:
+            # Served without those servers' tools; every use schedules a refresh until they are back
+            self._stats["partial_builds"] += 1
+        self._entries[key] = entry
+        self._stats["builds"] += 1
+        return entry.agent
+
+    def _build_done(self, key: str, task: asyncio.Task) -> None:
+        self._building.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def _schedule_refresh(self, key: str, servers: dict, tools_timeout_s: float) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, servers, tools_timeout_s))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: str, servers: dict, tools_timeout_s: float) -> None:
+        try:
+            tools, tool_defs, missing = await _fetch_tools(servers, tools_timeout_s)
+            entry = self._entries.get(key)
+            if entry is not None and set(missing) - set(entry.missing):
+                # Never drop the cached tools of a server that did not answer this time
+                self._stats["refresh_errors"] += 1
+                logger.warning("agent registry: tool refresh missed %s, serving cached agent", ", ".join(missing))
+                return
+            tools_hash = _tools_hash(tools)
+            if entry is not None and entry.tools_hash == tools_hash:
+                entry.refreshed_at = time.monotonic()
+                entry.missing = missing
+            else:
+                self._entries[key] = _AgentEntry(
+                    _compile_agent(tools), tools_hash, servers, tools_timeout_s, tool_defs, missing
+                )
+                self._stats["recompiles"] += 1
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            self._stats["refresh_errors"] += 1
+            logger.warning("agent registry: tool refresh failed, serving cached agent: %s", e)
+        finally:
+            self._refreshing.discard(key)
+
+    async def aclose(self) -> None:
+        """Cancel background tool refreshes (app shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def export_state(self) -> List[dict]:
+        """Tool definitions per server config, for the warm-state snapshot."""
+        return [
+            {"servers": e.servers, "tools_timeout_s": e.tools_timeout_s, "tool_defs": e.tool_defs}
+            for e in self._entries.values()
+        ]
+
+    def restore_state(self, state: List[dict]) -> int:
+        """Compile agents from snapshotted tool definitions. Restored entries count as stale, so
+        their first use schedules a background tool refresh. Returns the number restored."""
+        restored = 0
+        for item in state:
+            key = _server_key(item["servers"], item["tools_timeout_s"])
+            if key in self._entries or not item["tool_defs"]:
+                continue
+            tools = _tools_from_defs(item["servers"], item["tool_defs"])
+            entry = _AgentEntry(
+                _compile_agent(tools), _tools_hash(tools), item["servers"], item["tools_timeout_s"], item["tool_defs"]
+            )
+            entry.refreshed_at -= self.ttl_s
+            self._entries[key] = entry
+            restored += 1
+        self._stats["restored"] += restored
+        return restored
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["agents"] = len(self._entries)
+        stats["tools_hashes"] = sorted({e.tools_hash for e in self._entries.values()})
+        return stats
+
+
+agent_registry = AgentRegistry(settings.agent_cache_ttl_s)
+
+
+async def build_graph_agent(servers: dict, tools_timeout_s: float = 60.0, wait_s: Optional[float] = None):
+    """Build (or return cached) compiled LangGraph agent for the given MCP server config."""
+    if not servers:
+        raise ValueError("servers must be non-empty")
+    return await agent_registry.get(servers, tools_timeout_s, wait_s)
+
+
+async def prewarm_agent() -> Optional[float]:
+    """Discover tools and compile the RAG agent ahead of the first request.
+    Returns elapsed seconds, or None if RAG is not configured or warm-up failed."""
+    servers = settings.rag_server_config
+    if not servers:
+        return None
+    start = time.perf_counter()
+    try:
+        await build_graph_agent(servers, settings.tools_timeout_s)
+    except Exception as e:
+        logger.warning("agent prewarm failed: %s", e)
+        return None
+    elapsed = time.perf_counter() - start
+    logger.info("agent prewarm done in %.3fs", elapsed)
+    return elapsed
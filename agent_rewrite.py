@@ -1,10 +1,14 @@
 """EntityRewrite: Taixing third-person + LLM rewrite for retrieval."""
+import asyncio
 import re
 from typing import Optional
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from config import get_langsmith_tags, get_llm
+from config import get_langsmith_tags, settings
+from deadline import Deadline
+from hedge import hedged, tag_hedge
+from llm_pool import llm_pool
 
 CANDIDATE_NAME = "Taixing Bi"
 
@@ -30,24 +34,49 @@ def rewrite_to_third_person(question: str) -> str:
 _SYSTEM = """Rewrite the user's question to be clearer and more specific for retrieval.
 Keep it concise. Return only the rewritten question, nothing else."""
 
+_SYSTEM_WITH_HISTORY = """Rewrite the user's latest question to be clearer and more specific for retrieval.
+Use the conversation context to resolve follow-ups and references ("and his visa?", "that project") so the
+question stands on its own. Keep it concise. Return only the rewritten question, nothing else."""
+
 
 async def rewrite_query(
     query: str,
     *,
     request_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    history: Optional[str] = None,
 ) -> str:
-    """EntityRewrite: third-person (Taixing) + LLM rewrite for retrieval. Call after IntentGate (no smalltalk)."""
+    """EntityRewrite: third-person (Taixing) + LLM rewrite for retrieval. Call after IntentGate (no smalltalk).
+    With a deadline, the LLM pass is skipped (third-person rewrite only) when it would eat into the answer reserve.
+    history is the compact session context (session_memory) used to resolve follow-up questions."""
     if not query or not query.strip():
         return query
     query = rewrite_to_third_person(query)
-    llm = get_llm()
-    msg = await llm.ainvoke(
-        [SystemMessage(content=_SYSTEM), HumanMessage(content=query)],
-        config={
-            "run_name": "agent_rewrite",
-            "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
-        },
-    )
+    timeout = None
+    if deadline is not None:
+        timeout = deadline.timeout(reserve=settings.budget_answer_reserve_s)
+        if timeout <= 0:
+            deadline.degrade("rewrite")
+            return query
+    if history:
+        prompt = [
+            SystemMessage(content=_SYSTEM_WITH_HISTORY),
+            HumanMessage(content=f"Conversation context:\n{history}\n\nLatest question: {query}"),
+        ]
+    else:
+        prompt = [SystemMessage(content=_SYSTEM), HumanMessage(content=query)]
+    config = {
+        "run_name": "agent_rewrite",
+        "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
+    }
+    call = hedged("rewrite", lambda is_hedge: llm_pool.ainvoke("rewrite", prompt, config=tag_hedge(config, is_hedge)))
+    try:
+        msg = await asyncio.wait_for(call, timeout=timeout)
+    except asyncio.TimeoutError:
+        if deadline is None:
+            raise
+        deadline.degrade("rewrite")
+        return query
     rewritten = (msg.content or "").strip()
     return rewritten if rewritten else query
@@ -0,0 +1,109 @@
+"""Answer cache: size-bounded LRU + TTL keyed on the normalized (rewritten) question."""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from utils import normalize_question
+
+REWRITE_PREFIX = "rw:"
+RAW_PREFIX = "raw:"
+
+
+class AnswerCache:
+    """In-process LRU with per-entry expiry. Values are answer event payloads (dicts)."""
+
+    def __init__(self, max_size: int, ttl_s: float):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key (refreshing its LRU position), or None."""
+        item = self._entries.get(key)
+        if item is None:
+            self._stats["misses"] += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store value under key; evict least-recently-used entries beyond max_size."""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Drop one key (or everything if key is None). Returns number of entries removed."""
+        if key is None:
+            n = len(self._entries)
+            self._entries.clear()
+            return n
+        return 1 if self._entries.pop(key, None) is not None else 0
+
+    def export_state(self) -> List[list]:
+        """Live entries as [key, ttl_remaining_s, value], least recently used first."""
+        now = time.monotonic()
+        return [[k, exp - now, v] for k, (exp, v) in self._entries.items() if exp > now]
+
+    def restore_state(self, entries: List[list], age_s: float = 0.0) -> int:
+        """Load exported entries (age_s: time since export); existing keys are kept. Returns count loaded."""
+        if self.max_size <= 0:
+            return 0
+        now = time.monotonic()
+        loaded = 0
+        # Most recent first, each moved to the LRU end: restored entries keep their order, behind
+        # anything cached since startup. A bare prefix is an empty-question key from an older snapshot.
+        for key, ttl_left, value in reversed(entries[-self.max_size:]):
+            if ttl_left - age_s <= 0 or key in self._entries or key in (RAW_PREFIX, REWRITE_PREFIX):
+                continue
+            self._entries[key] = (now + ttl_left - age_s, value)
+            self._entries.move_to_end(key, last=False)
+            loaded += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return loaded
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["size"] = len(self._entries)
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+answer_cache = AnswerCache(settings.answer_cache_size, settings.answer_cache_ttl_s)
+
+
+def _key(prefix: str, text: str) -> Optional[str]:
+    # No key for text without letters or digits (emoji, punctuation): such questions would all share one entry
+    normalized = normalize_question(text)
+    return prefix + normalized if normalized else None
+
+
+def raw_key(query: str) -> Optional[str]:
+    return _key(RAW_PREFIX, query)
+
+
+def rewrite_key(rewritten: str) -> Optional[str]:
+    return _key(REWRITE_PREFIX, rewritten)
+
+
+def invalidate_question(question: Optional[str] = None) -> int:
+    """Invalidate cached answers for a question (raw and rewritten forms), or all if None."""
+    if question is None:
+        return answer_cache.invalidate()
+    keys = [k for k in (raw_key(question), rewrite_key(question)) if k is not None]
+    return sum(answer_cache.invalidate(k) for k in keys)
@@ -0,0 +1,120 @@
+"""Batch answering: many questions through the answer pipeline with bounded concurrency.
+
+Questions are deduplicated (normalized text), answered concurrently through coalesced_answer_query,
+so they share the agent, caches and in-flight identical requests, and yielded in completion order.
+Each new pipeline also takes an admission slot under one key per batch, so a batch gets one session's fair
+share of capacity and does not crowd out interactive requests. Batch questions never use session memory.
+"""
+import asyncio
+import contextlib
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from admission import AdmissionRejected
+from config import settings
+from orchestrator import coalesced_answer_query, format_error
+from utils import normalize_question
+
+_stats = {"batches": 0, "questions": 0, "duplicates": 0, "answered": 0, "errors": 0}
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+async def _answer_one(question: str, indices: List[int], batch_id: str, sem: asyncio.Semaphore) -> dict:
+    request_id = f"{batch_id}-{indices[0]}"
+    result = {"type": "result", "index": indices[0], "indices": indices, "question": question,
+              "request_id": request_id}
+    async with sem:
+        started = time.monotonic()
+        try:
+            events = coalesced_answer_query(
+                question, request_id=request_id, admit=True, admission_key=f"batch:{batch_id}"
+            )
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    if event.get("type") == "answer":
+                        result["answer"] = event.get("text", "")
+                        for key in ("cache", "agent_graph_run_id"):
+                            if key in event:
+                                result[key] = event[key]
+                    elif event.get("type") == "error":
+                        result["error"] = event.get("text", "Unknown error")
+        except AdmissionRejected as e:
+            result["error"] = f"Error: {e.message}"
+        except Exception as e:
+            result["error"] = format_error(e)
+        result["elapsed_s"] = round(time.monotonic() - started, 3)
+    return result
+
+
+async def batch_answer_queries(
+    questions: List[str],
+    *,
+    concurrency: Optional[int] = None,
+    batch_id: Optional[str] = None,
+) -> AsyncIterator[dict]:
+    """Yield one result event per unique question, in completion order, then a summary event.
+    concurrency is capped at BATCH_MAX_CONCURRENCY. Closing the iterator cancels unfinished questions."""
+    batch_id = batch_id or str(uuid.uuid4())
+    limit = max(1, min(concurrency or settings.batch_max_concurrency, settings.batch_max_concurrency))
+    unique: Dict[str, List[int]] = {}
+    texts: Dict[str, str] = {}
+    for i, question in enumerate(questions):
+        # Questions without letters or digits are kept apart (each normalizes to "")
+        key = normalize_question(question) or f"\x00{i}"
+        unique.setdefault(key, []).append(i)
+        texts.setdefault(key, question)
+    _stats["batches"] += 1
+    _stats["questions"] += len(questions)
+    _stats["duplicates"] += len(questions) - len(unique)
+    started = time.monotonic()
+    sem = asyncio.Semaphore(limit)
+    tasks = [asyncio.create_task(_answer_one(texts[key], indices, batch_id, sem)) for key, indices in unique.items()]
+    latencies: List[float] = []
+    answered = errors = cache_hits = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            latencies.append(result["elapsed_s"])
+            if "error" in result or "answer" not in result:
+                errors += 1
+            else:
+                answered += 1
+                cache_hits += result.get("cache") == "hit"
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _stats["answered"] += answered
+        _stats["errors"] += errors
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    yield {
+        "type": "summary",
+        "batch_id": batch_id,
+        "questions": len(questions),
+        "unique": len(unique),
+        "duplicates": len(questions) - len(unique),
+        "answered": answered,
+        "errors": errors,
+        "cache_hits": cache_hits,
+        "concurrency": limit,
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(len(unique) / elapsed, 3) if elapsed > 0 else None,
+        "latency_s": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def get_batch_stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,4 @@
+"""Offline benchmark harness: stub MCP RAG server, fake chat model and an SSE / MCP load driver.
+
+Run with ``python -m bench.run --help``; no network or API keys needed.
+"""
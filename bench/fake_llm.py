@@ -0,0 +1,121 @@
+"""Deterministic stand-in for ChatOpenAI with configurable latency, token rate and tool-call rounds.
+
+Recognizes the orchestrator's prompts (intent gate, rewrite with or without session context, session
+summary, judge, micro-batch) by their text and answers each the way a cooperative model would, so every
+pipeline stage runs for real.
+"""
+import asyncio
+import json
+import random
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+_BATCH_RE = re.compile(r"You will process (\d+) independent items")
+_LATEST_QUESTION = "Latest question:"  # agent_rewrite history prompt
+_NEW_TURN = "New turn:"  # session_memory summary prompt
+
+
+class FakeChatModel(BaseChatModel):
+    """latency_s: time to first token; tokens_per_s: streaming rate (0 = instant);
+    tool_rounds: tool-call turns before the answer; judge_fail_rate: share of NOT_GOOD verdicts."""
+
+    latency_s: float = 0.2
+    tokens_per_s: float = 50.0
+    answer_tokens: int = 40
+    tool_rounds: int = 1
+    judge_fail_rate: float = 0.0
+    seed: int = 0
+    tool_names: List[str] = []
+    counters: Dict[str, int] = Field(default_factory=lambda: {"calls": 0})  # shared with bind_tools copies
+
+    _rng: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-fake"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        names = [getattr(t, "name", None) or t.get("name") for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def _random(self) -> random.Random:
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng
+
+    def _verdict(self) -> str:
+        if self._random().random() < self.judge_fail_rate:
+            return "NOT_GOOD: missing citation"
+        return "GOOD"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        self.counters["calls"] += 1
+        first = str(messages[0].content) if messages else ""
+        batch = _BATCH_RE.search(first)
+        if batch:
+            n = int(batch.group(1))
+            kind_judge = "strict judge" in first
+            return AIMessage(content=json.dumps([self._verdict() if kind_judge else "NO" for _ in range(n)]))
+        if first.startswith("You are an intent classifier"):
+            return AIMessage(content="NO")
+        if first.startswith("You are a strict judge"):
+            return AIMessage(content=self._verdict())
+        if first.startswith("Rewrite the user's question"):
+            return AIMessage(content=str(messages[-1].content))
+        if first.startswith("Rewrite the user's latest question"):
+            # Follow-up with session context: the question itself, not the context block
+            return AIMessage(content=str(messages[-1].content).rsplit(_LATEST_QUESTION, 1)[-1].strip())
+        if first.startswith("You maintain a running summary"):
+            turn = str(messages[-1].content).rsplit(_NEW_TURN, 1)[-1]
+            return AIMessage(content=" ".join(turn.split()[:self.answer_tokens]))
+        # agent llm_call: tool rounds counted since the last human turn
+        rounds = 0
+        for msg in reversed(messages):
+            if msg.type == "human":
+                break
+            if msg.type == "ai" and getattr(msg, "tool_calls", None):
+                rounds += 1
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        if rounds < self.tool_rounds and self.tool_names:
+            return AIMessage(content="", tool_calls=[{
+                "name": self.tool_names[0],
+                "args": {"query": question[:200]},
+                "id": f"call_{self.counters['calls']}",
+            }])
+        words = [f"w{i}" for i in range(max(1, self.answer_tokens - 1))]
+        return AIMessage(content=" ".join(words) + " [E1].")
+
+    async def _wait_for_output(self, tokens: int) -> None:
+        delay = self.latency_s + (tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0.0)
+        await asyncio.sleep(delay)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError("bench fake model is async only")
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        await self._wait_for_output(len(str(reply.content).split()))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.latency_s)
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0,
+            }]))
+            return
+        per_token = 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        for word in str(reply.content).split(" "):
+            if per_token:
+                await asyncio.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
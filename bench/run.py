@@ -0,0 +1,296 @@
+"""Drive the real FastAPI app with concurrent load against the stub RAG server and fake LLM.
+
+    python -m bench.run --concurrency 16 --requests 200
+    python -m bench.run --target mcp --env COALESCE_REQUESTS=false --json
+
+Both servers and the load client share one process and event loop, so absolute numbers include
+client overhead; compare runs on the same machine rather than against production.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb() -> float:
+    """Current RSS (Linux /proc), else peak RSS from getrusage."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "p50": round(rank(0.50), 4),
+        "p95": round(rank(0.95), 4),
+        "p99": round(rank(0.99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def _questions(n: int, distinct: int) -> List[str]:
+    pool = max(1, distinct or n)
+    return [f"What did Taixing Bi build on project {i % pool}?" for i in range(n)]
+
+
+async def _sse_request(client, url: str, question: str, index: int) -> dict:
+    """One /orchestrator/stream-answer call: TTFB, first answer token, answer time, outcome."""
+    result = {"ttfb": None, "first_token": None, "answer": None, "ok": False, "status": None, "error": None}
+    start = time.perf_counter()
+    body = {"question": question, "session_id": f"bench-{index % 64}", "request_id": f"bench-{index}"}
+    try:
+        async with client.stream("POST", url, json=body) as resp:
+            result["status"] = resp.status_code
+            async for line in resp.aiter_lines():
+                now = time.perf_counter() - start
+                if result["ttfb"] is None:
+                    result["ttfb"] = now
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                kind = event.get("type")
+                if kind == "answer_delta" and result["first_token"] is None:
+                    result["first_token"] = now
+                elif kind == "answer":
+                    result["answer"] = now
+                    result["ok"] = True
+                    if result["first_token"] is None:
+                        result["first_token"] = now
+                elif kind == "error":
+                    result["error"] = event.get("text")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def _mcp_request(session, question: str) -> dict:
+    """One answer_question tool call; TTFB and answer coincide (the tool is not streamed)."""
+    start = time.perf_counter()
+    result = {"ttfb": None, "first_token": None, "answer": None, "ok": False, "status": None, "error": None}
+    try:
+        res = await session.call_tool("answer_question", {"question": question})
+        elapsed = time.perf_counter() - start
+        text = "".join(getattr(c, "text", "") for c in res.content)
+        result.update(ttfb=elapsed, first_token=elapsed, answer=elapsed)
+        if res.isError or text.startswith("Error"):
+            result["error"] = text[:200]
+        else:
+            result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def _run_load(args, app_url: str, questions: List[str]) -> List[dict]:
+    import httpx
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamable_http_client
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, q in enumerate(questions):
+        queue.put_nowait((i, q))
+    results: List[dict] = []
+
+    async def sse_worker(client) -> None:
+        while not queue.empty():
+            i, q = queue.get_nowait()
+            results.append(await _sse_request(client, f"{app_url}/orchestrator/stream-answer", q, i))
+
+    async def mcp_worker() -> None:
+        async with httpx.AsyncClient(timeout=None) as http:
+            async with streamable_http_client(f"{app_url}/mcp/", http_client=http) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    while not queue.empty():
+                        _, q = queue.get_nowait()
+                        results.append(await _mcp_request(session, q))
+
+    if args.target == "mcp":
+        await asyncio.gather(*(mcp_worker() for _ in range(args.concurrency)))
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+            await asyncio.gather(*(sse_worker(client) for _ in range(args.concurrency)))
+    return results
+
+
+def _report(args, results: List[dict], wall_s: float, rss: dict, llm_calls: int, rag_calls: int) -> dict:
+    ok = [r for r in results if r["ok"] and not r["error"]]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        if r["status"] is not None:
+            statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "target": args.target,
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "statuses": statuses,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "ttfb_s": _percentiles([r["ttfb"] for r in results if r["ttfb"] is not None]),
+        "first_token_s": _percentiles([r["first_token"] for r in ok if r["first_token"] is not None]),
+        "answer_s": _percentiles([r["answer"] for r in ok]),
+        "rss_mb": rss,
+        "llm_calls": llm_calls,
+        "rag_calls": rag_calls,
+        "sample_errors": sorted({r["error"] for r in results if r["error"]})[:5],
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(f"target={report['target']} requests={report['requests']} concurrency={report['concurrency']} "
+          f"ok={report['ok']} errors={report['errors']} statuses={report['statuses']}")
+    print(f"wall={report['wall_s']}s throughput={report['throughput_rps']} req/s "
+          f"llm_calls={report['llm_calls']} rag_calls={report['rag_calls']}")
+    print(f"{'latency (s)':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for key in ("ttfb_s", "first_token_s", "answer_s"):
+        row = report[key]
+        cells = "".join(f"{'-' if row[p] is None else row[p]:>9}" for p in ("p50", "p95", "p99", "max"))
+        print(f"{key:<14}{cells}")
+    rss = report["rss_mb"]
+    print(f"rss_mb start={rss['start']} peak={rss['peak']} end={rss['end']}")
+    for err in report["sample_errors"]:
+        print(f"error: {err}")
+
+
+async def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def _main(args) -> dict:
+    from bench.stub_rag import build_stub_rag_app, get_stub_stats
+
+    rag_port, app_port = _free_port(), _free_port()
+    os.environ["MCP_TOOL_RAG_URL"] = f"http://127.0.0.1:{rag_port}/"
+    rag_server, rag_task = await _serve(
+        build_stub_rag_app(args.rag_tool, args.rag_latency_ms / 1000.0, args.rag_doc_tokens), rag_port
+    )
+
+    # The app reads settings at import time, so import it only after the environment is final
+    from bench.fake_llm import FakeChatModel
+    from llm_pool import llm_pool
+
+    fake = FakeChatModel(
+        latency_s=args.llm_latency_ms / 1000.0,
+        tokens_per_s=args.tokens_per_s,
+        answer_tokens=args.answer_tokens,
+        tool_rounds=args.tool_rounds,
+        judge_fail_rate=args.judge_fail_rate,
+        seed=args.seed,
+    )
+    llm_pool.override(fake)
+    import main
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in ("httpx", "mcp", "uvicorn"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    app_server, app_task = await _serve(main.app, app_port)
+    app_url = f"http://127.0.0.1:{app_port}"
+    try:
+        if args.warmup:
+            await _run_load(args, app_url, [f"warmup question {i}" for i in range(args.warmup)])
+        llm_before, rag_before = fake.counters["calls"], get_stub_stats()["calls"]
+        rss = {"start": round(_rss_mb(), 1), "peak": 0.0, "end": 0.0}
+
+        async def sample_rss() -> None:
+            while True:
+                rss["peak"] = max(rss["peak"], round(_rss_mb(), 1))
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_rss())
+        start = time.perf_counter()
+        results = await _run_load(args, app_url, _questions(args.requests, args.distinct))
+        wall = time.perf_counter() - start
+        sampler.cancel()
+        rss["end"] = round(_rss_mb(), 1)
+        rss["peak"] = max(rss["peak"], rss["end"])
+        llm_calls = fake.counters["calls"] - llm_before
+        return _report(args, results, wall, rss, llm_calls, get_stub_stats()["calls"] - rag_before)
+    finally:
+        app_server.should_exit = True
+        rag_server.should_exit = True
+        await asyncio.gather(app_task, rag_task, return_exceptions=True)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Offline orchestrator benchmark (stub RAG + fake LLM).")
+    p.add_argument("--target", choices=["sse", "mcp"], default="sse",
+                   help="sse: POST /orchestrator/stream-answer; mcp: answer_question tool")
+    p.add_argument("--requests", type=int, default=100)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--distinct", type=int, default=0,
+                   help="distinct questions cycled through (0 = every request unique)")
+    p.add_argument("--warmup", type=int, default=2, help="unmeasured requests before the run")
+    p.add_argument("--llm-latency-ms", type=float, default=200.0, help="fake LLM time to first token")
+    p.add_argument("--tokens-per-s", type=float, default=50.0, help="fake LLM streaming rate (0 = instant)")
+    p.add_argument("--answer-tokens", type=int, default=40)
+    p.add_argument("--tool-rounds", type=int, default=1, help="tool-call turns before the answer")
+    p.add_argument("--judge-fail-rate", type=float, default=0.0, help="share of NOT_GOOD judge verdicts")
+    p.add_argument("--rag-latency-ms", type=float, default=50.0)
+    p.add_argument("--rag-doc-tokens", type=int, default=300)
+    p.add_argument("--rag-tool", default="search", help="tool name exposed by the stub RAG server")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                   help="extra app settings, e.g. --env COALESCE_REQUESTS=false (repeatable)")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    p.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # Offline defaults; --env wins
+    os.environ.setdefault("OPENAI_API_KEY", "bench-offline")
+    os.environ["LANGSMITH_TRACING"] = "false"
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    os.environ.setdefault("WARM_STATE_PATH", "")  # no snapshot: every run starts cold
+    os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", str(max(8, args.concurrency)))
+    os.environ.setdefault("ADMISSION_MAX_QUEUE", str(max(32, args.requests)))
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+    report = asyncio.run(_main(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
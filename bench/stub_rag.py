@@ -0,0 +1,31 @@
+"""Stand-in RAG MCP server (streamable HTTP) returning synthetic documents after a fixed latency."""
+import asyncio
+
+from mcp.server import FastMCP
+from mcp.server.transport_security import TransportSecuritySettings
+
+_stats = {"calls": 0}
+
+
+def build_stub_rag_app(tool_name: str = "search", latency_s: float = 0.05, doc_tokens: int = 300):
+    """ASGI app serving one tool tool_name(query, request_id, session_id) at "/"."""
+    server = FastMCP(
+        "bench-rag",
+        stateless_http=True,
+        streamable_http_path="/",
+        transport_security=TransportSecuritySettings(enable_dns_rebinding_protection=False),
+    )
+
+    @server.tool(name=tool_name)
+    async def search(query: str, request_id: str = "", session_id: str = "") -> str:
+        """Search Taixing Bi's documents."""
+        _stats["calls"] += 1
+        await asyncio.sleep(latency_s)
+        body = " ".join(f"fact{i}" for i in range(doc_tokens))
+        return f"Document for {query}:\n\n{body}"
+
+    return server.streamable_http_app()
+
+
+def get_stub_stats() -> dict:
+    return dict(_stats)
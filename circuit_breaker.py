@@ -0,0 +1,161 @@
+"""Per-server circuit breakers for MCP tool discovery and tool calls.
+
+closed: calls pass; failures and slow calls (>= BREAKER_SLOW_CALL_S) are tracked over the last
+BREAKER_WINDOW calls, and the breaker opens once the failure rate reaches BREAKER_ERROR_RATE.
+open: calls fail fast with CircuitOpen for BREAKER_OPEN_S.
+half_open: up to BREAKER_HALF_OPEN_PROBES calls go through as probes; a success closes the breaker,
+a failure opens it again.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a server whose breaker is open."""
+
+    def __init__(self, server: str, retry_in_s: float):
+        super().__init__(f"MCP server {server!r} unavailable (circuit open, retry in {retry_in_s:.0f}s)")
+        self.server = server
+        self.retry_in_s = retry_in_s
+
+
+class CircuitBreaker:
+    def __init__(self, server: str):
+        self.server = server
+        self.state = CLOSED
+        self._failures: Deque[bool] = deque(maxlen=max(1, settings.breaker_window))
+        self._latencies: Deque[float] = deque(maxlen=max(1, settings.breaker_window))
+        self._opened_at = 0.0
+        self._probes = 0
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "trips": 0, "recoveries": 0}
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened_at + settings.breaker_open_s - time.monotonic())
+
+    def _update(self) -> None:
+        if self.state == OPEN and self._retry_in() <= 0:
+            self.state = HALF_OPEN
+            self._probes = 0
+
+    @property
+    def is_open(self) -> bool:
+        """True if a call now would be rejected (open, or half-open with every probe slot taken)."""
+        self._update()
+        return self.state == OPEN or (self.state == HALF_OPEN and self._probes >= settings.breaker_half_open_probes)
+
+    def _acquire(self) -> None:
+        if self.is_open:
+            self._stats["rejected"] += 1
+            raise CircuitOpen(self.server, self._retry_in())
+        if self.state == HALF_OPEN:
+            self._probes += 1
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._stats["trips"] += 1
+        logger.warning("circuit breaker: %s open for %.0fs", self.server, settings.breaker_open_s)
+
+    def _record(self, failed: bool, latency: float) -> None:
+        slow = latency >= settings.breaker_slow_call_s
+        failed = failed or slow
+        self._stats["calls"] += 1
+        self._stats["failures"] += failed
+        self._stats["slow_calls"] += slow
+        self._latencies.append(latency)
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if failed:
+                self._trip()
+            else:
+                self.state = CLOSED
+                self._failures.clear()
+                self._stats["recoveries"] += 1
+                logger.info("circuit breaker: %s closed after a successful probe", self.server)
+            return
+        self._failures.append(failed)
+        if (
+            self.state == CLOSED
+            and len(self._failures) >= settings.breaker_min_calls
+            and sum(self._failures) / len(self._failures) >= settings.breaker_error_rate
+        ):
+            self._trip()
+
+    @contextlib.asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """Wrap one call: fail fast with CircuitOpen when open, else record its outcome and latency.
+        A call cancelled from outside (request deadline, client gone) only counts if it was already slow."""
+        if not settings.breaker_enabled:
+            yield
+            return
+        self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            elapsed = time.monotonic() - start
+            if elapsed >= settings.breaker_slow_call_s:
+                self._record(True, elapsed)
+            elif self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+            raise
+        except Exception:
+            self._record(True, time.monotonic() - start)
+            raise
+        self._record(False, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        self._update()
+        window = len(self._failures)
+        latencies = sorted(self._latencies)
+        return {
+            **self._stats,
+            "state": self.state,
+            "open": int(self.state != CLOSED),
+            "failure_rate": round(sum(self._failures) / window, 4) if window else 0.0,
+            "latency_p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "retry_in_s": round(self._retry_in(), 1) if self.state == OPEN else 0.0,
+        }
+
+
+class BreakerRegistry:
+    """One breaker per MCP server name; also a MultiServerMCPClient tool interceptor."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, server: str) -> CircuitBreaker:
+        breaker = self._breakers.get(server)
+        if breaker is None:
+            breaker = self._breakers[server] = CircuitBreaker(server)
+        return breaker
+
+    def all_open(self, servers: Iterable[str]) -> bool:
+        """True if every given server's breaker currently rejects calls (counted as a rejection on each)."""
+        names = list(servers)
+        if not (settings.breaker_enabled and names and all(self.get(s).is_open for s in names)):
+            return False
+        for s in names:
+            self.get(s)._stats["rejected"] += 1
+        return True
+
+    async def intercept(self, request, handler):
+        """Tool interceptor: tools/call through the server's breaker."""
+        async with self.get(request.server_name).guard():
+            return await handler(request)
+
+    def stats(self) -> dict:
+        return {server: b.stats() for server, b in self._breakers.items()}
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,126 @@
+"""Single-flight coalescing of identical in-flight event streams (fan-out to many subscribers)."""
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+
+class _Flight:
+    """One running source stream. Events are buffered so late subscribers replay from the start."""
+
+    def __init__(self, source: AsyncIterator[dict]):
+        self.events: List[dict] = []
+        self.done = False
+        self.abandoned = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[dict]) -> None:
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def leave(self) -> None:
+        """One subscriber gone; the source is cancelled when the last one leaves early."""
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.task.done():
+            self.abandoned = True
+            self.task.cancel()
+
+
+class Subscription:
+    """All events of a flight (buffered then live), optionally mapped by transform.
+    Counts as a subscriber from creation until close(), even if never iterated, so a stream whose
+    consumer never started can still be closed (and its flight cancelled) by whoever holds it."""
+
+    def __init__(self, flight: _Flight, transform: Optional[Callable[[dict], dict]] = None):
+        self._flight = flight
+        self._transform = transform
+        self._next = 0
+        self.closed = False
+        flight.subscribers += 1
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> dict:
+        flight = self._flight
+        while not self.closed:
+            if self._next < len(flight.events):
+                event = flight.events[self._next]
+                self._next += 1
+                return self._transform(event) if self._transform is not None else event
+            if flight.done:
+                self.close()
+                break
+            await flight._changed.wait()
+        raise StopAsyncIteration
+
+    def close(self) -> None:
+        """Leave the flight. Synchronous and idempotent (safe in finally blocks of cancelled tasks)."""
+        if not self.closed:
+            self.closed = True
+            self._flight.leave()
+
+    async def aclose(self) -> None:
+        self.close()
+
+
+class Coalescer:
+    """Maps a key (e.g. normalized question) to the in-flight stream for it."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def _live(self, key: str) -> Optional[_Flight]:
+        flight = self._flights.get(key)
+        if flight is None or flight.abandoned or flight.task.done():
+            return None
+        return flight
+
+    def join(self, key: str, transform: Optional[Callable[[dict], dict]] = None) -> Optional[Subscription]:
+        """Subscribe to the live flight for key, or None if there is none."""
+        flight = self._live(key)
+        if flight is None:
+            return None
+        self._stats["followers"] += 1
+        return Subscription(flight, transform)
+
+    def start(
+        self,
+        key: Optional[str],
+        source: AsyncIterator[dict],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Subscription:
+        """Run source as a new flight and subscribe to it. With a key, later callers can join it;
+        on_done is called once the flight ends, however it ends (even if cancelled before it started)."""
+        flight = _Flight(source)
+        if on_done is not None:
+            flight.task.add_done_callback(lambda _t: on_done())
+        if key is not None:
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t: self._forget(key, flight))
+            self._stats["leaders"] += 1
+        return Subscription(flight)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._flights)
+        total = stats["leaders"] + stats["followers"]
+        stats["coalesced_rate"] = round(stats["followers"] / total, 4) if total else 0.0
+        return stats
+
+
+coalescer = Coalescer()
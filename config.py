@@ -1,15 +1,12 @@
 """Application settings loaded from environment."""
 
 import os
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Lazy LLM singleton (import lazily to avoid loading langchain at config import)
-_llm = None
-
 
 class Settings:
     """Settings from env (and .env)."""
@@ -28,14 +25,163 @@ class Settings:
     # MCP tool URL (no trailing slash in env; code adds / when needed)
     mcp_tool_rag_url: Optional[str] = os.getenv("MCP_TOOL_RAG_URL")
 
+    # Extra RAG shards "name=url,name2=url2", fanned out alongside MCP_TOOL_RAG_URL (server "tool_rag")
+    mcp_tool_rag_urls: str = os.getenv("MCP_TOOL_RAG_URLS", "")
+    # Router keywords per shard "name=visa|salary,name2=project"; shards without keywords always take part
+    rag_route_keywords: str = os.getenv("RAG_ROUTE_KEYWORDS", "")
+    rag_shard_timeout_s: float = float(os.getenv("RAG_SHARD_TIMEOUT_S", "10"))
+    rag_merge_max_tokens: int = int(os.getenv("RAG_MERGE_MAX_TOKENS", "3000"))
+
     # OpenAI (used by orchestrator; often set by LangChain)
     openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+    # Per-stage LLM clients (intent_gate, rewrite, judge, llm_call, summary): each stage has its own model,
+    # HTTP connection pool, concurrency limit and timeout. LLM_STAGE_*: "intent_gate=gpt-4.1-nano,judge=..."
+    # overrides the default per stage; concurrency 0 means the stage's connection pool size
+    llm_stage_models: str = os.getenv("LLM_STAGE_MODELS", "")
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    llm_stage_max_connections: str = os.getenv("LLM_STAGE_MAX_CONNECTIONS", "")
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+    llm_stage_concurrency: str = os.getenv("LLM_STAGE_CONCURRENCY", "")
+    llm_timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", "60"))
+    llm_stage_timeouts: str = os.getenv("LLM_STAGE_TIMEOUTS", "")
+
     # Default timeouts for MCP tool calls (seconds)
     tools_timeout_s: float = float(os.getenv("TOOLS_TIMEOUT_S", "60"))
     invoke_timeout_s: float = float(os.getenv("INVOKE_TIMEOUT_S", "120"))
 
+    # Admission control for answer pipelines (SSE endpoint and MCP answer_question)
+    admission_max_in_flight: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+    admission_max_queue: int = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+    admission_max_queue_per_session: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_SESSION", "4"))
+    admission_queue_timeout_s: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "30"))
+    admission_queue_event_s: float = float(os.getenv("ADMISSION_QUEUE_EVENT_S", "1"))
+
+    # Per-request deadline budget. Gate/rewrite LLM calls keep BUDGET_ANSWER_RESERVE_S for the graph
+    # (else they are skipped); judge and tool calls are skipped below their minimum remaining budget
+    request_budget_s: float = float(os.getenv("REQUEST_BUDGET_S", "60"))
+    budget_answer_reserve_s: float = float(os.getenv("BUDGET_ANSWER_RESERVE_S", "15"))
+    budget_min_judge_s: float = float(os.getenv("BUDGET_MIN_JUDGE_S", "8"))
+    budget_min_tool_s: float = float(os.getenv("BUDGET_MIN_TOOL_S", "8"))
+
+    # Agent registry: refresh MCP tool lists in the background after this many seconds; prewarm on startup
+    agent_cache_ttl_s: float = float(os.getenv("AGENT_CACHE_TTL_S", "300"))
+    agent_prewarm: bool = os.getenv("AGENT_PREWARM", "true").lower() == "true"
+
+    # Pooled MCP sessions for tool calls (warm, initialized sessions per server; shared keep-alive pool)
+    mcp_pool_enabled: bool = os.getenv("MCP_POOL_ENABLED", "true").lower() == "true"
+    mcp_pool_max_sessions: int = int(os.getenv("MCP_POOL_MAX_SESSIONS", "4"))
+    mcp_pool_max_in_flight: int = int(os.getenv("MCP_POOL_MAX_IN_FLIGHT", "8"))
+    mcp_pool_idle_ttl_s: float = float(os.getenv("MCP_POOL_IDLE_TTL_S", "120"))
+    mcp_pool_health_check_s: float = float(os.getenv("MCP_POOL_HEALTH_CHECK_S", "30"))
+    mcp_pool_max_connections: int = int(os.getenv("MCP_POOL_MAX_CONNECTIONS", "20"))
+
+    # Tool-result cache (tool name + args, minus request_id/session_id). TOOL_CACHE_TOOL_TTLS: "search=600,other=0"
+    # (0 opts a tool out); TOOL_CACHE_TOOLS: comma list to cache only those tools (empty = all)
+    tool_cache_enabled: bool = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    tool_cache_ttl_s: float = float(os.getenv("TOOL_CACHE_TTL_S", "300"))
+    tool_cache_tool_ttls: str = os.getenv("TOOL_CACHE_TOOL_TTLS", "")
+    tool_cache_tools: str = os.getenv("TOOL_CACHE_TOOLS", "")
+    tool_cache_max_bytes: int = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+    # Token-budgeted context: compact llm_call history and dedupe/rank judge evidence.
+    # CONTEXT_TOKENIZER: "approx" (~4 chars/token) or "tiktoken" (exact, if installed)
+    context_manager_enabled: bool = os.getenv("CONTEXT_MANAGER_ENABLED", "true").lower() == "true"
+    context_tokenizer: str = os.getenv("CONTEXT_TOKENIZER", "approx")
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+    evidence_max_tokens: int = int(os.getenv("EVIDENCE_MAX_TOKENS", "3000"))
+    evidence_chunk_tokens: int = int(os.getenv("EVIDENCE_CHUNK_TOKENS", "200"))
+    evidence_dedupe_threshold: float = float(os.getenv("EVIDENCE_DEDUPE_THRESHOLD", "0.8"))
+
+    # Pipeline: run EntityRewrite concurrently with IntentGate (rewrite is cancelled on smalltalk)
+    speculative_rewrite: bool = os.getenv("SPECULATIVE_REWRITE", "true").lower() == "true"
+
+    # IntentGate local fast path (phrase trie + LRU of recent decisions) before the LLM classifier
+    intent_gate_fast_path: bool = os.getenv("INTENT_GATE_FAST_PATH", "true").lower() == "true"
+    intent_gate_lru_size: int = int(os.getenv("INTENT_GATE_LRU_SIZE", "1024"))
+
+    # Concurrent identical questions (normalized) share one in-flight pipeline
+    coalesce_requests: bool = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+    # Stream llm_call tokens as answer_delta SSE events (final answer event stays authoritative)
+    stream_answer_tokens: bool = os.getenv("STREAM_ANSWER_TOKENS", "true").lower() == "true"
+
+    # Opt-in micro-batching of concurrent IntentGate / judge LLM calls into one multi-item prompt
+    microbatch_enabled: bool = os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+    microbatch_window_ms: float = float(os.getenv("MICROBATCH_WINDOW_MS", "15"))
+    microbatch_max_items: int = int(os.getenv("MICROBATCH_MAX_ITEMS", "8"))
+
+    # Background LangSmith feedback queue (one shared client, batched submits, spooled on shutdown)
+    feedback_batch_size: int = int(os.getenv("FEEDBACK_BATCH_SIZE", "20"))
+    feedback_flush_interval_s: float = float(os.getenv("FEEDBACK_FLUSH_INTERVAL_S", "2"))
+    feedback_queue_max: int = int(os.getenv("FEEDBACK_QUEUE_MAX", "1000"))
+    feedback_max_retries: int = int(os.getenv("FEEDBACK_MAX_RETRIES", "5"))
+    feedback_retry_backoff_s: float = float(os.getenv("FEEDBACK_RETRY_BACKOFF_S", "1"))
+    feedback_shutdown_timeout_s: float = float(os.getenv("FEEDBACK_SHUTDOWN_TIMEOUT_S", "5"))
+    feedback_spool_path: str = os.getenv("FEEDBACK_SPOOL_PATH", ".feedback_spool.jsonl")
+
+    # Bind the port first and import LangChain / LangGraph / MCP in a background warm-up;
+    # false finishes warm-up before serving
+    lazy_startup: bool = os.getenv("LAZY_STARTUP", "true").lower() == "true"
+
+    # Hedged LLM calls: past the stage's latency percentile (rolling window of HEDGE_WINDOW calls, active
+    # after HEDGE_MIN_SAMPLES), fire one duplicate and keep the first reply. HEDGE_STAGE_PERCENTILES:
+    # "judge=0.9,llm_call=0.99" overrides HEDGE_PERCENTILE per stage; HEDGE_BUDGET_PER_MIN caps duplicates
+    hedge_enabled: bool = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    hedge_percentile: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    hedge_stage_percentiles: str = os.getenv("HEDGE_STAGE_PERCENTILES", "")
+    hedge_min_samples: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    hedge_window: int = int(os.getenv("HEDGE_WINDOW", "200"))
+    hedge_budget_per_min: int = int(os.getenv("HEDGE_BUDGET_PER_MIN", "30"))
+
+    # Per-MCP-server circuit breakers on tool discovery and tool calls: open (fail fast) when at least
+    # BREAKER_ERROR_RATE of the last BREAKER_WINDOW calls (min BREAKER_MIN_CALLS) failed or took
+    # >= BREAKER_SLOW_CALL_S; after BREAKER_OPEN_S let BREAKER_HALF_OPEN_PROBES calls through to test it
+    breaker_enabled: bool = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+    breaker_window: int = int(os.getenv("BREAKER_WINDOW", "20"))
+    breaker_min_calls: int = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+    breaker_error_rate: float = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    breaker_slow_call_s: float = float(os.getenv("BREAKER_SLOW_CALL_S", "10"))
+    breaker_open_s: float = float(os.getenv("BREAKER_OPEN_S", "30"))
+    breaker_half_open_probes: int = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+    # Warm-state snapshot (tool schemas + caches) for scale-from-zero cold starts; empty path disables
+    warm_state_path: str = os.getenv("WARM_STATE_PATH", ".warm_state.jsonl.gz")
+    warm_state_save_interval_s: float = float(os.getenv("WARM_STATE_SAVE_INTERVAL_S", "300"))
+    warm_state_max_age_s: float = float(os.getenv("WARM_STATE_MAX_AGE_S", "86400"))
+
+    # Emit a per-request "timing" SSE event (stage durations) before the done event
+    sse_timing_event: bool = os.getenv("SSE_TIMING_EVENT", "false").lower() == "true"
+
+    # Per-request profiling of stream-answer (PROFILE_SAMPLE_RATE of requests, or an "X-Profile: 1" header when
+    # PROFILE_ALLOW_HEADER): per coroutine / stage / graph node wall and CPU time, event-loop stalls and
+    # sampled loop stacks (collapsed, for flamegraphs), written to PROFILE_DIR (newest PROFILE_MAX_FILES kept)
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    profile_allow_header: bool = os.getenv("PROFILE_ALLOW_HEADER", "false").lower() == "true"
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    profile_stall_ms: float = float(os.getenv("PROFILE_STALL_MS", "100"))
+    profile_max_files: int = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+    # Batch answering (POST /orchestrator/batch-answer, MCP answer_questions): questions per request and
+    # max concurrent questions per batch (each also takes an admission slot under the batch's own key)
+    batch_max_questions: int = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+    batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+    # Session memory: rolling summary + last SESSION_MEMORY_TURNS turns per session_id, fed to rewrite and
+    # the graph for follow-ups (byte-bounded LRU, idle TTL); SESSION_MEMORY_MAX_BYTES 0 disables
+    session_memory_max_bytes: int = int(os.getenv("SESSION_MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+    session_memory_ttl_s: float = float(os.getenv("SESSION_MEMORY_TTL_S", "1800"))
+    session_memory_turns: int = int(os.getenv("SESSION_MEMORY_TURNS", "3"))
+    session_turn_max_tokens: int = int(os.getenv("SESSION_TURN_MAX_TOKENS", "200"))
+    session_summary_max_tokens: int = int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", "300"))
+
+    # Answer cache (LRU + TTL) keyed on the normalized rewritten question; size 0 disables
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    answer_cache_ttl_s: float = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+    answer_cache_raw_query: bool = os.getenv("ANSWER_CACHE_RAW_QUERY", "true").lower() == "true"
+
     @staticmethod
     def _server_dict(name: str, url: str) -> dict:
         """Build a single-server config for MultiServerMCPClient."""
@@ -43,21 +189,25 @@ class Settings:
 
     @property
     def rag_server_config(self) -> dict:
-        """RAG MCP server config from env; empty dict if not set."""
+        """RAG MCP server config from env (MCP_TOOL_RAG_URL plus MCP_TOOL_RAG_URLS shards); empty dict if not set."""
         url = (self.mcp_tool_rag_url or "").rstrip("/")
-        return self._server_dict("tool_rag", url)
+        servers = self._server_dict("tool_rag", url)
+        for name, shard_url in parse_pairs(self.mcp_tool_rag_urls).items():
+            servers.update(self._server_dict(name, shard_url))
+        return servers
 
 
-settings = Settings()
+def parse_pairs(spec: str) -> Dict[str, str]:
+    """Parse "a=x,b=y" into {"a": "x", "b": "y"} (values may contain "=")."""
+    pairs: Dict[str, str] = {}
+    for part in (spec or "").split(","):
+        name, sep, value = part.strip().partition("=")
+        if sep and name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
 
 
-def get_llm():
-    """Return a shared ChatOpenAI instance (lazy init)."""
-    global _llm
-    if _llm is None:
-        from langchain_openai import ChatOpenAI
-        _llm = ChatOpenAI(model=settings.openai_model, temperature=0)
-    return _llm
+settings = Settings()
 
 
 def has_langsmith_credentials() -> bool:
@@ -73,7 +223,7 @@ def get_langsmith_tags(
     tags = [
         f"mcp_name:{settings.mcp_name}",
         f"agent_model:{settings.openai_model}",
-        f"agent_has_rag:{bool(settings.mcp_tool_rag_url)}",
+        f"agent_has_rag:{bool(settings.rag_server_config)}",
     ]
     if settings.langchain_project:
         tags.append(f"langchain_project:{settings.langchain_project}")
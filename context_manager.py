@@ -0,0 +1,224 @@
+"""Token-budgeted context for llm_call and the judge: evidence dedupe/ranking and history compaction.
+
+Evidence keeps its original [E<n>] label (n = position of the tool output in the run) even when
+other outputs or chunks are dropped, so citations in answers stay valid.
+"""
+import hashlib
+import re
+from typing import Any, List, Optional, Sequence, Set, Tuple
+
+from config import settings
+from utils import extract_message_content
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_STOPWORDS = frozenset(
+    "a an the is are was were be to of in on for and or with what which who whom how does do did "
+    "has have had his her their its this that it as at by from about taixing bi s".split()
+)
+_DUPLICATE_NOTE = "(same content as an earlier tool result)"
+
+_stats = {"evidence_calls": 0, "evidence_tokens_in": 0, "evidence_tokens_out": 0,
+          "compactions": 0, "context_tokens_in": 0, "context_tokens_out": 0}
+_encoding: Any = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count: tiktoken when CONTEXT_TOKENIZER=tiktoken and available, else ~4 chars/token."""
+    global _encoding
+    if not text:
+        return 0
+    if settings.context_tokenizer == "tiktoken":
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model(settings.openai_model)
+            except Exception:
+                _encoding = False
+        if _encoding:
+            return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.casefold())
+
+
+def _shingles(words: Sequence[str], k: int = 3) -> Set[Tuple[str, ...]]:
+    if len(words) < k:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def _split_chunks(text: str, chunk_tokens: int) -> List[str]:
+    """Paragraph chunks; paragraphs longer than chunk_tokens are split into word windows."""
+    chunks: List[str] = []
+    for para in _PARAGRAPH_RE.split(text.strip()):
+        para = para.strip()
+        if not para:
+            continue
+        if count_tokens(para) <= chunk_tokens:
+            chunks.append(para)
+            continue
+        words = para.split()
+        step = max(1, chunk_tokens * 3 // 4)  # ~0.75 words per token
+        chunks.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+    return chunks
+
+
+def _is_duplicate(shingles: Set[Tuple[str, ...]], seen: List[Set[Tuple[str, ...]]], threshold: float) -> bool:
+    """True if shingles mostly overlap (containment >= threshold) with an already kept chunk.
+    A chunk without words has no shingles and is kept."""
+    for other in seen:
+        overlap = len(shingles & other)
+        if overlap and overlap / min(len(shingles), len(other)) >= threshold:
+            return True
+    return False
+
+
+def build_evidence(tool_contents: List[str], question: str, max_tokens: Optional[int] = None) -> Optional[str]:
+    """Judge evidence string '[E1] ...\\n[E2] ...' from tool outputs: overlapping chunks removed, chunks
+    ranked by term overlap with the question and kept within max_tokens. Labels follow tool output order."""
+    budget = settings.evidence_max_tokens if max_tokens is None else max_tokens
+    query_terms = {w for w in _words(question) if w not in _STOPWORDS}
+    candidates = []  # (score, label_index, chunk_order, text, tokens)
+    seen: List[Set[Tuple[str, ...]]] = []
+    tokens_in = 0
+    order = 0
+    for idx, content in enumerate(tool_contents):
+        if not content:
+            continue
+        tokens_in += count_tokens(content)
+        for chunk in _split_chunks(content, settings.evidence_chunk_tokens):
+            words = _words(chunk)
+            sh = _shingles(words)
+            if _is_duplicate(sh, seen, settings.evidence_dedupe_threshold):
+                continue
+            seen.append(sh)
+            score = len(query_terms.intersection(words)) / (1 + len(query_terms)) if query_terms else 0.0
+            candidates.append((score, idx, order, chunk, count_tokens(chunk)))
+            order += 1
+    if not candidates:
+        return None
+    kept = []
+    used = 0
+    for cand in sorted(candidates, key=lambda c: (-c[0], c[2])):
+        if used + cand[4] > budget and kept:
+            continue
+        kept.append(cand)
+        used += cand[4]
+    kept.sort(key=lambda c: c[2])  # back to original order
+    lines: List[str] = []
+    for _, idx, _, chunk, _ in kept:
+        label = f"[E{idx + 1}]"
+        if lines and lines[-1].startswith(label + " "):
+            lines[-1] += "\n" + chunk
+        else:
+            lines.append(f"{label} {chunk}")
+    evidence = "\n".join(lines)
+    _stats["evidence_calls"] += 1
+    _stats["evidence_tokens_in"] += tokens_in
+    _stats["evidence_tokens_out"] += count_tokens(evidence)
+    return evidence
+
+
+def merge_shard_results(results: List[Tuple[str, str]], question: str, max_tokens: Optional[int] = None) -> str:
+    """One evidence text from per-shard tool outputs [(shard, text)]: chunks deduplicated across shards,
+    reranked by term overlap with the question (shard order breaks ties) and kept within max_tokens.
+    Each chunk is tagged with its shard."""
+    budget = settings.rag_merge_max_tokens if max_tokens is None else max_tokens
+    query_terms = {w for w in _words(question) if w not in _STOPWORDS}
+    candidates = []  # (score, order, shard, text, tokens)
+    seen: List[Set[Tuple[str, ...]]] = []
+    for shard, text in results:
+        for chunk in _split_chunks(text or "", settings.evidence_chunk_tokens):
+            words = _words(chunk)
+            sh = _shingles(words)
+            if _is_duplicate(sh, seen, settings.evidence_dedupe_threshold):
+                continue
+            seen.append(sh)
+            score = len(query_terms.intersection(words)) / (1 + len(query_terms)) if query_terms else 0.0
+            candidates.append((score, len(candidates), shard, chunk, count_tokens(chunk)))
+    lines: List[str] = []
+    used = 0
+    for score, _, shard, chunk, tokens in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        if used + tokens > budget and lines:
+            continue
+        lines.append(f"[{shard}] {chunk}")
+        used += tokens
+    return "\n\n".join(lines)
+
+
+def _role(msg: Any) -> Optional[str]:
+    return getattr(msg, "type", None) or (msg.get("role") if isinstance(msg, dict) else None)
+
+
+def _with_content(msg: Any, content: str) -> Any:
+    if isinstance(msg, dict):
+        return {**msg, "content": content}
+    return msg.model_copy(update={"content": content})
+
+
+def compact_messages(messages: List[Any], max_tokens: Optional[int] = None) -> List[Any]:
+    """Messages to send to llm_call, within max_tokens where possible (graph state is not modified).
+
+    1. Superseded answers: earlier final AI answers (and their judge feedback) are dropped, except the
+       latest answer/feedback pair the retry refers to.
+    2. Repeated tool results are replaced by a short note.
+    3. If still over budget, tool results are cut to their leading chunks, longest first.
+    Tool-call / tool-result pairing is preserved."""
+    budget = settings.context_max_tokens if max_tokens is None else max_tokens
+    tokens_in = sum(count_tokens(extract_message_content(m)) for m in messages)
+    # 1. keep only the last final answer (AI without tool calls) and what follows it
+    finals = [i for i, m in enumerate(messages) if _role(m) == "ai" and not getattr(m, "tool_calls", None)]
+    drop: Set[int] = set()
+    if len(finals) > 1:
+        for i in finals[:-1]:
+            drop.add(i)
+            nxt = i + 1
+            if nxt < len(messages) and _role(messages[nxt]) in ("human", "user") and nxt != 0:
+                drop.add(nxt)  # judge feedback on the superseded answer
+    out: List[Any] = []
+    seen_tool: Set[str] = set()
+    for i, m in enumerate(messages):
+        if i in drop:
+            continue
+        if _role(m) == "tool":
+            key = hashlib.sha1(extract_message_content(m).encode("utf-8")).hexdigest()
+            if key in seen_tool:
+                m = _with_content(m, _DUPLICATE_NOTE)
+            seen_tool.add(key)
+        out.append(m)
+    # 3. cut the largest tool results until within budget
+    sizes = [count_tokens(extract_message_content(m)) for m in out]
+    total = sum(sizes)
+    if total > budget:
+        tool_idx = sorted((i for i, m in enumerate(out) if _role(m) == "tool"), key=lambda i: -sizes[i])
+        for i in tool_idx:
+            if total <= budget:
+                break
+            allowed = max(settings.evidence_chunk_tokens, sizes[i] - (total - budget))
+            kept, used = [], 0
+            for chunk in _split_chunks(extract_message_content(out[i]), settings.evidence_chunk_tokens):
+                t = count_tokens(chunk)
+                if used + t > allowed and kept:
+                    break
+                kept.append(chunk)
+                used += t
+            text = "\n\n".join(kept) + "\n\n(truncated)"
+            out[i] = _with_content(out[i], text)
+            total -= sizes[i] - count_tokens(text)
+            sizes[i] = count_tokens(text)
+    if len(out) != len(messages) or total < tokens_in:
+        _stats["compactions"] += 1
+    _stats["context_tokens_in"] += tokens_in
+    _stats["context_tokens_out"] += total
+    return out
+
+
+def get_context_stats() -> dict:
+    stats = dict(_stats)
+    for kind in ("evidence", "context"):
+        tin = stats[f"{kind}_tokens_in"]
+        stats[f"{kind}_saved_ratio"] = round(1 - stats[f"{kind}_tokens_out"] / tin, 4) if tin else 0.0
+    return stats
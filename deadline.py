@@ -0,0 +1,71 @@
+"""Per-request deadline budget shared by all pipeline stages."""
+import asyncio
+import contextlib
+import time
+from typing import Dict, Iterator, List, Optional
+
+import metrics
+import request_profiler
+
+
+class Deadline:
+    """Time budget for one request. Stages ask for their remaining share, record time consumed,
+    and note when they degraded (skipped or cut short) instead of failing the request."""
+
+    __slots__ = ("budget_s", "started_at", "expires_at", "stages", "degraded", "cancelled", "profile")
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_s
+        self.stages: Dict[str, float] = {}
+        self.degraded: List[str] = []
+        self.cancelled: List[str] = []  # stages interrupted by task cancellation
+        self.profile = request_profiler.current()  # set when this request is being profiled
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, min_s: float) -> bool:
+        """True if at least min_s of budget is left."""
+        return self.remaining() >= min_s
+
+    def timeout(self, cap: Optional[float] = None, *, reserve: float = 0.0) -> float:
+        """Seconds a stage may take: remaining budget minus reserve (for later stages), capped at cap."""
+        left = max(0.0, self.remaining() - reserve)
+        return min(left, cap) if cap is not None else left
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def degrade(self, stage: str) -> None:
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+            metrics.degraded.inc(stage)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Record wall time of the enclosed block under name (accumulates across calls; each call is
+        also observed in the stage latency histogram)."""
+        start = time.monotonic()
+        mark = self.profile.enter(name) if self.profile is not None else None
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            self.record(name, elapsed)
+            metrics.stage_seconds.observe(name, elapsed)
+            if mark is not None:
+                self.profile.exit(mark)
+
+    def report(self) -> dict:
+        return {
+            "budget_s": self.budget_s,
+            "elapsed_s": round(time.monotonic() - self.started_at, 3),
+            "remaining_s": round(self.remaining(), 3),
+            "stages": {k: round(v, 3) for k, v in self.stages.items()},
+            "degraded": list(self.degraded),
+        }
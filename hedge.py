@@ -0,0 +1,155 @@
+"""Hedged LLM calls: fire one duplicate request when a call runs past its stage's latency percentile.
+
+Each stage (intent_gate, rewrite, judge, llm_call, ...) keeps a rolling window of recent call
+latencies. Once a call has been running longer than the stage's HEDGE_PERCENTILE latency, a second
+identical call starts; the first to succeed wins and the other is cancelled. Hedges are capped by a
+per-minute budget, so a slow upstream cannot double our traffic.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from config import parse_pairs, settings
+
+T = TypeVar("T")
+
+
+class _StageLatency:
+    """Rolling window of call latencies for one stage, plus hedge counters."""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_skips": 0}
+
+    def threshold(self, percentile: float) -> Optional[float]:
+        """Latency at percentile of the window, or None until HEDGE_MIN_SAMPLES calls were seen."""
+        if len(self.samples) < max(1, settings.hedge_min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(percentile * len(ordered)) - 1))]
+
+
+class Hedger:
+    """Per-stage latency windows and the shared per-minute hedge budget."""
+
+    def __init__(self):
+        self._stages: Dict[str, _StageLatency] = {}
+        self._hedges: Deque[float] = deque()  # start times of hedges in the last minute
+        self._percentiles = {k: float(v) for k, v in parse_pairs(settings.hedge_stage_percentiles).items()}
+
+    def _stage(self, name: str) -> _StageLatency:
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _StageLatency(settings.hedge_window)
+        return stage
+
+    def _take_budget(self) -> bool:
+        now = time.monotonic()
+        while self._hedges and self._hedges[0] <= now - 60.0:
+            self._hedges.popleft()
+        if len(self._hedges) >= settings.hedge_budget_per_min:
+            return False
+        self._hedges.append(now)
+        return True
+
+    async def call(
+        self,
+        stage: str,
+        make_call: Callable[[bool], Awaitable[T]],
+        committed: Optional[asyncio.Event] = None,
+    ) -> T:
+        """Run make_call(False); past the stage threshold, race it against make_call(True) (the hedge).
+        committed (e.g. set on the first streamed token) means the primary is already answering: it is
+        not hedged, and a running hedge is dropped as soon as the primary commits."""
+        lat = self._stage(stage)
+        lat.stats["calls"] += 1
+        threshold = lat.threshold(self._percentiles.get(stage, settings.hedge_percentile))
+        started = time.monotonic()
+        primary = asyncio.ensure_future(make_call(False))
+        tasks = {primary}
+        commit: Optional[asyncio.Future] = None
+        try:
+            if threshold is None:
+                result = await primary
+                lat.samples.append(time.monotonic() - started)
+                return result
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if done or (committed is not None and committed.is_set()):
+                result = await primary
+                lat.samples.append(time.monotonic() - started)
+                return result
+            if not self._take_budget():
+                lat.stats["budget_skips"] += 1
+                result = await primary
+                lat.samples.append(time.monotonic() - started)
+                return result
+            lat.stats["hedged"] += 1
+            hedge_started = time.monotonic()
+            hedge = asyncio.ensure_future(make_call(True))
+            tasks.add(hedge)
+            commit = asyncio.ensure_future(committed.wait()) if committed is not None else None
+            while True:
+                done, _ = await asyncio.wait(
+                    tasks | ({commit} if commit is not None else set()), return_when=asyncio.FIRST_COMPLETED,
+                )
+                if commit is not None and commit in done:
+                    # Fired once; waiting on it again would return at once on every loop
+                    done.discard(commit)
+                    commit = None
+                    if not primary.done():
+                        # The primary started streaming first: it is the answer the client sees
+                        hedge.cancel()
+                        tasks.discard(hedge)
+                        result = await primary
+                        lat.samples.append(time.monotonic() - started)
+                        return result
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None or not tasks:
+                        # First success wins; if both failed, the last error is raised
+                        if task is hedge and task.exception() is None:
+                            lat.stats["hedge_wins"] += 1
+                        lat.samples.append(time.monotonic() - (hedge_started if task is hedge else started))
+                        return task.result()
+        finally:
+            for task in tasks | ({commit} if commit is not None else set()):
+                task.cancel()
+
+    def stats(self) -> dict:
+        out = {"enabled": settings.hedge_enabled, "hedges_last_min": len(self._hedges),
+               "budget_per_min": settings.hedge_budget_per_min}
+        for name, lat in self._stages.items():
+            calls, hedged = lat.stats["calls"], lat.stats["hedged"]
+            threshold = lat.threshold(self._percentiles.get(name, settings.hedge_percentile))
+            out[name] = {
+                **lat.stats,
+                "hedge_rate": round(hedged / calls, 4) if calls else 0.0,
+                "win_rate": round(lat.stats["hedge_wins"] / hedged, 4) if hedged else 0.0,
+                "threshold_s": round(threshold, 3) if threshold is not None else None,
+            }
+        return out
+
+
+hedger = Hedger()
+
+
+def tag_hedge(config: dict, is_hedge: bool) -> dict:
+    """LLM run config, tagged "hedge" for the duplicate call (visible in LangSmith)."""
+    return {**config, "tags": [*(config.get("tags") or []), "hedge"]} if is_hedge else config
+
+
+async def hedged(
+    stage: str,
+    make_call: Callable[[bool], Awaitable[T]],
+    committed: Optional[asyncio.Event] = None,
+) -> T:
+    """hedger.call when HEDGE_ENABLED, else a single make_call(False)."""
+    if not settings.hedge_enabled:
+        return await make_call(False)
+    return await hedger.call(stage, make_call, committed)
+
+
+def get_hedge_stats() -> dict:
+    return hedger.stats()
@@ -1,7 +1,19 @@
-"""IntentGate: agent-based smalltalk detection → free reply."""
-from typing import Optional
+"""IntentGate: agent-based smalltalk detection → free reply.
 
-from config import get_langsmith_tags, get_llm
+A local fast path (phrase trie + LRU of recent decisions) answers the obvious
+smalltalk / obvious real-question cases without an LLM call; only ambiguous
+messages fall back to INTENT_GATE_PROMPT.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import get_langsmith_tags, settings
+from deadline import Deadline
+from hedge import hedged, tag_hedge
+from llm_pool import llm_pool
+from microbatch import MicroBatcher
+from utils import normalize_question
 
 INTENT_GATE_PROMPT = """You are an intent classifier. Reply with YES or NO on the first line.
 If YES (message is only smalltalk/greeting with no real question), add a second line: a brief friendly first-person reply as Taixing Bi. Use this line: "Feel free to ask me about my experience, visa status, skills, or background!" (you may add a short greeting before it if you like).
@@ -12,27 +24,210 @@ NO = asks for specific info, or a real request, or is mixed (e.g. greeting + que
 User message:
 """
 
+FAST_PATH_REPLY = "Hi! Feel free to ask me about my experience, visa status, skills, or background!"
+
+# Greeting / smalltalk phrases (normalized: lowercase, no punctuation, apostrophes dropped)
+SMALLTALK_PHRASES = [
+    "hi", "hii", "hiya", "hello", "hey", "heya", "yo", "howdy", "greetings", "sup",
+    "whats up", "what is up", "wassup", "whatsup",
+    "how are you", "how are you doing", "how r u", "how are u", "how is it going",
+    "hows it going", "how do you do", "hows your day", "how is your day",
+    "good morning", "good afternoon", "good evening", "good day", "morning", "evening",
+    "nice to meet you", "pleased to meet you", "thanks", "thank you",
+]
+# Tokens that may accompany a greeting without changing intent ("hi there taixing")
+FILLER_TOKENS = frozenset([
+    "there", "all", "everyone", "again", "taixing", "bi", "friend", "buddy", "man",
+    "mate", "sir", "so", "and", "oh", "well", "today", "very", "much", "doing",
+])
+# Any of these means the message asks for real information
+TOPIC_TOKENS = frozenset([
+    "visa", "sponsor", "sponsorship", "status", "salary", "pay", "compensation",
+    "experience", "skill", "skills", "background", "education", "degree", "work",
+    "worked", "job", "jobs", "role", "company", "project", "projects", "resume",
+    "cv", "python", "stack", "location", "relocate", "remote", "available",
+    "availability", "expected", "years", "tell", "describe", "explain", "why",
+    "where", "when", "which", "who",
+])
+# Question words that make a message a real question unless a greeting phrase covers them ("how are you")
+QUESTION_TOKENS = frozenset([
+    "what", "whats", "how", "hows", "can", "could", "would", "do", "does", "did",
+])
+
+_END = "$"
+
+# Counters: fast-path decisions, LRU hits, LLM fallbacks
+_stats: Dict[str, int] = {"fast_yes": 0, "fast_no": 0, "lru_hits": 0, "llm_fallbacks": 0}
+_decisions: "OrderedDict[str, Optional[str]]" = OrderedDict()
+_batcher = MicroBatcher(
+    "intent_gate",
+    INTENT_GATE_PROMPT.rsplit("User message:", 1)[0].strip(),
+    validate=lambda reply: reply.strip().upper().startswith(("YES", "NO")),
+)
+
+
+def _build_trie(phrases: List[str]) -> dict:
+    root: dict = {}
+    for phrase in phrases:
+        node = root
+        for tok in phrase.split():
+            node = node.setdefault(tok, {})
+        node[_END] = True
+    return root
+
+
+_TRIE = _build_trie(SMALLTALK_PHRASES)
+
+
+def classify_smalltalk(normalized: str, question_mark: bool = False) -> Tuple[Optional[bool], float]:
+    """Local classifier over a normalized message. Returns (is_smalltalk, confidence).
+    question_mark: the raw message contained "?" (normalization drops punctuation).
+    NO needs positive evidence (a topic token, or a question word / "?" beyond the greeting);
+    is_smalltalk is None when the input is ambiguous and the LLM should decide."""
+    tokens = normalized.split()
+    if not tokens:
+        return None, 0.0
+    if any(t in TOPIC_TOKENS for t in tokens):
+        return False, 1.0
+    covered = 0
+    greeted = False
+    asks = False
+    i = 0
+    while i < len(tokens):
+        node, j, match_end = _TRIE, i, 0
+        while j < len(tokens) and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if _END in node:
+                match_end = j
+        if match_end:
+            covered += match_end - i
+            greeted = True
+            i = match_end
+            continue
+        if tokens[i] in FILLER_TOKENS:
+            covered += 1
+        elif tokens[i] in QUESTION_TOKENS:
+            asks = True
+        i += 1
+    confidence = covered / len(tokens)
+    if greeted and confidence == 1.0:
+        return True, 1.0
+    if asks or (question_mark and covered < len(tokens)):
+        return False, 1.0 - confidence
+    return None, confidence
+
+
+def _remember(key: str, reply: Optional[str]) -> None:
+    _decisions[key] = reply
+    _decisions.move_to_end(key)
+    while len(_decisions) > settings.intent_gate_lru_size:
+        _decisions.popitem(last=False)
+
+
+def export_decisions() -> List[list]:
+    """LRU decisions as [key, reply], least recently used first (warm-state snapshot)."""
+    return [[k, v] for k, v in _decisions.items()]
+
+
+def restore_decisions(entries: List[list]) -> int:
+    """Load exported decisions behind any made since startup. Returns count loaded."""
+    loaded = 0
+    for key, reply in reversed(entries[-settings.intent_gate_lru_size:]):
+        if key in _decisions:
+            continue
+        _decisions[key] = reply
+        _decisions.move_to_end(key, last=False)
+        loaded += 1
+    while len(_decisions) > settings.intent_gate_lru_size:
+        _decisions.popitem(last=False)
+    return loaded
+
+
+def get_intent_gate_stats() -> dict:
+    """Return fast-path counters, the share of gate calls that skipped the LLM, and micro-batch stats."""
+    stats = dict(_stats)
+    total = sum(stats.values())
+    stats["lru_size"] = len(_decisions)
+    stats["fast_path_rate"] = round((total - stats["llm_fallbacks"]) / total, 4) if total else 0.0
+    stats["microbatch"] = _batcher.stats()
+    return stats
+
+
+def fast_path_decision(query: str) -> Tuple[bool, Optional[str]]:
+    """Local IntentGate decision without an LLM call: (decided, reply). reply is the canned answer for
+    smalltalk, None for a real question; when not decided, get_canned_answer would ask the LLM."""
+    if not query or not query.strip():
+        return True, None
+    if not settings.intent_gate_fast_path:
+        return False, None
+    key = normalize_question(query)
+    if key in _decisions:
+        _stats["lru_hits"] += 1
+        _decisions.move_to_end(key)
+        return True, _decisions[key]
+    is_smalltalk, _confidence = classify_smalltalk(key, question_mark="?" in query)
+    if is_smalltalk is not None:
+        _stats["fast_yes" if is_smalltalk else "fast_no"] += 1
+        reply = FAST_PATH_REPLY if is_smalltalk else None
+        _remember(key, reply)
+        return True, reply
+    return False, None
+
 
 async def get_canned_answer(
     query: str,
     *,
     request_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    fast_path: bool = True,
 ) -> Optional[str]:
-    """If the agent classifies query as smalltalk, return its free reply; else None."""
-    if not query or not query.strip():
-        return None
-    llm = get_llm()
-    resp = await llm.ainvoke(
-        INTENT_GATE_PROMPT + query.strip(),
-        config={
-            "run_name": "intent_gate",
-            "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
-        },
-    )
-    text = (resp.content or "").strip()
+    """If the agent classifies query as smalltalk, return its free reply; else None.
+    With a deadline, an LLM call that would eat into the answer reserve is treated as NO.
+    fast_path=False: the caller already ran fast_path_decision and it did not decide."""
+    if fast_path:
+        decided, reply = fast_path_decision(query)
+        if decided:
+            return reply
+    key = normalize_question(query)
+    if settings.intent_gate_fast_path:
+        _stats["llm_fallbacks"] += 1
+
+    config = {
+        "run_name": "intent_gate",
+        "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
+    }
+
+    async def single() -> str:
+        resp = await hedged(
+            "intent_gate",
+            lambda is_hedge: llm_pool.ainvoke(
+                "intent_gate", INTENT_GATE_PROMPT + query.strip(), config=tag_hedge(config, is_hedge)
+            ),
+        )
+        return resp.content or ""
+
+    async def unbatched() -> Tuple[str, bool]:
+        return await single(), False
+
+    call = _batcher.submit(query.strip(), single) if settings.microbatch_enabled else unbatched()
+    if deadline is None:
+        text, batched = await call
+    else:
+        try:
+            text, batched = await asyncio.wait_for(
+                call, timeout=deadline.timeout(reserve=settings.budget_answer_reserve_s)
+            )
+        except asyncio.TimeoutError:
+            deadline.degrade("intent_gate")
+            return None
+    text = text.strip()
+    reply = None
     if text.upper().startswith("YES"):
         lines = [ln.strip() for ln in text.split("\n") if ln.strip()]
-        reply = lines[1] if len(lines) > 1 else None
-        return reply if reply else None
-    return None
+        reply = lines[1] if len(lines) > 1 and lines[1] else None
+    # A batched decision shared a prompt with other users' messages: used once, never remembered
+    if settings.intent_gate_fast_path and key and not batched:
+        _remember(key, reply)
+    return reply
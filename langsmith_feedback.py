@@ -1,12 +1,22 @@
-"""Submit feedback to LangSmith."""
+"""Submit feedback to LangSmith.
 
+Feedback from /feedback goes through FeedbackQueue: a background task that reuses one LangSmith client,
+sends in batches (by size or interval), retries failures with backoff, and on shutdown flushes what it
+can and spools the rest to a local JSONL file that is replayed on the next start.
+"""
+
+import asyncio
+import json
 import logging
-from typing import Literal, Optional
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Any, Deque, List, Literal, Optional
 
-from langsmith import Client
 from pydantic import BaseModel, Field
 
-from config import has_langsmith_credentials
+from config import settings
 
 LANGSMITH_FEEDBACK_KEY = "user_rating"
 
@@ -36,27 +46,202 @@ class FeedbackBody(BaseModel):
     comment: Optional[str] = Field(None, description="Additional free-text feedback (optional)")
 
 
-def submit_langsmith_feedback(
+_client: Any = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> Any:
+    """Shared LangSmith client (keeps its HTTP connection pool across submits). Imported on first
+    use to keep the langsmith SDK off the startup path."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from langsmith import Client
+            _client = Client()
+        return _client
+
+
+def _feedback_item(
     agent_graph_run_id: str,
     rating: Literal["thumbs_up", "thumbs_down"],
     feedback_type: Optional[str],
     comment: Optional[str],
-) -> bool:
-    """Submit feedback to LangSmith for the agent_graph run (root run from orchestrator).
-    Attaches feedback to the agent_graph node, not child runs. Returns True if sent, False if skipped."""
-    if not has_langsmith_credentials():
-        return False
+) -> dict:
+    # feedback_id is fixed up front so a retried or replayed submit cannot create a duplicate
+    return {
+        "feedback_id": str(uuid.uuid4()),
+        "run_id": agent_graph_run_id,
+        "score": 1.0 if rating == "thumbs_up" else -1.0,
+        "value": feedback_type or rating,
+        "comment": comment,
+        "attempts": 0,
+    }
+
+
+def _send(item: dict) -> None:
+    from langsmith.utils import LangSmithConflictError
+
     try:
-        client = Client()
-        score = 1.0 if rating == "thumbs_up" else -1.0
-        client.create_feedback(
-            run_id=agent_graph_run_id,
+        _get_client().create_feedback(
+            run_id=item["run_id"],
             key=LANGSMITH_FEEDBACK_KEY,
-            score=score,
-            value=feedback_type or rating,
-            comment=comment,
+            score=item["score"],
+            value=item["value"],
+            comment=item["comment"],
+            feedback_id=item["feedback_id"],
         )
+    except LangSmithConflictError:
+        pass  # already stored by an earlier attempt
+
+
+def _send_batch(batch: List[dict]) -> List[dict]:
+    """Submit items in one worker thread; returns the ones that failed."""
+    failed = []
+    for item in batch:
+        try:
+            _send(item)
+        except Exception as e:
+            item["error"] = str(e)[:200]
+            failed.append(item)
+    return failed
+
+
+class FeedbackQueue:
+    """Bounded in-memory queue drained by a background task started in the app lifespan."""
+
+    def __init__(self):
+        self._items: Deque[dict] = deque()
+        self._in_flight: List[dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0,
+                       "spooled": 0, "restored": 0}
+
+    def enqueue(
+        self,
+        agent_graph_run_id: str,
+        rating: Literal["thumbs_up", "thumbs_down"],
+        feedback_type: Optional[str],
+        comment: Optional[str],
+    ) -> bool:
+        """Queue feedback for background submit; False if the queue is full (feedback dropped)."""
+        return self._push(_feedback_item(agent_graph_run_id, rating, feedback_type, comment))
+
+    def _push(self, item: dict) -> bool:
+        if len(self._items) >= settings.feedback_queue_max:
+            self._stats["dropped"] += 1
+            logging.warning("feedback queue full; dropped feedback for run_id=%s", item["run_id"])
+            return False
+        self._items.append(item)
+        self._stats["enqueued"] += 1
+        if self._wakeup is not None and len(self._items) >= settings.feedback_batch_size:
+            self._wakeup.set()
         return True
-    except Exception as e:
-        logging.warning("langsmith create_feedback failed: %s", e)
-        return False
+
+    def start(self) -> None:
+        """Replay spooled feedback from a previous shutdown and start the sender task."""
+        if self._task is not None:
+            return
+        self._restore_spool()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.feedback_flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._drain(retry=True)
+
+    async def _drain(self, *, retry: bool) -> None:
+        """Send queued items batch by batch. With retry, failed items go back to the front of the
+        queue after an exponential backoff; otherwise they stay queued for the spool."""
+        while self._items:
+            n = min(settings.feedback_batch_size, len(self._items))
+            self._in_flight = [self._items.popleft() for _ in range(n)]
+            failed = await asyncio.to_thread(_send_batch, self._in_flight)
+            self._in_flight = []
+            self._stats["sent"] += n - len(failed)
+            requeue = []
+            for item in failed:
+                item["attempts"] += 1
+                if item["attempts"] > settings.feedback_max_retries:
+                    self._stats["failed"] += 1
+                    logging.warning("langsmith create_feedback gave up run_id=%s: %s", item["run_id"], item["error"])
+                else:
+                    requeue.append(item)
+            self._items.extendleft(reversed(requeue))
+            if requeue:
+                self._stats["retried"] += len(requeue)
+                if not retry:
+                    return
+                attempts = max(item["attempts"] for item in requeue)
+                await asyncio.sleep(min(60.0, settings.feedback_retry_backoff_s * 2 ** (attempts - 1)))
+
+    async def aclose(self) -> None:
+        """Stop the sender, flush within FEEDBACK_SHUTDOWN_TIMEOUT_S, spool whatever is left."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # A batch interrupted mid-send is requeued; its feedback_ids make a resend harmless
+        self._items.extendleft(reversed(self._in_flight))
+        self._in_flight = []
+        try:
+            await asyncio.wait_for(self._drain(retry=False), timeout=settings.feedback_shutdown_timeout_s)
+        except asyncio.TimeoutError:
+            self._items.extendleft(reversed(self._in_flight))
+            self._in_flight = []
+        self._write_spool()
+
+    def _write_spool(self) -> None:
+        path = settings.feedback_spool_path
+        if not self._items:
+            return
+        if not path:
+            self._stats["dropped"] += len(self._items)
+            logging.warning("feedback: %d unsent items dropped (FEEDBACK_SPOOL_PATH unset)", len(self._items))
+            self._items.clear()
+            return
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                for item in self._items:
+                    f.write(json.dumps(item) + "\n")
+            self._stats["spooled"] += len(self._items)
+            logging.info("feedback: spooled %d unsent items to %s", len(self._items), path)
+            self._items.clear()
+        except OSError as e:
+            logging.warning("feedback: spool write to %s failed: %s", path, e)
+
+    def _restore_spool(self) -> None:
+        path = settings.feedback_spool_path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+            os.remove(path)
+        except OSError as e:
+            logging.warning("feedback: spool read from %s failed: %s", path, e)
+            return
+        for line in lines:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if self._push(item):
+                self._stats["restored"] += 1
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["queued"] = len(self._items) + len(self._in_flight)
+        return stats
+
+
+feedback_queue = FeedbackQueue()
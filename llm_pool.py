@@ -0,0 +1,143 @@
+"""Stage-aware LLM clients: model, HTTP connection pool, concurrency limit and timeout per stage.
+
+Stages are the pipeline's LLM call sites: intent_gate, rewrite, judge (cheap, high-volume classification),
+llm_call (answer generation) and summary (session memory). Each stage lazily gets its own ChatOpenAI with
+its own httpx connection pool, so classification traffic never queues behind long answer generations,
+and can run on a smaller model (LLM_STAGE_MODELS).
+"""
+import asyncio
+import contextlib
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from config import parse_pairs, settings
+
+
+class _Stage:
+    """Client, concurrency slots and usage counters for one stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.model = parse_pairs(settings.llm_stage_models).get(name, settings.openai_model)
+        self.max_connections = max(1, int(parse_pairs(settings.llm_stage_max_connections).get(
+            name, settings.llm_max_connections)))
+        concurrency = int(parse_pairs(settings.llm_stage_concurrency).get(name, settings.llm_max_concurrency))
+        # More concurrent calls than pooled connections would only fail with pool timeouts
+        self.max_concurrency = min(concurrency, self.max_connections) if concurrency > 0 else self.max_connections
+        self.timeout_s = float(parse_pairs(settings.llm_stage_timeouts).get(name, settings.llm_timeout_s))
+        self.llm: Any = None
+        self.http_client: Any = None
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {"calls": 0, "errors": 0, "max_waiting": 0, "wait_s": 0.0, "call_s": 0.0,
+                      "input_tokens": 0, "output_tokens": 0}
+
+    def client(self) -> Any:
+        if self.llm is None:
+            import httpx
+            from langchain_openai import ChatOpenAI
+
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self.http_client = httpx.AsyncClient(limits=limits, timeout=self.timeout_s)
+            self.llm = ChatOpenAI(
+                model=self.model,
+                temperature=0,
+                timeout=self.timeout_s,
+                stream_usage=True,
+                http_async_client=self.http_client,
+            )
+        return self.llm
+
+
+class LLMPool:
+    """Registry of per-stage LLM clients; ainvoke() runs a call inside the stage's concurrency limit."""
+
+    def __init__(self):
+        self._stages: Dict[str, _Stage] = {}
+        self._override: Any = None
+
+    def _stage(self, name: str) -> _Stage:
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(name)
+        return stage
+
+    def get(self, stage: str) -> Any:
+        """The stage's chat model (shared; bind_tools / with_config on it return new runnables)."""
+        return self._override if self._override is not None else self._stage(stage).client()
+
+    def override(self, llm: Any) -> None:
+        """Serve every stage from llm (benchmarks and tests with a fake model); None restores."""
+        self._override = llm
+
+    @contextlib.asynccontextmanager
+    async def slot(self, stage: str) -> AsyncIterator[None]:
+        """Hold one of the stage's concurrency slots for the enclosed call, recording wait and call time."""
+        s = self._stage(stage)
+        queued = s.slots.locked()
+        if queued:
+            s.waiting += 1
+            s.stats["max_waiting"] = max(s.stats["max_waiting"], s.waiting)
+        queued_at = time.monotonic()
+        try:
+            await s.slots.acquire()
+        finally:
+            if queued:
+                s.waiting -= 1
+        started = time.monotonic()
+        s.stats["wait_s"] += started - queued_at
+        s.stats["calls"] += 1
+        s.in_flight += 1
+        try:
+            yield
+        except Exception:
+            s.stats["errors"] += 1
+            raise
+        finally:
+            s.in_flight -= 1
+            s.stats["call_s"] += time.monotonic() - started
+            s.slots.release()
+
+    def record_usage(self, stage: str, message: Any) -> None:
+        usage = getattr(message, "usage_metadata", None) or {}
+        s = self._stage(stage)
+        s.stats["input_tokens"] += usage.get("input_tokens", 0)
+        s.stats["output_tokens"] += usage.get("output_tokens", 0)
+
+    async def ainvoke(self, stage: str, input: Any, config: Optional[dict] = None, *, llm: Any = None) -> Any:
+        """llm (default: the stage's model).ainvoke(input, config) within the stage's limits."""
+        async with self.slot(stage):
+            message = await (llm if llm is not None else self.get(stage)).ainvoke(input, config=config)
+        self.record_usage(stage, message)
+        return message
+
+    async def aclose(self) -> None:
+        """Close the stages' HTTP connection pools (app shutdown)."""
+        for s in self._stages.values():
+            if s.http_client is not None:
+                await s.http_client.aclose()
+                s.http_client = None
+                s.llm = None
+
+    def stats(self) -> dict:
+        out = {}
+        for name, s in self._stages.items():
+            calls = s.stats["calls"]
+            out[name] = {
+                "model": s.model,
+                "max_connections": s.max_connections,
+                "max_concurrency": s.max_concurrency,
+                "timeout_s": s.timeout_s,
+                "in_flight": s.in_flight,
+                "waiting": s.waiting,
+                **s.stats,
+                "wait_s": round(s.stats["wait_s"], 3),
+                "call_s": round(s.stats["call_s"], 3),
+                "avg_call_s": round(s.stats["call_s"] / calls, 3) if calls else 0.0,
+            }
+        return out
+
+
+llm_pool = LLMPool()
@@ -1,44 +1,162 @@
 # main.py — MCP HTTP server exposing RAG tools
 import asyncio
 import contextlib
+import functools
 import json
 import logging
 import sys
+import uuid
 from pathlib import Path
-from typing import AsyncIterator, Optional
+from typing import AsyncIterator, List, Optional
 
 # Ensure project root is on sys.path (fixes ModuleNotFoundError when running via uvicorn --reload)
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import startup  # first, so startup timings count from here
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.types import Receive
 
+# Light modules only: LangChain / LangGraph / MCP (orchestrator, agent_graph, mcp_server, warm_state)
+# are imported by the background warm-up so the port binds first. See startup.HEAVY_MODULES.
+import metrics
+from admission import AdmissionRejected, admission
+from agent_answer_judge import get_judge_stats
+from answer_cache import answer_cache, invalidate_question
+from circuit_breaker import breakers
+from coalesce import Subscription, coalescer
 from config import has_langsmith_credentials, settings
-from langsmith_feedback import FEEDBACK_TYPES, FeedbackBody, submit_langsmith_feedback
-from mcp_server import mcp, mcp_app
-from orchestrator import stream_answer_query
+from context_manager import get_context_stats
+from hedge import get_hedge_stats
+from intent_gate import get_intent_gate_stats
+from langsmith_feedback import FEEDBACK_TYPES, FeedbackBody, feedback_queue
+from llm_pool import llm_pool
+from request_profiler import RequestProfile, get_profiler_stats, list_profiles, profile_path, should_profile
+from tool_cache import tool_cache
 
 SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 
+async def _watch_disconnect(receive: Receive, pipeline: asyncio.Task) -> None:
+    """Cancel pipeline when the client disconnects. Starlette only notices a disconnect on the next
+    write under ASGI spec >= 2.4, and a pipeline can go quiet for seconds (tools, judge)."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    if not pipeline.done():
+        metrics.client_disconnects.inc()
+        pipeline.cancel()
+
+
 def _sse_stream_answer_gen(
-    question: str,
-    session_id: Optional[str] = None,
-    request_id: Optional[str] = None,
+    events: Subscription,
+    receive: Optional[Receive] = None,
+    profile: Optional[RequestProfile] = None,
 ) -> AsyncIterator[str]:
-    """Async generator for POST stream-answer. Yields SSE events from stream_answer_query."""
+    """Async generator for POST stream-answer. Yields SSE events from a coalesced_answer_query stream.
+    The stream is consumed in its own task; with receive, a client disconnect cancels it (and with it the
+    pipeline: LLM, tool and judge calls included) instead of letting it finish for nobody. With a started
+    profile, the consuming task is profiled and the profile is written when the stream ends."""
+    async def _pipeline(out: asyncio.Queue):
+        try:
+            async for chunk in events:
+                out.put_nowait(chunk)
+        finally:
+            events.close()
+            out.put_nowait(None)
+
     async def _gen():
-        async for chunk in stream_answer_query(
-            question, session_id=session_id, request_id=request_id
-        ):
-            yield f"data: {json.dumps(chunk)}\n\n"
+        out: asyncio.Queue = asyncio.Queue()
+        pipeline = profile.create_task(_pipeline(out)) if profile is not None else asyncio.create_task(_pipeline(out))
+        watcher = asyncio.create_task(_watch_disconnect(receive, pipeline)) if receive is not None else None
+        try:
+            while (chunk := await out.get()) is not None:
+                yield f"data: {json.dumps(chunk)}\n\n"
+            await pipeline
+        finally:
+            # Synchronous cleanup first: on a disconnect every await below may be cancelled again
+            for task in (watcher, pipeline):
+                if task is not None and not task.done():
+                    task.cancel()
+            _close_stream(events, profile)
+            await asyncio.gather(*(t for t in (watcher, pipeline) if t is not None), return_exceptions=True)
     return _gen()
 
 
+def _close_stream(events: Subscription, profile: Optional[RequestProfile]) -> None:
+    """Leave the pipeline and stop profiling (the profile is then written by a task of its own).
+    Synchronous and idempotent."""
+    events.close()
+    if profile is not None and profile.stop():
+        profile.write_in_background()
+
+
+class _AnswerStreamResponse(StreamingResponse):
+    """SSE response that leaves the pipeline once the response is over, however it ends: sent, client
+    gone mid-stream, or client gone before the body generator first ran (its finally never runs then,
+    and Starlette skips background tasks on a disconnect). Leaving frees the pipeline's admission slot
+    unless other requests follow it."""
+
+    def __init__(self, content: AsyncIterator[str], events: Subscription, profile: Optional[RequestProfile], **kwargs):
+        super().__init__(content, **kwargs)
+        self.events = events
+        self.profile = profile
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _close_stream(self.events, self.profile)
+
+
+@contextlib.asynccontextmanager
+async def _runtime():
+    """Heavy startup/shutdown, entered by the background warm-up once HEAVY_MODULES are imported."""
+    import warm_state
+    from agent_graph import agent_registry, prewarm_agent
+    from mcp_pool import mcp_pool
+    from mcp_server import mcp
+    from session_memory import session_memory
+
+    # Tool schemas and caches from the previous run; the restored agent makes prewarm a cache hit
+    if await warm_state.load_snapshot():
+        startup.mark("warm_state_loaded")
+    prewarm = None
+    if settings.agent_prewarm:
+        # Tool discovery + graph compile in the background: readiness does not wait on slow MCP servers;
+        # an early request joins the same single-flight build via agent_registry (failures are logged)
+        prewarm = asyncio.create_task(prewarm_agent())
+        prewarm.add_done_callback(lambda t: None if t.cancelled() else startup.mark("agent_prewarmed"))
+    warm_state.start_saver()
+    try:
+        async with mcp.session_manager.run():
+            yield
+    finally:
+        if prewarm is not None and not prewarm.done():
+            prewarm.cancel()
+            await asyncio.gather(prewarm, return_exceptions=True)
+        await session_memory.aclose()
+        await warm_state.aclose()
+        await agent_registry.aclose()
+        await mcp_pool.aclose()
+
+
+_warmup = startup.Warmup()
+
+
 @contextlib.asynccontextmanager
 async def _lifespan(_app: FastAPI):
-    async with mcp.session_manager.run():
+    startup.mark("lifespan_start")
+    _warmup.start(startup.HEAVY_MODULES, _runtime)
+    if not settings.lazy_startup:
+        await _warmup.ready()
+    if has_langsmith_credentials():
+        feedback_queue.start()
+    try:
         yield
+    finally:
+        await _warmup.aclose()
+        await feedback_queue.aclose()
+        await llm_pool.aclose()
 
 
 app = FastAPI(
@@ -46,30 +164,101 @@ app = FastAPI(
     version=settings.app_version or "0.1.0",
     lifespan=_lifespan,
 )
+app.add_middleware(startup.FirstByteMiddleware)
 
 
 class StreamAnswerBody(BaseModel):
     question: str
-    session_id: Optional[str] = Field(None, description="Optional session id for LangSmith tags")
+    session_id: Optional[str] = Field(None, description="Optional session id for LangSmith tags and follow-up context")
     request_id: Optional[str] = Field(None, description="Optional request id; if provided, used as stream request_id")
 
 
 @app.post("/orchestrator/stream-answer")
-async def orchestrator_stream_answer_(body: StreamAnswerBody):
+async def orchestrator_stream_answer_(body: StreamAnswerBody, request: Request):
     """Stream the agent's answer as Server-Sent Events. Body: {"question": "..."}.
-    Events: request_id, state, rewrite, route, answer, error."""
-    return StreamingResponse(
-        _sse_stream_answer_gen(
-            body.question, session_id=body.session_id, request_id=body.request_id
-        ),
+    Events: request_id, state, rewrite, route, answer_delta, retract, answer (with cache: hit|miss), timing
+    (when SSE_TIMING_EVENT=true), error.
+    Returns 503 (queue full) or 429 (session over its queue share) when the request cannot be admitted.
+    Profiled requests (PROFILE_SAMPLE_RATE, or "X-Profile: 1" with PROFILE_ALLOW_HEADER) get an X-Profile-Id
+    response header naming the profile under /profiles."""
+    try:
+        await _warmup.ready()
+    except RuntimeError as e:
+        return JSONResponse(status_code=503, content={"status": "error", "message": str(e)})
+    from orchestrator import coalesced_answer_query
+
+    request_id, profile, headers = body.request_id, None, SSE_HEADERS
+    if should_profile(request.headers.get("x-profile")):
+        request_id = request_id or str(uuid.uuid4())
+        profile = RequestProfile(request_id)
+        headers = {**SSE_HEADERS, "X-Profile-Id": profile.id}
+        profile.start()
+    open_events = functools.partial(
+        coalesced_answer_query, body.question, session_id=body.session_id, request_id=request_id, admit=True
+    )
+    try:
+        # Joins an identical in-flight pipeline (no capacity used) or takes an admission slot, in one step
+        events = profile.run(open_events) if profile is not None else open_events()
+    except AdmissionRejected as e:
+        if profile is not None:
+            profile.stop()
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"status": "error", "message": e.message},
+            headers={"Retry-After": "1"},
+        )
+    return _AnswerStreamResponse(
+        _sse_stream_answer_gen(events, receive=request.receive, profile=profile),
+        events,
+        profile,
         media_type="text/event-stream",
-        headers=SSE_HEADERS,
+        headers=headers,
     )
 
 
+class BatchAnswerBody(BaseModel):
+    questions: List[str] = Field(..., description="Questions to answer; duplicates (normalized) are answered once")
+    concurrency: Optional[int] = Field(None, description="Max questions in flight (capped at BATCH_MAX_CONCURRENCY)")
+    batch_id: Optional[str] = Field(None, description="Optional batch id; per-question request_ids are <batch_id>-<index>")
+
+
+@app.post("/orchestrator/batch-answer")
+async def orchestrator_batch_answer(body: BatchAnswerBody):
+    """Answer a list of questions, streamed as NDJSON in completion order: one "result" line per unique
+    question (index, indices, answer or error, cache, elapsed_s), then a "summary" line with aggregate timing."""
+    if not body.questions or len(body.questions) > settings.batch_max_questions:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"questions must hold 1 to {settings.batch_max_questions} items"},
+        )
+    try:
+        await _warmup.ready()
+    except RuntimeError as e:
+        return JSONResponse(status_code=503, content={"status": "error", "message": str(e)})
+    from batch_answer import batch_answer_queries
+
+    async def _ndjson():
+        async for event in batch_answer_queries(body.questions, concurrency=body.concurrency, batch_id=body.batch_id):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+
+class InvalidateCacheBody(BaseModel):
+    question: Optional[str] = Field(None, description="Question (raw or rewritten) to invalidate; omit to clear the whole cache")
+
+
+@app.post("/orchestrator/answer-cache/invalidate")
+async def invalidate_answer_cache(body: InvalidateCacheBody):
+    """Drop cached answers for one question, or all cached answers."""
+    removed = invalidate_question(body.question)
+    return {"status": "ok", "removed": removed}
+
+
 @app.post("/feedback")
 async def submit_feedback(body: FeedbackBody):
-    """Submit feedback on an agent response (thumbs up/down, type, optional comment)."""
+    """Submit feedback on an agent response (thumbs up/down, type, optional comment).
+    Returns 503 when the feedback queue is full and the feedback was dropped."""
     if body.feedback_type and body.feedback_type not in FEEDBACK_TYPES:
         return {"status": "error", "message": f"feedback_type must be one of: {', '.join(sorted(FEEDBACK_TYPES))}"}
     agent_graph_run_id = body.agent_graph_run_id or body.request_id
@@ -82,26 +271,100 @@ async def submit_feedback(body: FeedbackBody):
         (body.comment or "")[:50] or None,
     )
     if agent_graph_run_id and has_langsmith_credentials():
-        await asyncio.to_thread(
-            submit_langsmith_feedback,
-            agent_graph_run_id=agent_graph_run_id,
+        # Sent to LangSmith by the background feedback queue
+        queued = feedback_queue.enqueue(
+            agent_graph_run_id,
             rating=body.rating,
             feedback_type=body.feedback_type,
             comment=body.comment,
         )
+        if not queued:
+            return JSONResponse(
+                status_code=503,
+                content={"status": "error", "message": "Feedback queue is full; please retry later"},
+            )
     return {"status": "ok", "message": "Feedback received"}
 
 
+def _component_stats() -> dict:
+    """Stats of every component; those owned by heavy modules appear once warm-up has imported them."""
+    stats = {
+        "intent_gate": get_intent_gate_stats(),
+        "judge": get_judge_stats(),
+        "answer_cache": answer_cache.stats(),
+        "tool_cache": tool_cache.stats(),
+        "context": get_context_stats(),
+        "admission": admission.stats(),
+        "coalescing": coalescer.stats(),
+        "feedback": feedback_queue.stats(),
+        "hedging": get_hedge_stats(),
+        "llm_stages": llm_pool.stats(),
+        "profiler": get_profiler_stats(),
+        "circuit_breakers": breakers.stats(),
+    }
+    if _warmup.is_ready:
+        import warm_state
+        from agent_graph import agent_registry
+        from batch_answer import get_batch_stats
+        from mcp_pool import mcp_pool
+        from orchestrator import get_speculation_stats
+        from rag_fanout import get_fanout_stats
+        from session_memory import session_memory
+
+        stats["speculation"] = get_speculation_stats()
+        stats["agent_registry"] = agent_registry.stats()
+        stats["mcp_pool"] = mcp_pool.stats()
+        stats["warm_state"] = warm_state.get_warm_state_stats()
+        stats["rag_fanout"] = get_fanout_stats()
+        stats["session_memory"] = session_memory.stats()
+        stats["batch"] = get_batch_stats()
+    return stats
+
+
 @app.get("/health")
 def health() -> dict:
-    """Return app and LangSmith config for health checks."""
+    """Return app and LangSmith config for health checks. Served during warm-up (ready: false)."""
     return {
         "status": "ok",
+        "ready": _warmup.is_ready,
         "app_version": settings.app_version,
         "mcp_name": settings.mcp_name,
         "langchain_project": settings.langchain_project,
         "langsmith_tracing": settings.langsmith_tracing,
         "langchain_endpoint": settings.langchain_endpoint,
+        **_component_stats(),
+        "startup": startup.report(),
     }
 
-app.mount("/mcp", mcp_app)
\ No newline at end of file
+
+@app.get("/profiles")
+def request_profiles():
+    """Written request profiles (newest first): id, request_id, wall/CPU time, stall count, file names."""
+    return {"profiles": list_profiles()}
+
+
+@app.get("/profiles/{name}")
+def request_profile_file(name: str):
+    """Download a profile file: <id>.json (summary) or <id>.folded (collapsed stacks for flamegraph tools)."""
+    path = profile_path(name)
+    if path is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "profile not found"})
+    media_type = "application/json" if name.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus text exposition: stage/request latency histograms, error counters, component stats."""
+    return PlainTextResponse(metrics.render(_component_stats()), media_type="text/plain; version=0.0.4")
+
+
+async def _mcp_asgi(scope, receive, send):
+    """/mcp: waits for warm-up (mcp_server import and its session manager) before dispatching."""
+    await _warmup.ready()
+    from mcp_server import mcp_app
+
+    await mcp_app(scope, receive, send)
+
+
+app.mount("/mcp", _mcp_asgi)
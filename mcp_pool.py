@@ -0,0 +1,291 @@
+"""Pooled, pre-initialized MCP client sessions for tool calls (streamable HTTP servers).
+
+MultiServerMCPClient opens a new session (HTTP connection + MCP initialize) per tool call.
+mcp_pool.intercept is registered as a tool interceptor and routes calls through a bounded
+set of warm sessions per server that share one keep-alive httpx client.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_HTTP_TRANSPORTS = ("http", "streamable_http", "streamable-http")
+
+
+class _PooledSession:
+    """One initialized ClientSession owned by a background task (anyio scopes must stay in one task)."""
+
+    def __init__(self, url: str, http_client: httpx.AsyncClient):
+        self.url = url
+        self.http_client = http_client
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.broken = False
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, timeout_s: float) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout_s)
+        except BaseException:
+            await self.aclose()
+            raise
+        if self.session is None:
+            raise self._error or RuntimeError(f"MCP session to {self.url} failed to start")
+
+    async def _run(self) -> None:
+        try:
+            async with streamable_http_client(self.url, http_client=self.http_client) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            if self.session is not None:
+                logger.warning("mcp pool: session to %s closed with error: %s", self.url, e)
+        finally:
+            self.session = None
+            self.broken = True
+            self._ready.set()
+
+    async def aclose(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            with contextlib.suppress(BaseException):
+                await asyncio.wait_for(self._task, timeout=5)
+
+
+class MCPSessionPool:
+    """Bounded pool of warm sessions for one MCP server.
+
+    Sessions are reused up to max_in_flight concurrent calls each; new sessions are opened up to
+    max_sessions, after which callers wait. Sessions idle longer than idle_ttl_s are closed, and a
+    session idle longer than health_check_s is pinged before reuse."""
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        *,
+        max_sessions: int,
+        max_in_flight: int,
+        idle_ttl_s: float,
+        health_check_s: float,
+        max_connections: int,
+        timeout_s: float,
+    ):
+        self.name = name
+        self.url = url
+        self.headers = headers or {}
+        self.max_sessions = max(1, max_sessions)
+        self.max_in_flight = max(1, max_in_flight)
+        self.idle_ttl_s = idle_ttl_s
+        self.health_check_s = health_check_s
+        self.max_connections = max_connections
+        self.timeout_s = timeout_s
+        self._http: Optional[httpx.AsyncClient] = None
+        self._sessions: List[_PooledSession] = []
+        self._creating = 0
+        self._changed = asyncio.Event()  # replaced on every notify; waiters wake on the one they hold
+        self._closers: Set[asyncio.Task] = set()
+        self._stats = {
+            "calls": 0, "errors": 0, "waits": 0, "created": 0, "evicted": 0,
+            "health_failures": 0, "peak_in_flight": 0,
+        }
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                headers=self.headers,
+                follow_redirects=True,
+                timeout=httpx.Timeout(self.timeout_s, read=max(self.timeout_s, 300.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._http
+
+    def _close_later(self, ps: _PooledSession) -> None:
+        task = asyncio.create_task(ps.aclose())
+        self._closers.add(task)
+        task.add_done_callback(self._closers.discard)
+
+    def _evict(self) -> None:
+        """Drop broken sessions and idle ones past idle_ttl_s (caller holds the lock)."""
+        now = time.monotonic()
+        keep = []
+        for ps in self._sessions:
+            if ps.in_flight == 0 and (ps.broken or now - ps.last_used > self.idle_ttl_s):
+                self._stats["evicted"] += 1
+                self._close_later(ps)
+            else:
+                keep.append(ps)
+        self._sessions = keep
+
+    def _in_flight(self) -> int:
+        return sum(ps.in_flight for ps in self._sessions)
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _acquire(self) -> _PooledSession:
+        # Slot bookkeeping is synchronous (no await between check and update), so no lock is needed
+        while True:
+            self._evict()
+            ready = [ps for ps in self._sessions if not ps.broken and ps.in_flight < self.max_in_flight]
+            if ready:
+                ps = min(ready, key=lambda s: s.in_flight)
+                ps.in_flight += 1
+                self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight())
+                break
+            if len(self._sessions) + self._creating < self.max_sessions:
+                self._creating += 1
+                ps = None
+                break
+            self._stats["waits"] += 1
+            await self._changed.wait()
+        if ps is None:
+            return await self._open()
+        if ps.in_flight == 1 and time.monotonic() - ps.last_checked > self.health_check_s:
+            try:
+                await asyncio.wait_for(ps.session.send_ping(), timeout=5)
+                ps.last_checked = time.monotonic()
+            except BaseException as e:
+                # Cancelled callers too: the slot taken above must be given back before leaving
+                if isinstance(e, Exception):
+                    self._stats["health_failures"] += 1
+                    ps.broken = True
+                self._release(ps)
+                if not isinstance(e, Exception):
+                    raise
+                return await self._acquire()
+        return ps
+
+    async def _open(self) -> _PooledSession:
+        ps = _PooledSession(self.url, self._http_client())
+        try:
+            await ps.start(self.timeout_s)
+        except BaseException:
+            self._creating -= 1
+            self._notify()
+            raise
+        self._creating -= 1
+        ps.in_flight = 1
+        self._sessions.append(ps)
+        self._stats["created"] += 1
+        self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight())
+        return ps
+
+    def _release(self, ps: _PooledSession) -> None:
+        """Give back a slot. Synchronous, so it completes even in the finally of a cancelled call."""
+        ps.in_flight -= 1
+        ps.last_used = time.monotonic()
+        self._evict()
+        self._notify()
+
+    async def call_tool(self, name: str, args: Dict[str, Any]):
+        """Run tools/call on a pooled session. Transport failures retire the session."""
+        ps = await self._acquire()
+        self._stats["calls"] += 1
+        try:
+            return await ps.session.call_tool(
+                name, args, read_timeout_seconds=timedelta(seconds=self.timeout_s)
+            )
+        except Exception:
+            self._stats["errors"] += 1
+            ps.broken = True
+            raise
+        finally:
+            self._release(ps)
+
+    async def aclose(self) -> None:
+        sessions, self._sessions = self._sessions, []
+        await asyncio.gather(*(ps.aclose() for ps in sessions), return_exceptions=True)
+        if self._closers:
+            await asyncio.gather(*self._closers, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        in_flight = self._in_flight()
+        capacity = self.max_sessions * self.max_in_flight
+        stats.update({
+            "url": self.url,
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "in_flight": in_flight,
+            "capacity": capacity,
+            "utilization": round(in_flight / capacity, 4),
+        })
+        return stats
+
+
+class MCPSessionManager:
+    """Session pools keyed by MCP server name; used as a MultiServerMCPClient tool interceptor."""
+
+    def __init__(self):
+        self._pools: Dict[str, MCPSessionPool] = {}
+        self._closing: Set[asyncio.Task] = set()  # replaced pools being closed
+
+    def register(self, servers: dict) -> None:
+        """Create (or replace, if the URL changed) a pool for each streamable-HTTP server."""
+        for name, conn in servers.items():
+            if conn.get("transport") not in _HTTP_TRANSPORTS:
+                continue
+            pool = self._pools.get(name)
+            if pool is not None and pool.url == conn["url"]:
+                continue
+            if pool is not None:
+                task = asyncio.create_task(pool.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            self._pools[name] = MCPSessionPool(
+                name,
+                conn["url"],
+                conn.get("headers"),
+                max_sessions=settings.mcp_pool_max_sessions,
+                max_in_flight=settings.mcp_pool_max_in_flight,
+                idle_ttl_s=settings.mcp_pool_idle_ttl_s,
+                health_check_s=settings.mcp_pool_health_check_s,
+                max_connections=settings.mcp_pool_max_connections,
+                timeout_s=settings.tools_timeout_s,
+            )
+
+    async def intercept(self, request, handler):
+        """Tool interceptor: send the call over a pooled session (falls back to handler if unpooled)."""
+        pool = self._pools.get(request.server_name)
+        if pool is None:
+            return await handler(request)
+        return await pool.call_tool(request.name, request.args)
+
+    async def aclose(self) -> None:
+        pools, self._pools = list(self._pools.values()), {}
+        await asyncio.gather(*(p.aclose() for p in pools), *self._closing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+
+mcp_pool = MCPSessionManager()
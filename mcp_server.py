@@ -1,8 +1,12 @@
 """MCP server and orchestrator_stream_answer tool."""
+import json
+from typing import List, Optional
 
 from mcp.server import FastMCP
 from mcp.server.transport_security import TransportSecuritySettings
 
+from admission import AdmissionRejected
+from batch_answer import batch_answer_queries
 from config import settings
 from orchestrator import answer_query_sync, format_error
 
@@ -21,13 +25,27 @@ mcp = FastMCP(
 async def tool_mcp_answer(question: str) -> str:
     """Answer a question using RAG tools. Returns the full answer text."""
     try:
+        # Joining an identical in-flight pipeline costs no capacity; a new one waits for an admission slot
         return await answer_query_sync(
             question,
             tools_timeout_s=settings.tools_timeout_s,
             invoke_timeout_s=settings.invoke_timeout_s,
+            admit=True,
         )
+    except AdmissionRejected as e:
+        return f"Error: {e.message}"
     except Exception as e:
         return format_error(e)
 
 
+@mcp.tool(name="answer_questions")
+async def tool_mcp_answer_batch(questions: List[str], concurrency: Optional[int] = None) -> str:
+    """Answer a list of questions (duplicates answered once) with bounded concurrency. Returns NDJSON:
+    one result line per unique question in completion order, then a summary line with aggregate timing."""
+    if not questions or len(questions) > settings.batch_max_questions:
+        return f"Error: questions must hold 1 to {settings.batch_max_questions} items"
+    lines = [json.dumps(event) async for event in batch_answer_queries(questions, concurrency=concurrency)]
+    return "\n".join(lines)
+
+
 mcp_app = mcp.streamable_http_app()
@@ -0,0 +1,113 @@
+"""In-process latency histograms and counters with Prometheus text exposition (no extra dependency).
+
+Observations are a bisect plus two in-place increments on preallocated lists, cheap enough to leave on.
+Component stats (caches, pools, admission, ...) are not duplicated here; they are read at scrape time.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Histogram:
+    """Histogram with one label; per-label bucket counts are allocated on first use."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List[float]] = {}  # label value → [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{_fmt(bound)}"}} {_fmt(cumulative)}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {_fmt(cumulative)}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-1]!r}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {_fmt(cumulative)}')
+        return lines
+
+    def snapshot(self) -> Dict[str, dict]:
+        """{label: {"count", "sum_s"}} for JSON consumers."""
+        return {k: {"count": int(sum(v[:-1])), "sum_s": round(v[-1], 3)} for k, v in self._series.items()}
+
+
+class Counter:
+    """Monotonic counter with an optional single label."""
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {} if label else {"": 0}
+
+    def inc(self, label_value: str = "", n: float = 1) -> None:
+        self._values[label_value] = self._values.get(label_value, 0) + n
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for value, total in sorted(self._values.items()):
+            labels = f'{{{self.label}="{value}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {_fmt(total)}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "orchestrator_stage_duration_seconds",
+    "Duration of pipeline stages (intent_gate, rewrite, agent_build, llm_call, tools, judge).",
+    "stage",
+)
+request_seconds = Histogram(
+    "orchestrator_request_duration_seconds",
+    "End-to-end stream_answer_query duration by outcome.",
+    "outcome",
+)
+judge_retries = Counter("orchestrator_judge_retries_total", "Judge-driven llm_call retries.")
+errors = Counter("orchestrator_errors_total", "Pipeline errors by exception type.", "error")
+timeouts = Counter("orchestrator_timeouts_total", "Requests that failed on a timeout.")
+degraded = Counter("orchestrator_degraded_total", "Stages skipped or cut short by the request deadline.", "stage")
+cancelled = Counter("orchestrator_cancelled_total", "Requests cancelled mid-pipeline, by the stage(s) running.", "stage")
+client_disconnects = Counter("orchestrator_client_disconnects_total", "SSE clients that disconnected before the end.")
+
+_REGISTRY = (stage_seconds, request_seconds, judge_retries, errors, timeouts, degraded, cancelled, client_disconnects)
+
+
+def _stats_lines(component: str, stats: dict) -> Iterable[str]:
+    """Flatten numeric entries (nested dicts included) into gauges orchestrator_<component>_<key>."""
+    for key, value in sorted(stats.items()):
+        if isinstance(value, dict):
+            yield from _stats_lines(f"{component}_{key}", value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"orchestrator_{_NAME_RE.sub('_', component)}_{_NAME_RE.sub('_', key)} {_fmt(value)}"
+
+
+def render(components: Optional[Dict[str, dict]] = None) -> str:
+    """Prometheus text format: registered metrics plus flattened component stats."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    for component, stats in (components or {}).items():
+        lines.extend(_stats_lines(component, stats))
+    return "\n".join(lines) + "\n"
@@ -1,14 +1,65 @@
 import asyncio
+import contextlib
+import functools
+import logging
+import time
 import uuid
-from typing import Any, AsyncIterator, List, Optional, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from langchain_core.callbacks import AsyncCallbackHandler
 
+import metrics
 from agent_graph import build_graph_agent
+from answer_cache import answer_cache, raw_key, rewrite_key
+from admission import AdmissionRejected, Ticket, admission
+from circuit_breaker import CircuitOpen, breakers
+from coalesce import Subscription, coalescer
 from agent_rewrite import rewrite_query
 from config import get_langsmith_tags, settings
-from intent_gate import get_canned_answer
-from utils import last_ai_content
+from deadline import Deadline
+from intent_gate import fast_path_decision, get_canned_answer
+from llm_pool import llm_pool
+from rag_fanout import select_shards
+from session_memory import session_memory
+from utils import extract_message_content, last_ai_content, normalize_question
+
+logger = logging.getLogger(__name__)
+
+_NO_RETRIEVAL_SYSTEM = """The knowledge base about Taixing Bi is temporarily unavailable, so no evidence could be
+retrieved for this question. Answer briefly from general knowledge only where that is safe, never invent
+personal facts about Taixing Bi, and say that the knowledge base could not be checked right now."""
+
+# Speculative rewrite counters: launched, used (gate said NO), wasted (cancelled on smalltalk)
+_speculation_stats = {"launched": 0, "used": 0, "wasted": 0}
+
+
+def get_speculation_stats() -> dict:
+    """Return speculative rewrite counters plus waste rate (wasted / launched)."""
+    stats = dict(_speculation_stats)
+    launched = stats["launched"]
+    stats["waste_rate"] = round(stats["wasted"] / launched, 4) if launched else 0.0
+    return stats
+
+
+def _record_cancel(deadline: Deadline, request_id: str) -> None:
+    """Count and log a cancelled pipeline (client gone) under the stage(s) it was in."""
+    stages = list(dict.fromkeys(deadline.cancelled)) or ["pipeline"]
+    for stage in stages:
+        metrics.cancelled.inc(stage)
+    logger.info(
+        "request %s cancelled during %s after %.2fs",
+        request_id, "+".join(stages), time.monotonic() - deadline.started_at,
+    )
+
+
+async def _cancel_task(task: Optional[asyncio.Task]) -> None:
+    """Cancel a task if still running and swallow its outcome (no 'exception never retrieved')."""
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    with contextlib.suppress(BaseException):
+        await task
 
 
 class _AgentRunIdCallback(AsyncCallbackHandler):
@@ -22,6 +73,81 @@ class _AgentRunIdCallback(AsyncCallbackHandler):
             self.run_ids.append(str(run_id))
 
 
+class _GraphProfileCallback(AsyncCallbackHandler):
+    """Per-node wall / CPU time of a profiled request's graph run (request_profiler)."""
+
+    run_inline = True  # in the node's own task, so the node's CPU is charged to its span
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    async def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if parent_run_id is None:
+            self.profile.node_start(run_id, None)
+        elif (metadata or {}).get("langgraph_node") == kwargs.get("name"):
+            self.profile.node_start(run_id, kwargs["name"])
+
+    async def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.profile.node_end(run_id)
+
+    async def on_chain_error(self, error, *, run_id, **kwargs):
+        self.profile.node_end(run_id)
+
+
+async def _build_agent(servers: dict, tools_timeout_s: float, deadline: Optional[Deadline]):
+    """build_graph_agent, recording its time (tool discovery + compile on a cold cache) as a stage."""
+    if deadline is None:
+        return await build_graph_agent(servers, tools_timeout_s)
+    with deadline.stage("agent_build"):
+        # Wait is capped by the budget; the registry key (and a cold build) keeps the configured timeout
+        return await build_graph_agent(servers, tools_timeout_s, wait_s=deadline.timeout(tools_timeout_s))
+
+
+async def _timed(deadline: Deadline, stage: str, fn: Callable[[], Awaitable[Any]]):
+    # Takes a callable so a task cancelled before it starts leaves no un-awaited coroutine behind
+    with deadline.stage(stage):
+        return await fn()
+
+
+def _done_events(deadline: Deadline) -> List[dict]:
+    """Final events: optional per-request timing event, then the done state (with budget report)."""
+    report = deadline.report()
+    events = []
+    if settings.sse_timing_event:
+        events.append({"type": "timing", "total_s": report["elapsed_s"], "stages": report["stages"]})
+    events.append({"type": "state", "phase": "done", "message": "Complete", "budget": report})
+    return events
+
+
+def _graph_config(
+    run_ids: List[str],
+    *,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    rag_shards: Optional[List[str]] = None,
+) -> dict:
+    """LangGraph run config: LangSmith run name/tags, run_id capture, request context for tools.
+    tool_memo holds this run's tool results so judge retries reuse the same evidence; deadline
+    lets graph nodes and tool calls see the remaining request budget; rag_shards limits fan-out
+    tools to the routed RAG servers."""
+    configurable = {k: v for k, v in (("request_id", request_id), ("session_id", session_id)) if v is not None}
+    configurable["tool_memo"] = {}
+    if deadline is not None:
+        configurable["deadline"] = deadline
+    if rag_shards:
+        configurable["rag_shards"] = rag_shards
+    callbacks: List[AsyncCallbackHandler] = [_AgentRunIdCallback(run_ids)]
+    if deadline is not None and deadline.profile is not None:
+        callbacks.append(_GraphProfileCallback(deadline.profile))
+    return {
+        "run_name": "agent_graph",
+        "callbacks": callbacks,
+        "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
+        "configurable": configurable,
+    }
+
+
 async def run_graph(
     messages: list,
     servers: dict,
@@ -30,28 +156,102 @@ async def run_graph(
     *,
     request_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    rag_shards: Optional[List[str]] = None,
 ) -> Tuple[List[Any], Optional[str]]:
     """Run one phase (RAG) and return (messages, agent_graph_run_id). agent_graph_run_id from LangSmith."""
     if not servers:
         return messages, None
-    agent = await build_graph_agent(servers, tools_timeout_s)
+    agent = await _build_agent(servers, tools_timeout_s, deadline)
     run_ids: List[str] = []
-    callback = _AgentRunIdCallback(run_ids)
-    configurable = {k: v for k, v in (("request_id", request_id), ("session_id", session_id)) if v is not None}
-    config = {
-        "run_name": "agent_graph",
-        "callbacks": [callback],
-        "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
-        "configurable": configurable,
-    }
+    config = _graph_config(
+        run_ids, request_id=request_id, session_id=session_id, deadline=deadline, rag_shards=rag_shards
+    )
     out = await asyncio.wait_for(
         agent.ainvoke({"messages": messages}, config=config),
-        timeout=invoke_timeout_s,
+        timeout=deadline.timeout(invoke_timeout_s) if deadline else invoke_timeout_s,
     )
     agent_graph_run_id = run_ids[0] if run_ids else None
     return out["messages"], agent_graph_run_id
 
 
+async def stream_graph(
+    messages: list,
+    servers: dict,
+    tools_timeout_s: float,
+    invoke_timeout_s: float,
+    result: Dict[str, Any],
+    *,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    rag_shards: Optional[List[str]] = None,
+) -> AsyncIterator[dict]:
+    """Run one phase (RAG) streaming llm_call tokens as answer_delta events.
+    Yields retract when streamed text is superseded (tool call or judge retry).
+    On completion result holds "messages" and "agent_graph_run_id" (as returned by run_graph)."""
+    result["messages"], result["agent_graph_run_id"] = messages, None
+    if not servers:
+        return
+    agent = await _build_agent(servers, tools_timeout_s, deadline)
+    run_ids: List[str] = []
+    config = _graph_config(
+        run_ids, request_id=request_id, session_id=session_id, deadline=deadline, rag_shards=rag_shards
+    )
+    attempt = 1
+    streamed = False
+    async with asyncio.timeout(deadline.timeout(invoke_timeout_s) if deadline else invoke_timeout_s):
+        async for mode, payload in agent.astream(
+            {"messages": messages}, config=config, stream_mode=["messages", "updates", "values"]
+        ):
+            if mode == "messages":
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") != "llm_call":
+                    continue
+                text = extract_message_content(chunk)
+                if text:
+                    streamed = True
+                    yield {"type": "answer_delta", "text": text, "attempt": attempt}
+            elif mode == "updates":
+                llm_update = payload.get("llm_call") or {}
+                judge_update = payload.get("judge") or {}
+                last = (llm_update.get("messages") or [None])[-1]
+                if streamed and getattr(last, "tool_calls", None):
+                    # Preamble text before a tool call is not the answer
+                    streamed = False
+                    yield {"type": "retract", "reason": "tool_call", "attempt": attempt}
+                if judge_update.get("judge_passed") is False:
+                    if streamed:
+                        yield {"type": "retract", "reason": "judge_retry", "attempt": attempt}
+                    streamed = False
+                    attempt += 1
+            elif mode == "values":
+                result["messages"] = payload["messages"]
+    result["agent_graph_run_id"] = run_ids[0] if run_ids else None
+
+
+async def answer_without_retrieval(
+    messages: list,
+    invoke_timeout_s: float,
+    *,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+) -> List[Any]:
+    """Degraded path while the RAG servers' circuit breakers are open: one plain LLM call, no tools."""
+    prompt = [{"role": "system", "content": _NO_RETRIEVAL_SYSTEM}, *messages]
+    config = {
+        "run_name": "answer_without_retrieval",
+        "tags": get_langsmith_tags(request_id=request_id, session_id=session_id),
+    }
+    with deadline.stage("llm_call") if deadline is not None else contextlib.nullcontext():
+        msg = await asyncio.wait_for(
+            llm_pool.ainvoke("llm_call", prompt, config=config),
+            timeout=deadline.timeout(invoke_timeout_s) if deadline else invoke_timeout_s,
+        )
+    return [*messages, msg]
+
+
 async def answer_query_sync(
     query: str,
     *,
@@ -59,23 +259,120 @@ async def answer_query_sync(
     invoke_timeout_s: Optional[float] = None,
     request_id: Optional[str] = None,
     session_id: Optional[str] = None,
+    admit: bool = False,
 ) -> str:
-    """Run agent and return the final answer. Consumes stream_answer_query for single code path."""
+    """Run agent and return the final answer. Consumes stream_answer_query for single code path.
+    With admit, raises AdmissionRejected when the question can be neither joined nor queued."""
     answer = ""
-    async for event in stream_answer_query(
+    events = coalesced_answer_query(
         query,
         request_id=request_id,
         session_id=session_id,
         tools_timeout_s=tools_timeout_s,
         invoke_timeout_s=invoke_timeout_s,
-    ):
-        if event.get("type") == "answer":
-            answer = event.get("text", "")
-        elif event.get("type") == "error":
-            return event.get("text", "Unknown error")
+        admit=admit,
+    )
+    async with contextlib.aclosing(events):
+        async for event in events:
+            if event.get("type") == "answer":
+                answer = event.get("text", "")
+            elif event.get("type") == "error":
+                return event.get("text", "Unknown error")
     return answer
 
 
+def _coalesce_key(query: str, session_id: Optional[str]) -> Optional[str]:
+    """Normalized question; scoped to the session when it has history (a follow-up depends on it).
+    None for a question without letters or digits, which is never shared."""
+    key = normalize_question(query)
+    if not key:
+        return None
+    return f"{session_id}\x00{key}" if session_memory.has_history(session_id) else key
+
+
+async def _admitted(
+    ticket: Ticket, events: AsyncIterator[dict], request_id: str, session_id: Optional[str]
+) -> AsyncIterator[dict]:
+    """The request_id event, queued state events until ticket is admitted, then the rest of events.
+    The ticket itself is released by the flight's on_done (it must be freed even if this generator
+    never starts)."""
+    # First, as for an unqueued request: clients read request_id (e.g. for /feedback) from the first event
+    yield {"type": "request_id", "session_id": session_id, "request_id": request_id}
+    try:
+        async for event in admission.wait_events(ticket):
+            yield event
+    except AdmissionRejected as e:
+        yield {"type": "error", "text": e.message}
+        return
+    except asyncio.CancelledError:
+        metrics.cancelled.inc("queued")
+        logger.info("request %s cancelled while queued", request_id)
+        raise
+    async with contextlib.aclosing(events):
+        async for event in events:
+            if event.get("type") != "request_id":  # already sent
+                yield event
+
+
+def coalesced_answer_query(
+    query: str,
+    *,
+    session_id: Optional[str] = None,
+    request_id: Optional[str] = None,
+    tools_timeout_s: Optional[float] = None,
+    invoke_timeout_s: Optional[float] = None,
+    admit: bool = False,
+    admission_key: Optional[str] = None,
+) -> Subscription:
+    """stream_answer_query, with identical in-flight questions sharing one pipeline.
+    Followers keep their own request_id; their request_id event names the leader's in coalesced_with,
+    and the answer is recorded in their own session memory.
+
+    Joining or starting the pipeline is decided here, before the first await. With admit, a new pipeline
+    takes an admission slot (queued under admission_key, default session_id; queued state events follow
+    the request_id event) held until the pipeline ends, and AdmissionRejected is raised if it cannot be queued; joining
+    an identical in-flight pipeline costs no capacity. Close the returned stream if it is never iterated."""
+    request_id = request_id or str(uuid.uuid4())
+    key = _coalesce_key(query, session_id) if settings.coalesce_requests else None
+    rewritten, leader_session_id = query, None
+
+    def follow(event: dict) -> dict:
+        nonlocal rewritten, leader_session_id
+        if event.get("type") == "request_id":
+            leader_session_id = event.get("session_id")
+            return {
+                **event,
+                "session_id": session_id,
+                "request_id": request_id,
+                "coalesced_with": event.get("request_id"),
+            }
+        if event.get("type") == "rewrite":
+            rewritten = event["text"]
+        elif event.get("type") == "answer" and "cache" in event and session_id != leader_session_id:
+            # RAG answers only (canned smalltalk is not remembered), once per session
+            session_memory.record(session_id, rewritten, event.get("text", ""))
+        return event
+
+    joined = coalescer.join(key, follow) if key is not None else None
+    if joined is not None:
+        return joined
+    ticket = admission.enqueue(admission_key or session_id) if admit else None
+    events = stream_answer_query(
+        query,
+        session_id=session_id,
+        request_id=request_id,
+        tools_timeout_s=tools_timeout_s,
+        invoke_timeout_s=invoke_timeout_s,
+    )
+    if ticket is None:
+        return coalescer.start(key, events)
+    return coalescer.start(
+        key,
+        _admitted(ticket, events, request_id, session_id),
+        on_done=functools.partial(admission.release, ticket),
+    )
+
+
 async def stream_answer_query(
     query: str,
     *,
@@ -88,39 +385,146 @@ async def stream_answer_query(
     request_id = request_id or str(uuid.uuid4())
     tools_s = tools_timeout_s if tools_timeout_s is not None else settings.tools_timeout_s
     invoke_s = invoke_timeout_s if invoke_timeout_s is not None else settings.invoke_timeout_s
+    deadline = Deadline(settings.request_budget_s)
+    rewrite_task: Optional[asyncio.Task] = None
+    started = time.monotonic()
+    outcome = "cancelled"
     try:
         rag_servers = settings.rag_server_config
         yield {"type": "request_id", "session_id": session_id, "request_id": request_id}
-        # IntentGate (smalltalk?) — agent
-        canned = await get_canned_answer(
-            query, request_id=request_id, session_id=session_id
-        )
+        # Summary + last turns of this session; a follow-up's raw text is not a safe cache key
+        history = session_memory.context(session_id)
+        query_key = raw_key(query) if settings.answer_cache_raw_query and history is None else None
+        # Answer cache on the raw question: skips gate, rewrite and graph entirely
+        if query_key is not None:
+            cached = answer_cache.get(query_key)
+            if cached is not None:
+                outcome = "cache_hit"
+                session_memory.record(session_id, query, cached.get("text", ""))
+                # A hit has no agent_graph run of its own for /feedback to attach to
+                yield {"type": "answer", **cached, "agent_graph_run_id": None, "cache": "hit"}
+                for event in _done_events(deadline):
+                    yield event
+                return
+        # IntentGate local fast path (phrase trie, recent decisions): no LLM call, nothing to overlap
+        gate_decided, canned = fast_path_decision(query)
+        if not gate_decided:
+            # Speculative: start EntityRewrite alongside the IntentGate LLM; most traffic is not smalltalk
+            if settings.speculative_rewrite:
+                rewrite_task = asyncio.create_task(_timed(
+                    deadline, "rewrite",
+                    functools.partial(
+                        rewrite_query, query,
+                        request_id=request_id, session_id=session_id, deadline=deadline, history=history,
+                    ),
+                ))
+                _speculation_stats["launched"] += 1
+            # IntentGate (smalltalk?) — agent
+            with deadline.stage("intent_gate"):
+                canned = await get_canned_answer(
+                    query, request_id=request_id, session_id=session_id, deadline=deadline, fast_path=False
+                )
         if canned is not None:
+            if rewrite_task is not None:
+                _speculation_stats["wasted"] += 1
+                await _cancel_task(rewrite_task)
+            outcome = "canned"
             yield {"type": "answer", "text": canned}
-            yield {"type": "state", "phase": "done", "message": "Complete"}
+            for event in _done_events(deadline):
+                yield event
             return
         # no → EntityRewrite (Taixing?) → Router → Graph
         yield {"type": "state", "phase": "rewrite", "message": "Rewriting question..."}
-        rewritten = await rewrite_query(query, request_id=request_id, session_id=session_id)
+        if rewrite_task is not None:
+            _speculation_stats["used"] += 1
+            rewritten = await rewrite_task
+        else:
+            with deadline.stage("rewrite"):
+                rewritten = await rewrite_query(
+                    query, request_id=request_id, session_id=session_id, deadline=deadline, history=history
+                )
         yield {"type": "rewrite", "text": rewritten}
-        yield {"type": "route", "route": "RAG"}
+        rag_shards = select_shards(rewritten, list(rag_servers))
+        yield {"type": "route", "route": "RAG", "servers": rag_shards}
+        rewritten_key = rewrite_key(rewritten)
+        cached = answer_cache.get(rewritten_key) if rewritten_key is not None else None
+        if cached is not None:
+            if query_key is not None:
+                answer_cache.put(query_key, cached)
+            outcome = "cache_hit"
+            session_memory.record(session_id, rewritten, cached.get("text", ""))
+            yield {"type": "answer", **cached, "agent_graph_run_id": None, "cache": "hit"}
+            for event in _done_events(deadline):
+                yield event
+            return
         messages = [{"role": "user", "content": rewritten}]
+        if history:
+            # Compact context (constant size), never the full transcript
+            messages.insert(0, {"role": "system", "content": f"Earlier in this conversation:\n{history}"})
         agent_graph_run_id = None
-        if rag_servers:
+        # Every routed shard's breaker open: skip the graph rather than wait on a dead server
+        retrieval_down = breakers.all_open(rag_shards)
+        if rag_servers and not retrieval_down:
             yield {"type": "state", "phase": "rag", "message": "Running RAG phase..."}
-            messages, agent_graph_run_id = await run_graph(
-                messages, rag_servers, tools_s, invoke_s,
-                request_id=request_id, session_id=session_id,
+            try:
+                if settings.stream_answer_tokens:
+                    result: Dict[str, Any] = {}
+                    async for event in stream_graph(
+                        messages, rag_servers, tools_s, invoke_s, result,
+                        request_id=request_id, session_id=session_id, deadline=deadline, rag_shards=rag_shards,
+                    ):
+                        yield event
+                    messages, agent_graph_run_id = result["messages"], result["agent_graph_run_id"]
+                else:
+                    messages, agent_graph_run_id = await run_graph(
+                        messages, rag_servers, tools_s, invoke_s,
+                        request_id=request_id, session_id=session_id, deadline=deadline, rag_shards=rag_shards,
+                    )
+            except CircuitOpen as e:
+                # Tool discovery rejected by every server (tool calls report open breakers to the graph instead)
+                logger.warning("request %s: %s", request_id, e)
+                retrieval_down = True
+        if retrieval_down:
+            yield {
+                "type": "state",
+                "phase": "degraded",
+                "message": "Retrieval unavailable; answering without evidence",
+                "servers": rag_shards,
+            }
+            deadline.degrade("retrieval")
+            messages = await answer_without_retrieval(
+                messages, invoke_s, request_id=request_id, session_id=session_id, deadline=deadline
             )
         content = last_ai_content(messages)
+        outcome = ("degraded" if retrieval_down else "answer") if content else "empty"
         if content:
-            event = {"type": "answer", "text": content}
+            # The cached payload leaves out this run's agent_graph_run_id (feedback on a hit is not about it)
+            payload = {"text": content}
+            # Degraded answers (skipped judge / tools / retrieval) are not cached
+            if not deadline.degraded:
+                for key in (rewritten_key, query_key):
+                    if key is not None:
+                        answer_cache.put(key, payload)
+            session_memory.record(session_id, rewritten, content)
+            event = {"type": "answer", **payload, "cache": "miss"}
             if agent_graph_run_id:
                 event["agent_graph_run_id"] = agent_graph_run_id
             yield event
-        yield {"type": "state", "phase": "done", "message": "Complete"}
+        for event in _done_events(deadline):
+            yield event
     except Exception as e:
+        outcome = "error"
+        metrics.errors.inc(type(e).__name__)
+        if isinstance(e, asyncio.TimeoutError):
+            metrics.timeouts.inc()
         yield {"type": "error", "text": format_error(e)}
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client gone (or last coalesced subscriber left): the graph, LLM and tool calls below are cancelled
+        _record_cancel(deadline, request_id)
+        raise
+    finally:
+        await _cancel_task(rewrite_task)
+        metrics.request_seconds.observe(outcome, time.monotonic() - started)
 
 
 def format_error(e: Exception) -> str:
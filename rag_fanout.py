@@ -0,0 +1,123 @@
+"""Multi-shard RAG: keyword router and fan-out tools over several RAG MCP servers.
+
+When several servers expose a tool with the same name, the graph sees one fan-out tool instead. A call
+goes to every shard the router selected for the request, concurrently and each within its own timeout
+(capped by the request deadline). Results are merged into one reranked evidence text; shards that
+fail or time out are left out, so a slow shard never holds back the answer beyond its budget; such a
+partial result is not cached (tool cache, and answer cache via the degraded deadline).
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+from config import parse_pairs, settings
+from context_manager import merge_shard_results
+from utils import extract_message_content, normalize_question
+
+logger = logging.getLogger(__name__)
+
+_routes: Optional[Dict[str, List[str]]] = None
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _route_keywords() -> Dict[str, List[str]]:
+    """RAG_ROUTE_KEYWORDS as {shard: [normalized keyword or phrase]}."""
+    global _routes
+    if _routes is None:
+        _routes = {
+            name: [normalize_question(kw) for kw in spec.split("|") if normalize_question(kw)]
+            for name, spec in parse_pairs(settings.rag_route_keywords).items()
+        }
+    return _routes
+
+
+def select_shards(question: str, shards: Sequence[str]) -> List[str]:
+    """Shards to query for a question: those without route keywords, plus those whose keywords occur in
+    the question. If no keyword matches, every shard is queried (recall over precision)."""
+    routes = _route_keywords()
+    padded = f" {normalize_question(question)} "
+    general = [s for s in shards if not routes.get(s)]
+    matched = [s for s in shards if any(f" {kw} " in padded for kw in routes.get(s) or ())]
+    return general + matched if matched else list(shards)
+
+
+def _shard_stats(shard: str) -> Dict[str, int]:
+    return _stats.setdefault(shard, {"calls": 0, "timeouts": 0, "errors": 0})
+
+
+async def _call_shard(shard: str, tool: BaseTool, args: Dict[str, Any], timeout: float,
+                      config: RunnableConfig) -> Optional[str]:
+    stats = _shard_stats(shard)
+    stats["calls"] += 1
+    try:
+        content = await asyncio.wait_for(tool.ainvoke(args, config=config), timeout=timeout)
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        logger.warning("rag fan-out: shard %s timed out after %.1fs", shard, timeout)
+        return None
+    except Exception as e:
+        stats["errors"] += 1
+        logger.warning("rag fan-out: shard %s failed: %s", shard, e)
+        return None
+    return content if isinstance(content, str) else extract_message_content({"content": content})
+
+
+def fanout_tool(name: str, shard_tools: Dict[str, BaseTool]) -> BaseTool:
+    """One tool named name that calls the same-named tool on each selected shard and merges the results."""
+    first = next(iter(shard_tools.values()))
+
+    async def _fanout(config: RunnableConfig, **kwargs: Any) -> str:
+        configurable = config.get("configurable") or {}
+        selected = configurable.get("rag_shards")
+        targets = {s: t for s, t in shard_tools.items() if not selected or s in selected} or shard_tools
+        deadline = configurable.get("deadline")
+        timeout = settings.rag_shard_timeout_s
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        outputs = await asyncio.gather(
+            *(_call_shard(shard, tool, kwargs, timeout, config) for shard, tool in targets.items())
+        )
+        results: List[Tuple[str, str]] = [(s, out) for s, out in zip(targets, outputs) if out]
+        if not results:
+            raise ToolException(f"No RAG shard answered ({', '.join(targets)}).")
+        missing = [s for s, out in zip(targets, outputs) if out is None]
+        merged = merge_shard_results(results, str(kwargs.get("query") or next(iter(kwargs.values()), "")))
+        if missing:
+            merged += f"\n\n(shards without results: {', '.join(missing)})"
+            # Incomplete evidence: neither this result nor an answer built on it may be cached
+            if deadline is not None:
+                deadline.degrade("rag_shards")
+        return merged, {"missing_shards": missing}
+
+    return StructuredTool(
+        name=name,
+        description=first.description,
+        args_schema=first.args_schema,
+        coroutine=_fanout,
+        response_format="content_and_artifact",  # artifact: {"missing_shards": [...]}
+        metadata={**(first.metadata or {}), "rag_shards": list(shard_tools)},
+        handle_tool_error=True,
+    )
+
+
+def merge_shard_tools(tools: List[BaseTool], servers: List[str]) -> List[BaseTool]:
+    """Replace tools whose name is served by more than one RAG server (servers[i] serves tools[i])
+    with a single fan-out tool; other tools pass through unchanged, in their original order."""
+    by_name: Dict[str, Dict[str, BaseTool]] = {}
+    for tool, server in zip(tools, servers):
+        by_name.setdefault(tool.name, {})[server] = tool
+    merged: List[BaseTool] = []
+    for tool in tools:
+        shard_tools = by_name.pop(tool.name, None)
+        if shard_tools is None:
+            continue
+        merged.append(fanout_tool(tool.name, shard_tools) if len(shard_tools) > 1 else tool)
+    return merged
+
+
+def get_fanout_stats() -> dict:
+    """Per-shard call / timeout / error counters."""
+    return {shard: dict(stats) for shard, stats in _stats.items()}
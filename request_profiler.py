@@ -0,0 +1,456 @@
+"""Opt-in per-request profiling of the answer pipeline.
+
+A profiled request records:
+- wall and CPU time per coroutine: tasks created in the request's context run wrapped, and the thread
+  CPU time of each step is charged to the task (reported per coroutine name);
+- wall and CPU time per pipeline stage (Deadline.stage) and per LangGraph node, CPU including the tasks
+  started while the stage or node was open (hedges, tool sessions, callbacks);
+- event-loop stalls: a watchdog thread pings the loop and captures the loop thread's stack when a ping
+  is not served within PROFILE_STALL_MS (something is blocking: JSON, regex, sync I/O, ...);
+- loop-thread stacks sampled every PROFILE_INTERVAL_MS, in collapsed format (flamegraph.pl, speedscope,
+  inferno), rooted at "request" (this request's tasks), "other" (other tasks), "callbacks" (loop callbacks
+  outside tasks) or "idle" (loop waiting on the network).
+
+Each profile is written to PROFILE_DIR as <id>.json (summary) and <id>.folded (stacks). Nothing is
+installed while no request is being profiled.
+"""
+import asyncio
+import collections.abc
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_active: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+\.(json|folded)$")
+_MAX_DEPTH = 128
+# Frames of the event loop driving tasks and callbacks (asyncio; uvloop drives from C under Runner.run)
+_DRIVER_FRAMES = ("Runner.run (", "BaseEventLoop.run_until_complete (", "BaseEventLoop.run_forever (",
+                  "BaseEventLoop._run_once (", "Handle._run (")
+_stats = {"profiles": 0, "active": 0, "write_errors": 0}
+_writes: Set[asyncio.Task] = set()  # profile writes in progress (referenced until done)
+
+
+def should_profile(header: Optional[str] = None) -> bool:
+    """True if this request is profiled: an "X-Profile: 1" header (when PROFILE_ALLOW_HEADER) or sampled."""
+    if header and settings.profile_allow_header and header.strip().lower() in ("1", "true", "yes"):
+        return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+def current() -> Optional["RequestProfile"]:
+    """The profile of the request running in this context, if any."""
+    return _active.get()
+
+
+class _Span:
+    """An open stage or graph node; collects the CPU of its task and of tasks started while it is open."""
+
+    __slots__ = ("name", "table", "started", "cpu", "clock", "closed")
+
+    def __init__(self, name: str, table: Dict[str, Dict[str, float]], clock: Optional["_ClockedCoro"]):
+        self.name = name
+        self.table = table
+        self.started = time.monotonic()
+        self.clock = clock
+        self.closed = False
+        # The step in progress is charged in full when it ends: discount the part before the span opened
+        self.cpu = -clock.step_elapsed() if clock is not None else 0.0
+
+
+class _ClockedCoro(collections.abc.Coroutine):
+    """Coroutine wrapper charging the thread CPU time of every step to its task and to the open spans
+    (its own, and those open in the task that created it)."""
+
+    def __init__(self, coro, profile: "RequestProfile", inherited: tuple = ()):
+        self._coro = coro
+        self.profile = profile
+        self.name = getattr(coro, "__qualname__", type(coro).__name__)
+        self.inherited = inherited
+        self.spans: List[_Span] = []
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self.step_started: Optional[float] = None
+        self.cpu = 0.0
+        self.steps = 0
+
+    def step_elapsed(self) -> float:
+        """CPU time of the step in progress."""
+        return time.thread_time() - self.step_started if self.step_started is not None else 0.0
+
+    def _step(self, method, *args):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.step_started = time.thread_time()
+        try:
+            return method(*args)
+        except BaseException:
+            self.ended = time.monotonic()  # StopIteration included: the coroutine finished
+            raise
+        finally:
+            cpu = time.thread_time() - self.step_started
+            self.cpu += cpu
+            for span in self.inherited:
+                if not span.closed:
+                    span.cpu += cpu
+            for span in self.spans:
+                span.cpu += cpu
+            self.step_started = None
+            self.steps += 1
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+
+def _current_clock() -> Optional[_ClockedCoro]:
+    task = asyncio.current_task()
+    coro = task.get_coro() if task is not None else None
+    return coro if isinstance(coro, _ClockedCoro) else None
+
+
+# Task factory wrapping tasks created in a profiled context; installed only while a profile is active
+_factories: Dict[asyncio.AbstractEventLoop, Any] = {}
+_installed: Counter = Counter()
+
+
+def _task_factory(loop, coro, **kwargs):
+    context = kwargs.get("context")
+    profile = context.get(_active) if context is not None else _active.get()
+    if profile is not None and not profile.finished and not isinstance(coro, _ClockedCoro):
+        coro = profile.clock(coro)
+    previous = _factories.get(loop)
+    if previous is not None:
+        return previous(loop, coro, **kwargs)
+    return asyncio.Task(coro, loop=loop, **kwargs)
+
+
+def _install(loop: asyncio.AbstractEventLoop) -> None:
+    if _installed[loop] == 0:
+        _factories[loop] = loop.get_task_factory()
+        loop.set_task_factory(_task_factory)
+    _installed[loop] += 1
+
+
+def _uninstall(loop: asyncio.AbstractEventLoop) -> None:
+    _installed[loop] -= 1
+    if _installed[loop] <= 0:
+        del _installed[loop]
+        previous = _factories.pop(loop, None)
+        if loop.get_task_factory() is _task_factory:
+            loop.set_task_factory(previous)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame) -> List[str]:
+    """Stack root → leaf, starting below the loop's driver frames (profiler frames left out)."""
+    stack = []
+    while frame is not None and len(stack) < _MAX_DEPTH:
+        label = _frame_label(frame)
+        if label.startswith(_DRIVER_FRAMES):
+            break
+        if frame.f_code.co_filename != __file__:  # not _ClockedCoro's own frames
+            stack.append(label)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class _Sampler(threading.Thread):
+    """Samples the event-loop thread's stack and watches for loop stalls."""
+
+    def __init__(self, profile: "RequestProfile", loop: asyncio.AbstractEventLoop):
+        super().__init__(name=f"profile-{profile.id}", daemon=True)
+        self.profile = profile
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.roots: Counter = Counter()
+        self.max_lag_ms = 0.0
+        self._stop_event = threading.Event()
+        self._ping_at: Optional[float] = None
+        self._stall: Optional[dict] = None
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        interval = max(0.001, settings.profile_interval_ms / 1000.0)
+        stall_s = settings.profile_stall_ms / 1000.0
+        while not self._stop_event.wait(interval):
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                return
+            # Loop's current task (the dict asyncio.current_task() reads; safe to read under the GIL)
+            task = asyncio.tasks._current_tasks.get(self.loop)
+            stack = _fold(frame)
+            del frame
+            if task is not None:
+                coro = task.get_coro()
+                root = "request" if isinstance(coro, _ClockedCoro) and coro.profile is self.profile else "other"
+            elif all("(selectors.py:" in f for f in stack):
+                root, stack = "idle", []  # in select() / uvloop's poll: waiting for I/O
+            else:
+                root = "callbacks"
+            self.roots[root] += 1
+            self.samples[";".join([root, *stack])] += 1
+            now = time.monotonic()
+            if self._ping_at is None:
+                self._ping_at = now
+                try:
+                    self.loop.call_soon_threadsafe(self._pong, now)
+                except RuntimeError:  # loop closed
+                    return
+            elif self._stall is None and now - self._ping_at >= stall_s:
+                self._stall = {"at_s": round(self._ping_at - self.profile.started, 3), "stack": ";".join(stack)}
+
+    def _pong(self, sent: float) -> None:
+        """On the loop: the ping was served; close the stall it was part of, if any."""
+        lag_ms = (time.monotonic() - sent) * 1000.0
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        if self._stall is not None:
+            self._stall["duration_ms"] = round(lag_ms, 1)
+            self.profile.stalls.append(self._stall)
+            self._stall = None
+        self._ping_at = None
+
+
+class RequestProfile:
+    """Profile of one request; start() it in the request's task, run the pipeline via create_task()."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or str(uuid.uuid4())
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", self.request_id)[:64]
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{safe_id}"
+        self.started = 0.0
+        self.started_at = 0.0
+        self.ended: Optional[float] = None
+        self.finished = False
+        self.stalls: List[dict] = []
+        self._tasks: List[_ClockedCoro] = []
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._nodes: Dict[str, Dict[str, float]] = {}
+        self._graph: Dict[str, Dict[str, float]] = {}
+        self._node_spans: Dict[Any, _Span] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sampler: Optional[_Sampler] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        _install(self._loop)
+        self._sampler = _Sampler(self, self._loop)
+        self._sampler.start()
+        _stats["active"] += 1
+
+    def clock(self, coro) -> _ClockedCoro:
+        """Wrap coro for a task created now; it inherits the spans open in the creating task."""
+        parent = _current_clock()
+        inherited = (*parent.inherited, *parent.spans) if parent is not None and parent.profile is self else ()
+        clocked = _ClockedCoro(coro, self, inherited)
+        self._tasks.append(clocked)
+        return clocked
+
+    def create_task(self, coro) -> asyncio.Task:
+        """Run coro as a task in a context where this profile is active (its child tasks are profiled too)."""
+        context = contextvars.copy_context()
+        context.run(_active.set, self)
+        return asyncio.get_running_loop().create_task(self.clock(coro), context=context)
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn in a context where this profile is active, so the tasks it starts are profiled."""
+        context = contextvars.copy_context()
+        context.run(_active.set, self)
+        return context.run(fn, *args, **kwargs)
+
+    def enter(self, name: str, table: Optional[Dict[str, Dict[str, float]]] = None) -> _Span:
+        clock = _current_clock()
+        span = _Span(name, self._stages if table is None else table, clock)
+        if clock is not None:
+            clock.spans.append(span)
+        return span
+
+    def exit(self, span: _Span) -> None:
+        """Close span: add its wall and CPU time to its table."""
+        clock = span.clock
+        if clock is not None and span in clock.spans:
+            if clock is _current_clock():
+                span.cpu += clock.step_elapsed()
+            clock.spans.remove(span)
+        span.closed = True
+        entry = span.table.setdefault(span.name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        entry["calls"] += 1
+        entry["wall_s"] += time.monotonic() - span.started
+        entry["cpu_s"] += max(0.0, span.cpu)
+
+    def node_start(self, run_id: Any, node: Optional[str]) -> None:
+        """Open a graph node span (node None: the whole graph run)."""
+        self._node_spans[run_id] = self.enter("graph", self._graph) if node is None else self.enter(node, self._nodes)
+
+    def node_end(self, run_id: Any) -> None:
+        span = self._node_spans.pop(run_id, None)
+        if span is not None:
+            self.exit(span)
+
+    def stop(self) -> bool:
+        """Stop profiling: restore the task factory and stop the sampler thread. Synchronous, so call it
+        first in a finally: an await before it could be cancelled (client gone) and leave both running.
+        True on the first call only."""
+        if self.finished or self._sampler is None:
+            return False
+        self.finished = True
+        self.ended = time.monotonic()
+        self._sampler.stop()
+        _uninstall(self._loop)
+        _stats["active"] -= 1
+        return True
+
+    async def write(self) -> Optional[str]:
+        """Write the stopped profile to PROFILE_DIR; returns its id."""
+        try:
+            await asyncio.to_thread(self._write)
+        except OSError as e:
+            _stats["write_errors"] += 1
+            logger.warning("profile %s: write failed: %s", self.id, e)
+            return None
+        _stats["profiles"] += 1
+        return self.id
+
+    def write_in_background(self) -> None:
+        """write() as a task of its own (not tied to the request, which may be cancelled)."""
+        task = asyncio.get_running_loop().create_task(self.write(), context=contextvars.Context())
+        _writes.add(task)
+        task.add_done_callback(_writes.discard)
+
+    def summary(self) -> dict:
+        now = self.ended or time.monotonic()
+        coroutines: Dict[str, Dict[str, float]] = {}
+        for t in self._tasks:
+            if t.started is None:
+                continue
+            entry = coroutines.setdefault(t.name, {"tasks": 0, "steps": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            entry["tasks"] += 1
+            entry["steps"] += t.steps
+            entry["wall_s"] += (t.ended or now) - t.started
+            entry["cpu_s"] += t.cpu
+
+        def rounded(table: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+            ordered = sorted(table.items(), key=lambda kv: -kv[1]["cpu_s"])
+            return {k: {f: round(v, 4) if isinstance(v, float) else v for f, v in e.items()} for k, e in ordered}
+
+        sampler = self._sampler
+        graph = self._graph.get("graph", {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        nodes_s = sum(e["wall_s"] for e in self._nodes.values())
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "started_at": round(self.started_at, 3),
+            "wall_s": round(now - self.started, 4),
+            "cpu_s": round(sum(t.cpu for t in self._tasks), 4),
+            "coroutines": rounded(coroutines),
+            "stages": rounded(self._stages),
+            "graph": {
+                **{k: round(v, 4) if isinstance(v, float) else v for k, v in graph.items()},
+                # Graph time outside its nodes: LangGraph scheduling, checkpoint/state merging, callbacks
+                "overhead_s": round(max(0.0, graph["wall_s"] - nodes_s), 4),
+                "nodes": rounded(self._nodes),
+            },
+            "loop": {
+                "interval_ms": settings.profile_interval_ms,
+                "samples": sum(sampler.roots.values()) if sampler else 0,
+                **(dict(sampler.roots) if sampler else {}),
+                "max_lag_ms": round(sampler.max_lag_ms, 1) if sampler else 0.0,
+            },
+            "stalls": list(self.stalls),
+        }
+
+    def _write(self) -> None:
+        self._sampler.join()
+        summary = self.summary()
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        base = os.path.join(settings.profile_dir, self.id)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in sorted(self._sampler.samples.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+        _prune()
+        logger.info("profile %s written (request %s, %.2fs)", self.id, self.request_id, summary["wall_s"])
+
+
+def _prune() -> None:
+    """Keep the newest PROFILE_MAX_FILES profiles."""
+    summaries = sorted(
+        (e for e in os.scandir(settings.profile_dir) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in summaries[max(0, settings.profile_max_files):]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(entry.path[: -len(".json")] + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[dict]:
+    """Written profiles, newest first: id, request_id, wall/cpu time, stall count, file names."""
+    if not os.path.isdir(settings.profile_dir):
+        return []
+    out = []
+    for entry in os.scandir(settings.profile_dir):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        out.append({
+            "id": summary.get("id"),
+            "request_id": summary.get("request_id"),
+            "started_at": summary.get("started_at"),
+            "wall_s": summary.get("wall_s"),
+            "cpu_s": summary.get("cpu_s"),
+            "stalls": len(summary.get("stalls") or []),
+            "files": [entry.name, entry.name[: -len(".json")] + ".folded"],
+        })
+    out.sort(key=lambda p: p["started_at"] or 0, reverse=True)
+    return out
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a profile file (<id>.json or <id>.folded) in PROFILE_DIR, or None."""
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.join(settings.profile_dir, name)
+    return path if os.path.isfile(path) else None
+
+
+def get_profiler_stats() -> dict:
+    return {**_stats, "sample_rate": settings.profile_sample_rate}
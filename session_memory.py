@@ -0,0 +1,206 @@
+"""Session memory: per-session rolling summary + last few turns, as compact context for follow-ups.
+
+Sessions live in a byte-bounded LRU with idle TTL. When a turn falls out of the recent window it is
+folded into the session summary by a background LLM call (off the request path), so the context a
+request sees stays within SESSION_SUMMARY_MAX_TOKENS + SESSION_MEMORY_TURNS turns of
+SESSION_TURN_MAX_TOKENS each, however long the conversation.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from config import get_langsmith_tags, settings
+from context_manager import count_tokens
+from llm_pool import llm_pool
+
+logger = logging.getLogger(__name__)
+
+_SUMMARY_SYSTEM = """You maintain a running summary of a conversation between a user and an assistant
+answering questions about Taixing Bi. Update the summary with the new turn. Keep names, topics and facts
+the user may refer back to; drop pleasantries. Stay under {max_words} words. Return only the summary."""
+
+
+def clip_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text to about max_tokens (keeping the start, or the end with keep_end)."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    chars = max(1, len(text) * max_tokens // tokens)
+    return "…" + text[-chars:] if keep_end else text[:chars] + "…"
+
+
+class _Session:
+    __slots__ = ("summary", "turns", "pending", "updated_at", "size", "folding")
+
+    def __init__(self):
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []  # recent (question, answer), oldest first
+        self.pending: List[Tuple[str, str]] = []  # turns out of the window, not yet in the summary
+        self.updated_at = time.monotonic()
+        self.size = 0
+        self.folding: Optional[asyncio.Task] = None
+
+    def measure(self) -> int:
+        self.size = len(self.summary) + sum(len(q) + len(a) for q, a in self.turns + self.pending)
+        return self.size
+
+
+class SessionMemory:
+    """LRU of sessions bounded by total text bytes; sessions idle longer than ttl_s expire."""
+
+    def __init__(self, max_bytes: int, ttl_s: float, max_turns: int):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "turns_recorded": 0, "summaries": 0,
+                       "summary_errors": 0, "evictions": 0, "expired": 0}
+
+    def _get(self, session_id: str) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is not None and session.updated_at + self.ttl_s <= time.monotonic():
+            self._drop(session_id)
+            self._stats["expired"] += 1
+            return None
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+        if session.folding is not None:
+            session.folding.cancel()
+
+    def has_history(self, session_id: Optional[str]) -> bool:
+        session = self._get(session_id) if session_id else None
+        return session is not None and bool(session.summary or session.turns or session.pending)
+
+    def context(self, session_id: Optional[str]) -> Optional[str]:
+        """Compact conversation context for a session (summary + recent turns), or None."""
+        session = self._get(session_id) if session_id else None
+        if session is None or not (session.summary or session.turns):
+            self._stats["misses"] += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        self._stats["hits"] += 1
+        parts = []
+        if session.summary:
+            parts.append(f"Summary of earlier conversation: {session.summary}")
+        max_turn = settings.session_turn_max_tokens
+        for question, answer in session.turns:
+            parts.append(f"User: {clip_tokens(question, max_turn)}\nAssistant: {clip_tokens(answer, max_turn)}")
+        return "\n\n".join(parts)
+
+    def record(self, session_id: Optional[str], question: str, answer: str) -> None:
+        """Append a turn; turns leaving the recent window are folded into the summary in the background."""
+        if not session_id or self.max_bytes <= 0 or not answer:
+            return
+        session = self._get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        self._sessions.move_to_end(session_id)
+        session.updated_at = time.monotonic()
+        session.turns.append((question, answer))
+        self._stats["turns_recorded"] += 1
+        self._trim(session_id, session)
+
+    def _trim(self, session_id: str, session: _Session) -> None:
+        """Move turns beyond the recent window to pending and start folding them."""
+        cut = len(session.turns) - max(self.max_turns, 0)
+        if cut > 0:
+            session.pending.extend(session.turns[:cut])
+            del session.turns[:cut]
+            if session.folding is None or session.folding.done():
+                session.folding = asyncio.create_task(self._fold(session_id, session))
+        self._resize(session)
+
+    def _resize(self, session: _Session) -> None:
+        old = session.size
+        self._bytes += session.measure() - old
+        while self._bytes > self.max_bytes and self._sessions:
+            self._drop(next(iter(self._sessions)))
+            self._stats["evictions"] += 1
+
+    async def _fold(self, session_id: str, session: _Session) -> None:
+        """Fold pending turns into the summary, one LLM call per turn, oldest first."""
+        while session.pending:
+            question, answer = session.pending[0]
+            session.summary = await self._summarize(session.summary, question, answer, session_id)
+            session.pending.pop(0)
+            if self._sessions.get(session_id) is session:
+                self._resize(session)
+
+    async def _summarize(self, summary: str, question: str, answer: str, session_id: str) -> str:
+        max_tokens = settings.session_summary_max_tokens
+        max_turn = settings.session_turn_max_tokens
+        turn = f"User: {clip_tokens(question, max_turn)}\nAssistant: {clip_tokens(answer, max_turn)}"
+        try:
+            msg = await asyncio.wait_for(
+                llm_pool.ainvoke(
+                    "summary",
+                    [
+                        SystemMessage(content=_SUMMARY_SYSTEM.format(max_words=max_tokens * 3 // 4)),
+                        HumanMessage(content=f"Current summary: {summary or '(none)'}\n\nNew turn:\n{turn}"),
+                    ],
+                    config={"run_name": "session_summary", "tags": get_langsmith_tags(session_id=session_id)},
+                ),
+                timeout=settings.invoke_timeout_s,
+            )
+            updated = (msg.content or "").strip()
+            if not updated:
+                raise ValueError("empty summary")
+            self._stats["summaries"] += 1
+        except Exception as e:
+            # Keep the turn in a clipped running transcript rather than losing it
+            self._stats["summary_errors"] += 1
+            logger.warning("session memory: summary failed for %s: %s", session_id, e)
+            updated = f"{summary}\n{turn}".strip()
+            return clip_tokens(updated, max_tokens, keep_end=True)
+        return clip_tokens(updated, max_tokens)
+
+    async def aclose(self) -> None:
+        """Cancel in-flight summary updates (their turns stay pending in memory)."""
+        tasks = [s.folding for s in self._sessions.values() if s.folding is not None and not s.folding.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def export_state(self) -> List[list]:
+        """Live sessions as [session_id, idle_s, summary, turns], least recently used first.
+        Pending turns are exported as recent turns and folded again after restore."""
+        now = time.monotonic()
+        return [
+            [sid, now - s.updated_at, s.summary, [list(t) for t in s.pending + s.turns]]
+            for sid, s in self._sessions.items()
+            if s.updated_at + self.ttl_s > now
+        ]
+
+    def restore_state(self, entries: List[list], age_s: float = 0.0) -> int:
+        """Load export_state() output; idle time keeps counting across the restart."""
+        now = time.monotonic()
+        loaded = 0
+        for sid, idle_s, summary, turns in entries:
+            idle_s = float(idle_s) + age_s
+            if idle_s >= self.ttl_s or sid in self._sessions:
+                continue
+            session = self._sessions[sid] = _Session()
+            session.summary = summary
+            session.turns = [(q, a) for q, a in turns]
+            session.updated_at = now - idle_s
+            self._trim(sid, session)
+            loaded += 1
+        return loaded
+
+    def stats(self) -> dict:
+        return {**self._stats, "sessions": len(self._sessions), "bytes": self._bytes}
+
+
+session_memory = SessionMemory(
+    max_bytes=settings.session_memory_max_bytes,
+    ttl_s=settings.session_memory_ttl_s,
+    max_turns=settings.session_memory_turns,
+)
@@ -0,0 +1,173 @@
+"""Startup timing and background warm-up.
+
+Timing: process start → app import → warm-up steps → ready → first response byte.
+Warm-up: heavy modules (LangChain, LangGraph, MCP) are imported in a worker thread after the port is
+bound, then the runtime (snapshot restore, agent prewarm, MCP session manager) is entered.
+
+    python startup.py --profile   # import-time profile of the app (cumulative and self time)
+"""
+import asyncio
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import AsyncContextManager, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Loaded by the background warm-up, not by `import main` (they pull in LangChain / LangGraph / MCP)
+HEAVY_MODULES = ("orchestrator", "mcp_server", "warm_state")
+
+_T0 = time.monotonic()  # main imports this module first
+_marks: Dict[str, float] = {}
+_imports: Dict[str, float] = {}
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age_s() -> Optional[float]:
+    """Seconds since the process started (Linux /proc); None elsewhere."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_PROCESS_AGE_AT_T0 = _process_age_s()
+
+
+def mark(name: str) -> float:
+    """Record the first occurrence of a startup milestone; returns seconds since import."""
+    return _marks.setdefault(name, round(time.monotonic() - _T0, 4))
+
+
+def report() -> dict:
+    """Milestones in seconds since main was imported, process start → import time, and the
+    background import time of each heavy module."""
+    return {
+        "process_to_import_s": round(_PROCESS_AGE_AT_T0, 3) if _PROCESS_AGE_AT_T0 is not None else None,
+        "marks": dict(_marks),
+        "imports_s": dict(_imports),
+    }
+
+
+class Warmup:
+    """Runs heavy imports and the app runtime in one background task; the runtime context stays
+    entered (in that task) until aclose(). Handlers that need the heavy path await ready()."""
+
+    def __init__(self):
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+
+    def start(self, modules: Sequence[str], runtime: Callable[[], AsyncContextManager]) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(modules, runtime))
+
+    async def _run(self, modules: Sequence[str], runtime: Callable[[], AsyncContextManager]) -> None:
+        try:
+            for name in modules:
+                start = time.monotonic()
+                # Worker thread: the loop keeps serving /health while modules load
+                await asyncio.to_thread(importlib.import_module, name)
+                _imports[name] = round(time.monotonic() - start, 4)
+            mark("imports_done")
+            async with runtime():
+                mark("ready")
+                logger.info("startup: %s", report())
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self.error = e
+            logger.exception("startup warm-up failed")
+        finally:
+            self._ready.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    async def ready(self) -> None:
+        """Wait for warm-up; raises RuntimeError if it failed."""
+        await self._ready.wait()
+        if self.error is not None:
+            raise RuntimeError(f"startup failed: {self.error}")
+
+    async def aclose(self) -> None:
+        """Leave the runtime context (shutdown steps) and wait for the task to finish."""
+        self._stop.set()
+        if self._task is not None:
+            await self._task
+
+
+class FirstByteMiddleware:
+    """ASGI middleware marking the first response start (cold start → first byte)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._seen = False
+
+    async def __call__(self, scope, receive, send):
+        if self._seen or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and not self._seen:
+                self._seen = True
+                mark("first_response_byte")
+            await send(message)
+
+        return await self.app(scope, receive, send_wrapper)
+
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)")
+
+
+def profile_imports(modules: Sequence[str], top: int = 25) -> Tuple[float, List[Tuple[str, float, float]]]:
+    """Import modules in a fresh interpreter with -X importtime. Returns (total_s, [(module, cumulative_s,
+    self_s)]) for the top slowest imports (nested ones included), by cumulative time."""
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, name = match.groups()
+            rows.append((name, int(cumulative_us) / 1e6, int(self_us) / 1e6))
+    total = sum(r[1] for r in rows if r[0] in modules)
+    rows.sort(key=lambda r: -r[1])
+    return total, rows[:top]
+
+
+def _print_profile(top: int) -> None:
+    fast = ("main",)
+    full = fast + HEAVY_MODULES
+    for label, modules in (("port-bind path (import main)", fast), ("full app (main + warm-up imports)", full)):
+        total, rows = profile_imports(modules, top)
+        print(f"{label}: {total:.3f}s")
+        print(f"  {'cumulative':>10} {'self':>8}  module")
+        for name, cumulative, self_s in rows:
+            print(f"  {cumulative:>10.3f} {self_s:>8.3f}  {name}")
+        print()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup profiling for the orchestrator app.")
+    parser.add_argument("--profile", action="store_true", help="print an import-time profile")
+    parser.add_argument("--top", type=int, default=25, help="modules to list per profile")
+    args = parser.parse_args()
+    if args.profile:
+        _print_profile(args.top)
+    else:
+        parser.print_help()
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import orchestrator
+from admission import AdmissionController, AdmissionRejected
+from config import settings
+
+
+@pytest.mark.asyncio
+async def test_cancel_while_queued_releases_ticket():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, max_queue_per_session=2)
+    holder = controller.enqueue("a")
+    waiter = controller.enqueue("b")
+
+    async def wait():
+        async for _ in controller.wait_events(waiter):
+            pass
+
+    task = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    controller.release(waiter)  # what the flight's on_done does
+    assert controller.stats()["queued_now"] == 0
+
+    controller.release(holder)
+    controller.release(holder)  # idempotent
+    assert controller.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_limits():
+    controller = AdmissionController(max_in_flight=1, max_queue=2, max_queue_per_session=1)
+    controller.enqueue("a")
+    controller.enqueue("b")
+    with pytest.raises(AdmissionRejected) as session_share:
+        controller.enqueue("b")
+    assert session_share.value.status_code == 429
+    controller.enqueue("c")
+    with pytest.raises(AdmissionRejected) as full:
+        controller.enqueue("d")
+    assert full.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_waiters_admitted_round_robin_across_sessions():
+    controller = AdmissionController(max_in_flight=1, max_queue=8, max_queue_per_session=4)
+    holder = controller.enqueue("x")
+    a1, a2, b1 = controller.enqueue("a"), controller.enqueue("a"), controller.enqueue("b")
+    controller.release(holder)
+    assert a1.admitted and not b1.admitted
+    controller.release(a1)
+    assert b1.admitted and not a2.admitted
+
+
+@pytest.mark.asyncio
+async def test_queued_stream_sends_request_id_first(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=4, max_queue_per_session=2)
+    monkeypatch.setattr(orchestrator, "admission", controller)
+    monkeypatch.setattr(settings, "admission_queue_event_s", 0.01)
+    holder = controller.enqueue("other")
+    ticket = controller.enqueue("s1")
+
+    async def pipeline():
+        yield {"type": "request_id", "session_id": "s1", "request_id": "r1"}
+        yield {"type": "answer", "text": "ok"}
+
+    events = orchestrator._admitted(ticket, pipeline(), "r1", "s1")
+    first = await events.__anext__()
+    queued = await events.__anext__()
+    controller.release(holder)
+    rest = [event async for event in events]
+    assert first == {"type": "request_id", "session_id": "s1", "request_id": "r1"}
+    assert queued["phase"] == "queued"
+    assert [e["type"] for e in rest if e.get("phase") != "queued"] == ["answer"]
+
+
+@pytest.mark.asyncio
+async def test_closing_unstarted_stream_frees_its_slot(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=4, max_queue_per_session=2)
+    monkeypatch.setattr(orchestrator, "admission", controller)
+
+    async def pipeline(query, **_kwargs):
+        yield {"type": "answer", "text": query}
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(orchestrator, "stream_answer_query", pipeline)
+    stream = orchestrator.coalesced_answer_query("what is your visa status", session_id="s1", admit=True)
+    assert controller.stats()["in_flight"] == 1
+    stream.close()  # e.g. the client disconnected before the response started
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert controller.stats()["in_flight"] == 0
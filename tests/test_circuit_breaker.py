@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from config import settings
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the breaker module."""
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(settings, "breaker_enabled", True)
+    monkeypatch.setattr(settings, "breaker_window", 4)
+    monkeypatch.setattr(settings, "breaker_min_calls", 2)
+    monkeypatch.setattr(settings, "breaker_error_rate", 0.5)
+    monkeypatch.setattr(settings, "breaker_open_s", 30.0)
+    monkeypatch.setattr(settings, "breaker_half_open_probes", 1)
+    return now
+
+
+async def _call(breaker, fail=False):
+    async with breaker.guard():
+        if fail:
+            raise ConnectionError("down")
+
+
+async def _trip(breaker):
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await _call(breaker, fail=True)
+
+
+@pytest.mark.asyncio
+async def test_opens_at_error_rate_and_fails_fast(clock):
+    breaker = CircuitBreaker("rag")
+    await _call(breaker)
+    with pytest.raises(ConnectionError):
+        await _call(breaker, fail=True)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        await _call(breaker)
+    assert breaker.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("rag")
+    await _trip(breaker)
+    clock[0] += 31
+    assert not breaker.is_open and breaker.state == HALF_OPEN
+    await _call(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["recoveries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("rag")
+    await _trip(breaker)
+    clock[0] += 31
+    with pytest.raises(ConnectionError):
+        await _call(breaker, fail=True)
+    assert breaker.state == OPEN and breaker.stats()["trips"] == 2
+
+
+@pytest.mark.asyncio
+async def test_half_open_allows_only_the_probe_slots(clock):
+    breaker = CircuitBreaker("rag")
+    await _trip(breaker)
+    clock[0] += 31
+    probe_started, finish = asyncio.Event(), asyncio.Event()
+
+    async def probe():
+        async with breaker.guard():
+            probe_started.set()
+            await finish.wait()
+
+    task = asyncio.create_task(probe())
+    await probe_started.wait()
+    with pytest.raises(CircuitOpen):
+        await _call(breaker)
+    finish.set()
+    await task
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker("rag")
+    await _trip(breaker)
+    clock[0] += 31
+    started = asyncio.Event()
+
+    async def probe():
+        async with breaker.guard():
+            started.set()
+            await asyncio.sleep(5)
+
+    task = asyncio.create_task(probe())
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker.state == HALF_OPEN and not breaker.is_open
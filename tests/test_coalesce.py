@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from coalesce import Coalescer
+
+
+def _source(events, gate: asyncio.Event, log: list):
+    async def gen():
+        try:
+            for event in events:
+                yield event
+                await gate.wait()
+        finally:
+            log.append("closed")
+
+    return gen()
+
+
+@pytest.mark.asyncio
+async def test_follower_replays_and_shares_one_source():
+    coalescer, gate, log = Coalescer(), asyncio.Event(), []
+    leader = coalescer.start("q", _source([{"n": 1}, {"n": 2}], gate, log))
+    assert await leader.__anext__() == {"n": 1}
+    follower = coalescer.join("q", lambda e: {**e, "follower": True})
+    gate.set()
+    assert [e async for e in follower] == [{"n": 1, "follower": True}, {"n": 2, "follower": True}]
+    assert [e async for e in leader] == [{"n": 2}]
+    assert coalescer.stats()["followers"] == 1 and log == ["closed"]
+
+
+@pytest.mark.asyncio
+async def test_follower_detach_keeps_flight_running():
+    coalescer, gate, log = Coalescer(), asyncio.Event(), []
+    done = []
+    leader = coalescer.start("q", _source([{"n": 1}, {"n": 2}], gate, log), on_done=lambda: done.append(True))
+    follower = coalescer.join("q")
+    assert await follower.__anext__() == {"n": 1}
+    follower.close()
+    follower.close()  # idempotent
+    gate.set()
+    assert [e async for e in leader] == [{"n": 1}, {"n": 2}]
+    await asyncio.sleep(0)
+    assert done == [True] and coalescer.join("q") is None
+
+
+@pytest.mark.asyncio
+async def test_last_subscriber_leaving_cancels_source():
+    coalescer, gate, log = Coalescer(), asyncio.Event(), []
+    done = []
+    leader = coalescer.start("q", _source([{"n": 1}, {"n": 2}], gate, log), on_done=lambda: done.append(True))
+    follower = coalescer.join("q")
+    assert await leader.__anext__() == {"n": 1}
+    leader.close()
+    assert not log and coalescer.stats()["in_flight"] == 1  # the follower still holds it
+    follower.close()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert log == ["closed"] and done == [True]
+    assert coalescer.stats()["in_flight"] == 0
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from hedge import Hedger
+
+
+@pytest.fixture
+def hedger(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_min_samples", 1)
+    monkeypatch.setattr(settings, "hedge_budget_per_min", 10)
+    h = Hedger()
+    h._stage("llm").samples.append(0.01)  # threshold: 10 ms
+    return h
+
+
+def _calls(primary_s: float, hedge_s: float, started: list):
+    async def make_call(is_hedge):
+        started.append(is_hedge)
+        await asyncio.sleep(hedge_s if is_hedge else primary_s)
+        return "hedge" if is_hedge else "primary"
+
+    return make_call
+
+
+@pytest.mark.asyncio
+async def test_fast_call_is_not_hedged(hedger):
+    started = []
+    assert await hedger.call("llm", _calls(0.0, 0.0, started)) == "primary"
+    assert started == [False]
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_loses_to_hedge(hedger):
+    started = []
+    assert await hedger.call("llm", _calls(5.0, 0.0, started)) == "hedge"
+    assert started == [False, True]
+    assert hedger.stats()["llm"]["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_caps_hedges(hedger, monkeypatch):
+    monkeypatch.setattr(settings, "hedge_budget_per_min", 0)
+    started = []
+    assert await hedger.call("llm", _calls(0.05, 0.0, started)) == "primary"
+    assert started == [False]
+    assert hedger.stats()["llm"]["budget_skips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_committed_primary_drops_the_hedge(hedger):
+    committed = asyncio.Event()
+    hedge_cancelled = []
+
+    async def make_call(is_hedge):
+        if is_hedge:
+            try:
+                await asyncio.sleep(5.0)
+            except asyncio.CancelledError:
+                hedge_cancelled.append(True)
+                raise
+        await asyncio.sleep(0.03)
+        committed.set()  # first streamed token
+        await asyncio.sleep(0.02)
+        return "primary"
+
+    assert await hedger.call("llm", make_call, committed) == "primary"
+    assert hedge_cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_cancelling_caller_cancels_both_calls(hedger):
+    cancelled = []
+
+    async def make_call(is_hedge):
+        try:
+            await asyncio.sleep(5.0)
+        except asyncio.CancelledError:
+            cancelled.append(is_hedge)
+            raise
+
+    task = asyncio.create_task(hedger.call("llm", make_call))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+    assert sorted(cancelled) == [False, True]
@@ -0,0 +1,23 @@
+import pytest
+
+from intent_gate import classify_smalltalk
+from utils import normalize_question
+
+
+def _classify(message):
+    return classify_smalltalk(normalize_question(message), question_mark="?" in message)[0]
+
+
+@pytest.mark.parametrize("message", ["hi", "hey there!", "How are you?", "good morning taixing"])
+def test_greetings_are_smalltalk(message):
+    assert _classify(message) is True
+
+
+@pytest.mark.parametrize("message", ["what's your visa status", "hi, what do you do", "hi can you code", "hi ok?"])
+def test_questions_are_decided_locally(message):
+    assert _classify(message) is False
+
+
+@pytest.mark.parametrize("message", ["hi i am john", "you are awesome", "good morning to you"])
+def test_no_needs_positive_evidence(message):
+    assert _classify(message) is None
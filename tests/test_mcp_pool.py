@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from mcp_pool import MCPSessionPool, _PooledSession
+
+
+class _StubSession:
+    def __init__(self, ping_s: float = 0.0, call_s: float = 0.0):
+        self.ping_s = ping_s
+        self.call_s = call_s
+
+    async def send_ping(self):
+        await asyncio.sleep(self.ping_s)
+
+    async def call_tool(self, name, args, read_timeout_seconds=None):
+        await asyncio.sleep(self.call_s)
+        return f"{name}:{args}"
+
+
+def _pool(session: _StubSession, *, max_in_flight: int = 1, health_check_s: float = 60.0) -> MCPSessionPool:
+    pool = MCPSessionPool(
+        "rag", "http://rag/mcp", max_sessions=1, max_in_flight=max_in_flight, idle_ttl_s=300,
+        health_check_s=health_check_s, max_connections=1, timeout_s=5,
+    )
+    ps = _PooledSession(pool.url, None)
+    ps.session = session
+    pool._sessions.append(ps)
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_call_releases_slot():
+    pool = _pool(_StubSession())
+    assert await pool.call_tool("search", {"q": 1}) == "search:{'q': 1}"
+    assert pool.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_during_health_ping_releases_slot():
+    pool = _pool(_StubSession(ping_s=10), health_check_s=0)
+    pool._sessions[0].last_checked = time.monotonic() - 1
+    task = asyncio.create_task(pool.call_tool("search", {}))
+    await asyncio.sleep(0.01)
+    assert pool.stats()["in_flight"] == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert pool.stats()["in_flight"] == 0
+    # The single slot is usable again
+    pool._sessions[0].session.ping_s = 0
+    assert await asyncio.wait_for(pool.call_tool("search", {}), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_cancel_during_call_wakes_waiter():
+    pool = _pool(_StubSession(call_s=10))
+    first = asyncio.create_task(pool.call_tool("search", {"n": 1}))
+    await asyncio.sleep(0.01)
+    pool._sessions[0].session.call_s = 0
+    second = asyncio.create_task(pool.call_tool("search", {"n": 2}))
+    await asyncio.sleep(0.01)
+    assert pool.stats()["waits"] == 1 and not second.done()
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await asyncio.wait_for(second, timeout=1) == "search:{'n': 2}"
+    assert pool.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_ping_retires_session_and_counts():
+    class _Dead(_StubSession):
+        async def send_ping(self):
+            raise ConnectionError("gone")
+
+    pool = _pool(_Dead(), health_check_s=0)
+    pool._sessions[0].last_checked = time.monotonic() - 1
+
+    async def _open():
+        ps = _PooledSession(pool.url, None)
+        ps.session = _StubSession()
+        pool._creating -= 1
+        ps.in_flight = 1
+        pool._sessions.append(ps)
+        return ps
+
+    pool._open = _open
+    await pool.call_tool("search", {})
+    stats = pool.stats()
+    assert stats["health_failures"] == 1 and stats["evicted"] == 1 and stats["in_flight"] == 0
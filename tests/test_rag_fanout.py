@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from langchain_core.tools import StructuredTool
+
+from config import settings
+from deadline import Deadline
+from rag_fanout import fanout_tool
+
+
+def _shard(text: str, delay_s: float = 0.0) -> StructuredTool:
+    async def search(query: str) -> str:
+        await asyncio.sleep(delay_s)
+        return text
+
+    return StructuredTool.from_function(coroutine=search, name="search", description="Search the knowledge base")
+
+
+def _call(tool, deadline):
+    call = {"name": "search", "args": {"query": "visa"}, "id": "call_1", "type": "tool_call"}
+    return tool.ainvoke(call, config={"configurable": {"deadline": deadline}})
+
+
+@pytest.mark.asyncio
+async def test_all_shards_answer():
+    deadline = Deadline(30)
+    msg = await _call(fanout_tool("search", {"a": _shard("visa: H-1B"), "b": _shard("skills: Python")}), deadline)
+    assert "[a] visa: H-1B" in msg.content and "[b] skills: Python" in msg.content
+    assert msg.artifact == {"missing_shards": []}
+    assert deadline.degraded == []
+
+
+@pytest.mark.asyncio
+async def test_slow_shard_marks_result_partial(monkeypatch):
+    monkeypatch.setattr(settings, "rag_shard_timeout_s", 0.05)
+    deadline = Deadline(30)
+    msg = await _call(fanout_tool("search", {"a": _shard("visa: H-1B"), "b": _shard("late", delay_s=1)}), deadline)
+    assert "visa: H-1B" in msg.content and "late" not in msg.content
+    assert msg.artifact == {"missing_shards": ["b"]}
+    assert deadline.degraded == ["rag_shards"]
@@ -0,0 +1,28 @@
+import pytest
+
+import warm_state
+from config import settings
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "warm_state_path", str(tmp_path / "warm.jsonl.gz"))
+    monkeypatch.setattr(warm_state, "_stats", {**warm_state._stats, "restored": {}, "skipped": []})
+    return warm_state._stats
+
+
+@pytest.mark.asyncio
+async def test_same_app_version_restores_every_section(snapshot):
+    await warm_state.save_snapshot()
+    assert await warm_state.load_snapshot()
+    assert set(warm_state._stats["restored"]) == set(warm_state._SECTIONS)
+    assert warm_state._stats["skipped"] == []
+
+
+@pytest.mark.asyncio
+async def test_new_app_version_drops_answers_and_gate_decisions(snapshot, monkeypatch):
+    await warm_state.save_snapshot()
+    monkeypatch.setattr(settings, "app_version", settings.app_version + "-next")
+    assert await warm_state.load_snapshot()
+    assert sorted(warm_state._stats["skipped"]) == ["answer_cache", "intent_gate"]
+    assert set(warm_state._stats["restored"]) == set(warm_state._SECTIONS) - {"answer_cache", "intent_gate"}
@@ -0,0 +1,118 @@
+"""Tool-result cache for MCP tool calls (keyed on tool name + canonical args, byte-bounded LRU + TTL)."""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import parse_pairs, settings
+
+# Injected per-request context; never part of the cache key
+CONTEXT_ARGS = frozenset(["request_id", "session_id"])
+
+
+def tool_cache_key(name: str, args: Dict[str, Any]) -> str:
+    """Tool name + canonical JSON of args (sorted keys, context args removed)."""
+    canonical = {k: v for k, v in (args or {}).items() if k not in CONTEXT_ARGS}
+    blob = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{name}:{hashlib.sha256(blob.encode()).hexdigest()}"
+
+
+class ToolResultCache:
+    """LRU bounded by total approximate result bytes; each entry carries its own expiry."""
+
+    def __init__(self, max_bytes: int, default_ttl_s: float, tool_ttls: Dict[str, float], only_tools: frozenset):
+        self.max_bytes = max_bytes
+        self.default_ttl_s = default_ttl_s
+        self.tool_ttls = tool_ttls
+        self.only_tools = only_tools
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "request_hits": 0, "stores": 0, "evictions": 0, "skipped": 0}
+
+    def ttl_for(self, name: str) -> float:
+        """TTL for a tool; 0 when the tool is opted out (or not in the opt-in list)."""
+        if self.only_tools and name not in self.only_tools:
+            return 0.0
+        return self.tool_ttls.get(name, self.default_ttl_s)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._entries.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                self._drop(key)
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return item[2]
+
+    def put(self, key: str, name: str, value: Any, size: int) -> None:
+        ttl = self.ttl_for(name)
+        if ttl <= 0 or size > self.max_bytes:
+            self._stats["skipped"] += 1
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self._bytes += size
+        self._stats["stores"] += 1
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def record_request_hit(self) -> None:
+        self._stats["request_hits"] += 1
+
+    def invalidate(self) -> int:
+        n = len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+        return n
+
+    def export_state(self, encode: Callable[[Any], Any]) -> List[list]:
+        """Live entries as [key, ttl_remaining_s, size, encode(value)], least recently used first."""
+        now = time.monotonic()
+        return [[k, exp - now, size, encode(v)] for k, (exp, size, v) in self._entries.items() if exp > now]
+
+    def restore_state(self, entries: List[list], decode: Callable[[Any], Any], age_s: float = 0.0) -> int:
+        """Load exported entries (age_s: time since export) within max_bytes. Returns count loaded."""
+        now = time.monotonic()
+        loaded = 0
+        for key, ttl_left, size, value in reversed(entries):
+            if ttl_left - age_s <= 0 or key in self._entries or self._bytes + size > self.max_bytes:
+                continue
+            self._entries[key] = (now + ttl_left - age_s, size, decode(value))
+            self._entries.move_to_end(key, last=False)
+            self._bytes += size
+            loaded += 1
+        return loaded
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = len(self._entries)
+        stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def result_size(content: Any) -> int:
+    """Approximate in-memory size of a tool result (serialized length)."""
+    if isinstance(content, str):
+        return len(content.encode())
+    return len(json.dumps(content, default=str).encode())
+
+
+tool_cache = ToolResultCache(
+    max_bytes=settings.tool_cache_max_bytes,
+    default_ttl_s=settings.tool_cache_ttl_s,
+    # "search=600,profile=0": per-tool TTL in seconds; 0 opts a tool out
+    tool_ttls={name: float(ttl) for name, ttl in parse_pairs(settings.tool_cache_tool_ttls).items()},
+    only_tools=frozenset(t.strip() for t in (settings.tool_cache_tools or "").split(",") if t.strip()),
+)
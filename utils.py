@@ -1,6 +1,17 @@
 """Shared utilities for message/content extraction."""
+import re
+import unicodedata
 from typing import Any, List
 
+_NORMALIZE_RE = re.compile(r"[^\w\s]|_", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    """NFKC + casefold, drop apostrophes and punctuation, collapse whitespace (cache / lookup key).
+    Letters and digits of any script are kept; text with none (emoji, punctuation) normalizes to ""."""
+    text = unicodedata.normalize("NFKC", text or "").casefold().replace("'", "").replace("’", "")
+    return " ".join(_NORMALIZE_RE.sub(" ", text).split())
+
 
 def extract_message_content(msg: Any) -> str:
     """Extract text content from a message (dict or object). Handles str and list content."""
@@ -0,0 +1,157 @@
+"""Warm-state snapshot: persist tool schemas and in-memory caches across scale-to-zero restarts.
+
+The snapshot is a gzip JSON-lines file, one line per section (header first). It is written
+atomically on shutdown and every WARM_STATE_SAVE_INTERVAL_S, and loaded section by section at
+startup before the first request is accepted. Cache TTLs keep counting while the machine is stopped.
+Sections in _VERSIONED are only restored from a snapshot of the same APP_VERSION (a deploy can change
+the prompts and code that produced them).
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from agent_graph import agent_registry
+from answer_cache import answer_cache
+from config import settings
+from intent_gate import export_decisions, restore_decisions
+from session_memory import session_memory
+from tool_cache import tool_cache
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def _decode_tool_message(value: dict) -> Any:
+    return messages_from_dict([value])[0]
+
+
+# name → (export, restore(data, age_s) -> entries loaded)
+_SECTIONS: Dict[str, Tuple[Callable[[], Any], Callable[[Any, float], int]]] = {
+    "agents": (agent_registry.export_state, lambda data, _age: agent_registry.restore_state(data)),
+    "answer_cache": (answer_cache.export_state, answer_cache.restore_state),
+    "tool_cache": (
+        lambda: tool_cache.export_state(message_to_dict),
+        lambda data, age: tool_cache.restore_state(data, _decode_tool_message, age),
+    ),
+    "intent_gate": (export_decisions, lambda data, _age: restore_decisions(data)),
+    "sessions": (session_memory.export_state, session_memory.restore_state),
+}
+# Produced by prompts/code that a new APP_VERSION may change: stale answers or gate decisions otherwise
+_VERSIONED = frozenset(["answer_cache", "intent_gate"])
+
+_stats: Dict[str, Any] = {"loaded": False, "load_s": None, "snapshot_age_s": None, "restored": {}, "skipped": [],
+                          "saves": 0, "save_errors": 0, "last_save_s": None, "bytes": 0}
+_saver: Optional[asyncio.Task] = None
+
+
+def _write(path: str, lines: List[str]) -> int:
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=3) as f:
+        for line in lines:
+            f.write(line + "\n")
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _read(path: str) -> List[str]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.readlines()
+
+
+async def save_snapshot() -> Optional[int]:
+    """Write the snapshot (sections exported on the loop, file written in a thread). Returns bytes written."""
+    path = settings.warm_state_path
+    if not path:
+        return None
+    start = time.perf_counter()
+    header = {"version": FORMAT_VERSION, "app_version": settings.app_version, "saved_at": time.time()}
+    lines = [json.dumps(header)]
+    for name, (export, _) in _SECTIONS.items():
+        lines.append(json.dumps({"section": name, "data": export()}, separators=(",", ":"), default=str))
+    try:
+        size = await asyncio.to_thread(_write, path, lines)
+    except (OSError, TypeError, ValueError) as e:
+        _stats["save_errors"] += 1
+        logger.warning("warm state: save to %s failed: %s", path, e)
+        return None
+    _stats["saves"] += 1
+    _stats["bytes"] = size
+    _stats["last_save_s"] = round(time.perf_counter() - start, 4)
+    return size
+
+
+async def load_snapshot() -> bool:
+    """Restore sections from the snapshot if present, compatible and not older than WARM_STATE_MAX_AGE_S.
+    Sections load one at a time, yielding to the loop in between; a bad section is skipped."""
+    path = settings.warm_state_path
+    if not path or not os.path.exists(path):
+        return False
+    start = time.perf_counter()
+    try:
+        lines = await asyncio.to_thread(_read, path)
+        header = json.loads(lines[0])
+    except (OSError, EOFError, ValueError, IndexError) as e:
+        logger.warning("warm state: unreadable snapshot %s: %s", path, e)
+        return False
+    age_s = max(0.0, time.time() - float(header.get("saved_at", 0)))
+    if header.get("version") != FORMAT_VERSION or age_s > settings.warm_state_max_age_s:
+        logger.info("warm state: ignoring snapshot (version=%s age=%.0fs)", header.get("version"), age_s)
+        return False
+    same_app = header.get("app_version") == settings.app_version
+    for line in lines[1:]:
+        try:
+            item = json.loads(line)
+            name = item["section"]
+            if name in _VERSIONED and not same_app:
+                _stats["skipped"].append(name)
+            elif name in _SECTIONS:
+                _stats["restored"][name] = _SECTIONS[name][1](item["data"], age_s)
+        except Exception as e:
+            logger.warning("warm state: skipped a snapshot section: %s", e)
+        await asyncio.sleep(0)
+    _stats["loaded"] = True
+    _stats["snapshot_age_s"] = round(age_s, 1)
+    _stats["load_s"] = round(time.perf_counter() - start, 4)
+    if not same_app:
+        logger.info(
+            "warm state: snapshot from app_version=%s; skipped %s", header.get("app_version"), _stats["skipped"]
+        )
+    logger.info("warm state: restored %s in %.3fs", _stats["restored"], _stats["load_s"])
+    return True
+
+
+async def _save_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.warm_state_save_interval_s)
+        await save_snapshot()
+
+
+def start_saver() -> None:
+    """Start periodic snapshots (WARM_STATE_SAVE_INTERVAL_S > 0)."""
+    global _saver
+    if _saver is None and settings.warm_state_path and settings.warm_state_save_interval_s > 0:
+        _saver = asyncio.create_task(_save_periodically())
+
+
+async def aclose() -> None:
+    """Stop periodic snapshots and write a final one."""
+    global _saver
+    if _saver is not None:
+        _saver.cancel()
+        try:
+            await _saver
+        except asyncio.CancelledError:
+            pass
+        _saver = None
+    await save_snapshot()
+
+
+def get_warm_state_stats() -> dict:
+    return dict(_stats)